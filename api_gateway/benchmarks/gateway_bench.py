@@ -0,0 +1,252 @@
+"""
+Gateway benchmark harness.
+
+Starts in-process stub upstreams with a configurable latency and payload
+size, points every gateway upstream at them and drives the gateway at a fixed
+concurrency. Each scenario is also run directly against the stubs, so the
+reported overhead is what the gateway adds on top of the upstream itself.
+
+Run from the api_gateway directory:
+
+    python -m benchmarks.gateway_bench --output before.json
+    python -m benchmarks.gateway_bench --output after.json --compare before.json
+
+The JSON output has a stable shape (meta + one entry per scenario) and records
+the commit it was produced on, so runs from different commits can be diffed.
+Load generator, gateway and stubs share one event loop and CPU, so absolute
+numbers are only comparable between runs on the same machine.
+"""
+import os
+import sys
+import json
+import math
+import time
+import asyncio
+import logging
+import argparse
+import platform
+import subprocess
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+from unittest.mock import patch
+
+import httpx
+import jwt
+
+from core.app import create_app
+from core.balancer import LoadBalancer, balancers
+from core.cache import ResponseCache
+from core.routes import register_routes
+from core.config import UPSTREAMS, CACHE_TTLS, JWT_SECRET_KEY, JWT_ALGORITHM
+from .stubs import LocalServer, create_stub_app
+
+PERCENTILES = (50, 95, 99)
+
+@dataclass
+class Scenario:
+    """One kind of request sent to the gateway over and over"""
+    name: str
+    method: str
+    path: Callable[[int], str]
+    body: Optional[Callable[[], object]] = None
+    user_id: Optional[int] = 1
+    concurrency: Optional[int] = None
+    warmup: int = 0
+    uncached_upstreams: set = field(default_factory=set)
+
+def _upload_body(size: int, chunk_size: int = 64 * 1024):
+    async def chunks():
+        sent = 0
+        while sent < size:
+            n = min(chunk_size, size - sent)
+            sent += n
+            yield b"\0" * n
+    return chunks
+
+def build_scenarios(upload_size: int, upload_concurrency: int) -> list:
+    return [
+        # Public route, no auth, cache or coalescing involved
+        Scenario("auth_login", "POST", lambda i: "/auth/login",
+                 body=lambda: b'{"email": "bench@example.com", "password": "secret"}', user_id=None),
+        # Every request is distinct: plain authenticated proxying
+        Scenario("chat_history_uncached", "GET", lambda i: f"/chat/history/1?n={i}"),
+        # Same URL for the same user: served from the response cache
+        Scenario("chat_history_cached", "GET", lambda i: "/chat/history/1", warmup=1),
+        # Same URL with the cache off: concurrent requests share upstream calls
+        Scenario("chat_history_coalesced", "GET", lambda i: "/chat/history/1", uncached_upstreams={"chat"}),
+        Scenario("chat_message", "POST", lambda i: "/chat/message",
+                 body=lambda: b'{"user_id": 1, "message": "hello"}'),
+        # Large body piped through the streaming proxy path
+        Scenario("video_upload_stream", "POST", lambda i: "/video/analyze",
+                 body=_upload_body(upload_size), concurrency=upload_concurrency),
+    ]
+
+def create_gateway():
+    app = create_app()
+    register_routes(app)
+    return app
+
+def make_token(user_id: int) -> str:
+    claims = {"user_id": user_id, "roles": ["user"], "exp": int(time.time()) + 3600}
+    return jwt.encode(claims, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
+
+def percentile(samples: list, pct: float) -> float:
+    """Nearest-rank percentile of already sorted samples"""
+    if not samples:
+        return 0.0
+    rank = max(0, min(len(samples) - 1, math.ceil(pct / 100 * len(samples)) - 1))
+    return samples[rank]
+
+async def drive(client: httpx.AsyncClient, base_url: str, scenario: Scenario, requests: int, concurrency: int) -> dict:
+    """Send `requests` requests with `concurrency` workers and summarise latencies"""
+    headers = {"Authorization": f"Bearer {make_token(scenario.user_id)}"} if scenario.user_id else {}
+    for i in range(scenario.warmup):
+        await client.request(scenario.method, base_url + scenario.path(-1 - i), headers=headers,
+                             content=scenario.body() if scenario.body else None)
+
+    latencies = []
+    statuses = {}
+    counter = iter(range(requests))
+
+    async def worker():
+        for i in counter:
+            content = scenario.body() if scenario.body else None
+            start = time.perf_counter()
+            try:
+                resp = await client.request(scenario.method, base_url + scenario.path(i), headers=headers, content=content)
+                status = str(resp.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    errors = sum(n for status, n in statuses.items() if not status.startswith("2"))
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "statuses": dict(sorted(statuses.items())),
+        "throughput_rps": round(requests / elapsed, 1),
+        "latency_ms": {f"p{p}": round(percentile(latencies, p) * 1000, 3) for p in PERCENTILES},
+    }
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def run_benchmark(requests: int = 2000, concurrency: int = 32, latency: float = 0.02,
+                        payload_size: int = 4096, upload_size: int = 8 * 1024 * 1024,
+                        upload_requests: int = 50, upload_concurrency: int = 2,
+                        scenarios: Optional[list] = None) -> dict:
+    """Run the selected scenarios against stubs and the gateway and return the report"""
+    selected = [s for s in build_scenarios(upload_size, upload_concurrency) if not scenarios or s.name in scenarios]
+    stub_app = create_stub_app(latency, payload_size)
+    results = {}
+
+    async with LocalServer(stub_app) as stub:
+        stub_balancers = {name: LoadBalancer(name, [stub.url]) for name in UPSTREAMS}
+        with patch.dict(balancers, stub_balancers):
+            async with LocalServer(create_gateway()) as gateway:
+                limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+                async with httpx.AsyncClient(timeout=60, limits=limits) as client:
+                    for scenario in selected:
+                        n = upload_requests if scenario.name == "video_upload_stream" else requests
+                        workers = scenario.concurrency or concurrency
+                        direct = await drive(client, stub.url, scenario, n, workers)
+                        with patch("core.utils.response_cache", ResponseCache(max_entries=4096)), \
+                                patch.dict(CACHE_TTLS, {}):
+                            for name in scenario.uncached_upstreams:
+                                CACHE_TTLS.pop(name, None)
+                            proxied = await drive(client, gateway.url, scenario, n, workers)
+                        proxied["direct_latency_ms"] = direct["latency_ms"]
+                        proxied["direct_throughput_rps"] = direct["throughput_rps"]
+                        proxied["overhead_ms"] = {
+                            p: round(proxied["latency_ms"][p] - direct["latency_ms"][p], 3) for p in proxied["latency_ms"]
+                        }
+                        results[scenario.name] = proxied
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {
+                "requests": requests,
+                "concurrency": concurrency,
+                "upstream_latency_ms": latency * 1000,
+                "payload_bytes": payload_size,
+                "upload_bytes": upload_size,
+                "upload_requests": upload_requests,
+                "upload_concurrency": upload_concurrency,
+            },
+        },
+        "results": results,
+    }
+
+def compare(current: dict, baseline: dict) -> str:
+    """Human readable diff of two reports, scenario by scenario"""
+    lines = [f"baseline {baseline['meta'].get('commit')} -> current {current['meta'].get('commit')}"]
+    if baseline["meta"]["config"] != current["meta"]["config"]:
+        lines.append("warning: the runs used different configurations")
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            lines.append(f"{name}: new scenario")
+            continue
+        rps = result["throughput_rps"] - before["throughput_rps"]
+        overhead = ", ".join(
+            f"{p} {before['overhead_ms'][p]:.2f}->{result['overhead_ms'][p]:.2f}ms" for p in result["overhead_ms"]
+        )
+        lines.append(f"{name}: {result['throughput_rps']:.1f} rps ({rps:+.1f}), overhead {overhead}")
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the gateway against local stub upstreams")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="stub upstream latency")
+    parser.add_argument("--payload-bytes", type=int, default=4096, help="stub response size")
+    parser.add_argument("--upload-bytes", type=int, default=8 * 1024 * 1024, help="body size of streamed uploads")
+    parser.add_argument("--upload-requests", type=int, default=50)
+    parser.add_argument("--upload-concurrency", type=int, default=2)
+    parser.add_argument("--scenario", action="append", dest="scenarios", help="run only this scenario (repeatable)")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="JSON report of an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO)
+    report = asyncio.run(run_benchmark(
+        requests=args.requests,
+        concurrency=args.concurrency,
+        latency=args.latency_ms / 1000,
+        payload_size=args.payload_bytes,
+        upload_size=args.upload_bytes,
+        upload_requests=args.upload_requests,
+        upload_concurrency=args.upload_concurrency,
+        scenarios=args.scenarios,
+    ))
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare(report, json.load(f)), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import asyncio
+import socket
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def create_stub_app(latency: float, payload_size: int) -> Starlette:
+    """
+    Stand-in for a Serene service: drains the request body, waits `latency`
+    seconds and answers with `payload_size` bytes, whatever the path.
+    """
+    payload = b"x" * payload_size
+
+    async def handle(request: Request):
+        async for _ in request.stream():
+            pass
+        if request.url.path == "/":
+            return Response(b'{"message": "stub"}', media_type="application/json")
+        await asyncio.sleep(latency)
+        return Response(payload, media_type="application/octet-stream")
+
+    return Starlette(routes=[Route("/{path:path}", handle, methods=["GET", "POST", "PUT", "DELETE", "PATCH"])])
+
+class LocalServer:
+    """Runs an ASGI app with uvicorn as a task on the current event loop"""
+
+    def __init__(self, app, port: int = None):
+        self.port = port or free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._server = uvicorn.Server(uvicorn.Config(
+            app, host="127.0.0.1", port=self.port, log_level="warning", access_log=False,
+        ))
+        self._task = None
+
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self._server.serve())
+        while not self._server.started:
+            if self._task.done():
+                self._task.result()
+            await asyncio.sleep(0.01)
+        return self
+
+    async def __aexit__(self, *exc):
+        self._server.should_exit = True
+        await self._task
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+from collections import deque
+
+from .config import UPSTREAMS, ADMISSION_MAX_QUEUE_WAIT
+from .metrics import UPSTREAM_IN_FLIGHT, UPSTREAM_QUEUE_DEPTH, UPSTREAM_SHED
+
+logger = logging.getLogger(__name__)
+
+class AdmissionController:
+    """
+    Concurrency limit with a bounded FIFO wait queue for one upstream.
+    A request is shed when the queue is full or when it has waited longer
+    than max_queue_wait for a slot, so a burst on one upstream cannot tie
+    up the gateway for every other route.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, max_queue_wait: float):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_queue_wait = max_queue_wait
+        self.in_flight = 0
+        self._waiters = deque()
+
+        UPSTREAM_IN_FLIGHT.labels(name).set_function(lambda: self.in_flight)
+        UPSTREAM_QUEUE_DEPTH.labels(name).set_function(lambda: self.queue_depth)
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> bool:
+        """Wait for a slot; returns False if the request was shed"""
+        if self.in_flight < self.max_concurrency and not self._waiters:
+            self.in_flight += 1
+            return True
+
+        if len(self._waiters) >= self.max_queue:
+            self._shed("queue_full")
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # release() hands its slot straight to the waiter, in_flight is unchanged
+            await asyncio.wait_for(waiter, self.max_queue_wait)
+        except asyncio.TimeoutError:
+            self._shed("queue_timeout")
+            return False
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        return True
+
+    def release(self):
+        """Return a slot, handing it to the oldest waiter if there is one"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self.in_flight -= 1
+
+    def _shed(self, reason: str):
+        logger.warning(
+            f"Shedding request to {self.name} ({reason}): "
+            f"{self.in_flight} in flight, {self.queue_depth} queued"
+        )
+        UPSTREAM_SHED.labels(self.name, reason).inc()
+
+# One admission controller per upstream service, sized by its replica count
+admission_controllers = {
+    name: AdmissionController(
+        name,
+        max_concurrency=config["max_concurrency"] * len(config["urls"]),
+        max_queue=config["max_queue"] * len(config["urls"]),
+        max_queue_wait=ADMISSION_MAX_QUEUE_WAIT,
+    )
+    for name, config in UPSTREAMS.items()
+}
@@ -1,9 +1,30 @@
+import asyncio
+from contextlib import asynccontextmanager, suppress
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from .clients import open_clients, close_clients
+from .breaker import breaker_states
+from .balancer import balancers, run_health_checks
+from .metrics import instrument_app
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Open the pooled upstream clients and start replica health checks on
+    startup; stop them and close the clients on shutdown
+    """
+    await open_clients()
+    health_checks = asyncio.create_task(run_health_checks())
+    yield
+    health_checks.cancel()
+    with suppress(asyncio.CancelledError):
+        await health_checks
+    await close_clients()
+
 def create_app() -> FastAPI:
     """Create and configure the FastAPI application"""
-    app = FastAPI(title="Serene API Gateway")
+    app = FastAPI(title="Serene API Gateway", lifespan=lifespan)
     
     # Add CORS middleware
     app.add_middleware(
@@ -12,6 +33,8 @@ def create_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        # Lets the frontend read the cursor of the next chat history page
+        expose_headers=["X-Next-Cursor"],
     )
     
     # Root endpoint
@@ -19,4 +42,15 @@ def create_app() -> FastAPI:
     def root():
         return {"message": "API Gateway is running"}
     
-    return app
\ No newline at end of file
+    # Circuit breaker and replica state of every upstream
+    @app.get("/gateway/upstreams")
+    def upstream_status():
+        return {
+            name: {**state, "replicas": balancers[name].snapshot()}
+            for name, state in breaker_states().items()
+        }
+    
+    # Prometheus metrics for every route, served on /metrics
+    instrument_app(app)
+    
+    return app
@@ -0,0 +1,141 @@
+import time
+import random
+import asyncio
+import logging
+from typing import Optional
+
+from .config import (
+    UPSTREAMS,
+    LOAD_BALANCING_POLICY,
+    HEALTH_CHECK_INTERVAL,
+    HEALTH_CHECK_TIMEOUT,
+    REPLICA_EJECT_AFTER_FAILURES,
+    REPLICA_EJECT_DURATION,
+)
+from .clients import get_client
+from .metrics import REPLICA_OUTSTANDING, REPLICA_AVAILABLE
+
+logger = logging.getLogger(__name__)
+
+class Replica:
+    """One instance of an upstream service and its live request/health state"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+
+    def available(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+    def snapshot(self, now: float) -> dict:
+        return {
+            "url": self.url,
+            "available": self.available(now),
+            "outstanding": self.outstanding,
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+class LoadBalancer:
+    """
+    Spreads requests for one upstream over its replicas.
+    With the "p2c" policy two random available replicas are compared and the
+    one with fewer outstanding requests wins; "least_outstanding" scans all
+    of them. Replicas that fail health checks or several requests in a row
+    are ejected for eject_duration seconds. If every replica is ejected the
+    balancer fails open and keeps using all of them.
+    """
+
+    def __init__(self, name: str, urls: list, policy: str = "p2c",
+                 eject_after_failures: int = 3, eject_duration: float = 30.0, clock=time.monotonic):
+        self.name = name
+        self.policy = policy
+        self.eject_after_failures = eject_after_failures
+        self.eject_duration = eject_duration
+        self._clock = clock
+        self.replicas = [Replica(url) for url in urls]
+
+        for replica in self.replicas:
+            REPLICA_OUTSTANDING.labels(name, replica.url).set_function(lambda r=replica: r.outstanding)
+            REPLICA_AVAILABLE.labels(name, replica.url).set_function(
+                lambda r=replica: 1 if r.available(self._clock()) else 0
+            )
+
+    def pick(self, exclude: Optional[Replica] = None) -> Replica:
+        """Choose a replica for the next request, avoiding `exclude` when possible"""
+        now = self._clock()
+        candidates = [r for r in self.replicas if r.available(now) and r is not exclude]
+        if not candidates:
+            candidates = [r for r in self.replicas if r is not exclude] or self.replicas
+
+        if len(candidates) == 1:
+            return candidates[0]
+        if self.policy == "least_outstanding":
+            fewest = min(r.outstanding for r in candidates)
+            return random.choice([r for r in candidates if r.outstanding == fewest])
+        first, second = random.sample(candidates, 2)
+        return first if first.outstanding <= second.outstanding else second
+
+    def record_success(self, replica: Replica):
+        replica.consecutive_failures = 0
+
+    def record_failure(self, replica: Replica):
+        replica.consecutive_failures += 1
+        if replica.consecutive_failures >= self.eject_after_failures:
+            self.eject(replica, f"{replica.consecutive_failures} consecutive failures")
+
+    def eject(self, replica: Replica, reason: str):
+        if replica.available(self._clock()):
+            logger.warning(f"Ejecting {self.name} replica {replica.url} for {self.eject_duration}s: {reason}")
+        replica.ejected_until = self._clock() + self.eject_duration
+
+    def restore(self, replica: Replica):
+        if not replica.available(self._clock()):
+            logger.info(f"{self.name} replica {replica.url} passed its health check, restoring")
+        replica.ejected_until = 0.0
+        replica.consecutive_failures = 0
+
+    def snapshot(self) -> list:
+        now = self._clock()
+        return [replica.snapshot(now) for replica in self.replicas]
+
+    async def check_health(self):
+        """Probe the root endpoint of every replica once"""
+        client = get_client(self.name)
+
+        async def probe(replica: Replica):
+            try:
+                resp = await client.get(f"{replica.url}/", timeout=HEALTH_CHECK_TIMEOUT)
+                healthy = resp.status_code < 500
+                reason = f"status {resp.status_code}"
+            except Exception as e:
+                healthy = False
+                reason = str(e) or type(e).__name__
+            if healthy:
+                self.restore(replica)
+            else:
+                self.eject(replica, f"health check failed ({reason})")
+
+        await asyncio.gather(*(probe(replica) for replica in self.replicas))
+
+# One load balancer per upstream service
+balancers = {
+    name: LoadBalancer(
+        name,
+        config["urls"],
+        policy=LOAD_BALANCING_POLICY,
+        eject_after_failures=REPLICA_EJECT_AFTER_FAILURES,
+        eject_duration=REPLICA_EJECT_DURATION,
+    )
+    for name, config in UPSTREAMS.items()
+}
+
+async def run_health_checks(interval: float = HEALTH_CHECK_INTERVAL):
+    """Probe every upstream's replicas forever; started by the app lifespan"""
+    while True:
+        await asyncio.gather(
+            *(balancer.check_health() for balancer in balancers.values()),
+            return_exceptions=True,
+        )
+        await asyncio.sleep(interval)
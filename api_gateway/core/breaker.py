@@ -0,0 +1,120 @@
+import time
+import logging
+
+from .config import (
+    UPSTREAMS,
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_RESET_TIMEOUT,
+    RETRY_BUDGET_RATIO,
+    RETRY_BUDGET_MAX_TOKENS,
+)
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitBreaker:
+    """
+    Tracks consecutive failures of one upstream.
+    Opens after failure_threshold failures so callers fail fast, lets a single
+    probe through once reset_timeout has passed (half-open), and closes again
+    as soon as a request succeeds.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    def allow_request(self) -> bool:
+        """Whether a request may be sent upstream right now"""
+        if self.state == OPEN:
+            if self._clock() - self.opened_at < self.reset_timeout:
+                return False
+            logger.info(f"Circuit for {self.name} half-open, sending probe")
+            self.state = HALF_OPEN
+            self._probe_in_flight = False
+
+        if self.state == HALF_OPEN:
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+
+        return True
+
+    def record_success(self):
+        if self.state != CLOSED:
+            logger.info(f"Circuit for {self.name} closed")
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != OPEN:
+                logger.warning(
+                    f"Circuit for {self.name} opened after {self.consecutive_failures} consecutive failures"
+                )
+            self.state = OPEN
+            self.opened_at = self._clock()
+
+    def release(self):
+        """Give back a half-open probe slot when the request ended without an outcome"""
+        self._probe_in_flight = False
+
+    def retry_after(self) -> float:
+        """Seconds until the breaker lets a probe through"""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (self._clock() - self.opened_at))
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "retry_after": round(self.retry_after(), 3),
+        }
+
+class RetryBudget:
+    """
+    Caps retries to a fraction of regular traffic.
+    Every request deposits `ratio` tokens (up to max_tokens) and every retry
+    withdraws a whole token, so retries stay bounded during an outage.
+    """
+
+    def __init__(self, ratio: float, max_tokens: float):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+
+    def deposit(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_withdraw(self) -> bool:
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+# One breaker and retry budget per upstream service
+breakers = {
+    name: CircuitBreaker(name, BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT)
+    for name in UPSTREAMS
+}
+retry_budgets = {
+    name: RetryBudget(RETRY_BUDGET_RATIO, RETRY_BUDGET_MAX_TOKENS)
+    for name in UPSTREAMS
+}
+
+def breaker_states() -> dict:
+    """Current state of every upstream breaker"""
+    return {name: breaker.snapshot() for name, breaker in breakers.items()}
@@ -0,0 +1,152 @@
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+from fastapi import Request, Response
+
+from .config import CACHE_TTLS, CACHE_MAX_ENTRIES, CACHEABLE_POST_PATHS
+from .metrics import CACHE_ENTRIES, CACHE_HIT_RATIO
+
+logger = logging.getLogger(__name__)
+
+# Methods that never change upstream state
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+@dataclass
+class CachedResponse:
+    status_code: int
+    headers: dict
+    content: bytes
+    etag: str
+    expires_at: float
+
+    def to_response(self, request: Request) -> Response:
+        """Build the client response, answering 304 if the client already has this version"""
+        if _etag_matches(request.headers.get("if-none-match"), self.etag):
+            return Response(status_code=304, headers={"ETag": self.etag})
+        return Response(content=self.content, status_code=self.status_code, headers=self.headers)
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+def request_identity(request: Request) -> Optional[str]:
+    """
+    Identity that scopes cached responses to one user: the verified user id
+    when the gateway authenticated the request, otherwise its credentials.
+    Requests without credentials have no identity and are never cached.
+    """
+    user_id = getattr(request.state, "user_id", None)
+    if user_id is not None:
+        return f"user:{user_id}"
+    authorization = request.headers.get("authorization")
+    if not authorization:
+        return None
+    return hashlib.sha256(authorization.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """
+    In-process LRU cache of upstream responses keyed on user identity plus
+    method, path, query and (for cacheable POSTs) body.
+    Entries expire after their TTL, the least recently used entry is evicted
+    beyond max_entries, and all entries of a user are dropped when that user
+    sends a state-changing request.
+    """
+
+    def __init__(self, max_entries: int, clock=time.monotonic):
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._keys_by_identity = {}
+        # Bumped on invalidation so responses fetched before it are not stored
+        self._generations = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, key) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= self._clock():
+            self._remove(key)
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def generation(self, identity: str) -> int:
+        return self._generations.get(identity, 0)
+
+    def set(self, key, identity: str, generation: int, response: Response, ttl: float) -> Optional[CachedResponse]:
+        """Store a buffered response unless the user's entries were invalidated meanwhile"""
+        if generation != self.generation(identity):
+            return None
+
+        entry = CachedResponse(
+            status_code=response.status_code,
+            headers=dict(response.headers),
+            content=response.body,
+            etag=response.headers.get("etag") or f'"{hashlib.sha256(response.body).hexdigest()[:32]}"',
+            expires_at=self._clock() + ttl,
+        )
+        entry.headers["etag"] = entry.etag
+
+        self._remove(key)
+        self._entries[key] = entry
+        self._keys_by_identity.setdefault(identity, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+        return entry
+
+    def invalidate(self, identity: str):
+        """Drop every cached response belonging to a user"""
+        self._generations[identity] = self.generation(identity) + 1
+        keys = self._keys_by_identity.pop(identity, set())
+        for key in keys:
+            self._entries.pop(key, None)
+        if keys:
+            logger.info(f"Invalidated {len(keys)} cached responses")
+
+    def _remove(self, key):
+        if self._entries.pop(key, None) is None:
+            return
+        identity = key[0]
+        keys = self._keys_by_identity.get(identity)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_identity[identity]
+
+async def cache_key(request: Request, upstream: str, identity: Optional[str]):
+    """Cache key for a request, or None if its response must not be cached"""
+    if identity is None or upstream not in CACHE_TTLS:
+        return None
+
+    path = request.url.path
+    query = tuple(sorted(request.query_params.multi_items()))
+    if request.method == "GET":
+        return (identity, "GET", path, query, None)
+    if request.method == "POST" and path in CACHEABLE_POST_PATHS:
+        body = await request.body()
+        return (identity, "POST", path, query, hashlib.sha256(body).hexdigest())
+    return None
+
+response_cache = ResponseCache(CACHE_MAX_ENTRIES)
+
+CACHE_ENTRIES.set_function(lambda: len(response_cache))
+CACHE_HIT_RATIO.set_function(lambda: response_cache.hit_ratio)
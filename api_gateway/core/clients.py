@@ -0,0 +1,65 @@
+import logging
+import httpx
+
+from .config import (
+    UPSTREAMS,
+    CONNECT_TIMEOUT,
+    MAX_CONNECTIONS,
+    MAX_KEEPALIVE_CONNECTIONS,
+    KEEPALIVE_EXPIRY,
+    HTTP2_ENABLED,
+)
+
+logger = logging.getLogger(__name__)
+
+# One keep-alive client per upstream service, shared by every request
+_clients = {}
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def _build_client(service: str) -> httpx.AsyncClient:
+    """Create a pooled client for an upstream using the limits from config"""
+    http2 = HTTP2_ENABLED and _http2_available()
+    if HTTP2_ENABLED and not http2:
+        logger.warning("HTTP/2 requested but the 'h2' package is not installed; using HTTP/1.1")
+
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(UPSTREAMS[service]["timeout"], connect=CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+        http2=http2,
+    )
+
+def get_client(service: str) -> httpx.AsyncClient:
+    """
+    Return the shared client for an upstream service.
+    Clients are normally opened by the app lifespan; one is created lazily
+    if the lifespan has not run (e.g. when the app is used without startup).
+    """
+    client = _clients.get(service)
+    if client is None or client.is_closed:
+        client = _build_client(service)
+        _clients[service] = client
+    return client
+
+async def open_clients():
+    """Open a pooled client for every configured upstream"""
+    for service in UPSTREAMS:
+        get_client(service)
+    logger.info(f"Opened upstream clients for: {', '.join(UPSTREAMS)}")
+
+async def close_clients():
+    """Close all upstream clients and release their connections"""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
+    logger.info("Closed upstream clients")
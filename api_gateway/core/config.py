@@ -1,6 +1,6 @@
 import os
 
-# Service URLs
+# Service URLs. Each may list several replicas separated by commas.
 AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL", "http://auth-service:8000")
 SENTIMENT_SERVICE_URL = os.getenv("SENTIMENT_SERVICE_URL", "http://sentiment-service:8002")
 CHATBOT_SERVICE_URL = os.getenv("CHATBOT_SERVICE_URL", "http://chatbot-service:8001")
@@ -11,4 +11,78 @@ VIDEO_SERVICE_URL = os.getenv("VIDEO_SERVICE_URL", "http://video_service:8004")
 DEFAULT_TIMEOUT = 10.0
 CHAT_TIMEOUT = 30.0
 VOICE_TIMEOUT = 60.0
-VIDEO_TIMEOUT = 300.0  # 5 minutes
\ No newline at end of file
+VIDEO_TIMEOUT = 300.0  # 5 minutes
+
+# Connection pool settings for the long-lived upstream clients
+CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "5.0"))
+MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30.0"))
+# HTTP/2 is only negotiated over TLS (ALPN); cleartext upstreams keep using HTTP/1.1
+HTTP2_ENABLED = os.getenv("UPSTREAM_HTTP2", "true").lower() == "true"
+
+def _replica_urls(value: str) -> list:
+    return [url.strip().rstrip("/") for url in value.split(",") if url.strip()]
+
+# Upstream services keyed by the name the routes use.
+# max_concurrency caps requests in flight per replica, max_queue caps
+# requests waiting for a slot per replica; anything beyond is shed with a 503.
+UPSTREAMS = {
+    "auth": {"urls": _replica_urls(AUTH_SERVICE_URL), "timeout": DEFAULT_TIMEOUT, "max_concurrency": 64, "max_queue": 128},
+    "sentiment": {"urls": _replica_urls(SENTIMENT_SERVICE_URL), "timeout": DEFAULT_TIMEOUT, "max_concurrency": 32, "max_queue": 64},
+    "chat": {"urls": _replica_urls(CHATBOT_SERVICE_URL), "timeout": CHAT_TIMEOUT, "max_concurrency": 32, "max_queue": 64},
+    "voice": {"urls": _replica_urls(VOICE_SERVICE_URL), "timeout": VOICE_TIMEOUT, "max_concurrency": 4, "max_queue": 8},
+    "video": {"urls": _replica_urls(VIDEO_SERVICE_URL), "timeout": VIDEO_TIMEOUT, "max_concurrency": 2, "max_queue": 4},
+}
+
+# Requests that wait longer than this for a slot are shed instead of piling up
+ADMISSION_MAX_QUEUE_WAIT = float(os.getenv("ADMISSION_MAX_QUEUE_WAIT", "2.0"))
+
+# Circuit breaker: open after this many consecutive failures, probe again after the cool-down
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30.0"))
+# Upstream statuses that count as failures of the upstream itself; other 5xx
+# are application errors of a single request and count as successes
+BREAKER_FAILURE_STATUS_CODES = {
+    int(code) for code in os.getenv("BREAKER_FAILURE_STATUS_CODES", "502,503,504").split(",") if code.strip()
+}
+
+# Retries for idempotent requests: each request earns RETRY_BUDGET_RATIO retry
+# tokens (capped at RETRY_BUDGET_MAX_TOKENS) and each retry spends one
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "2"))
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.2"))
+RETRY_BUDGET_MAX_TOKENS = float(os.getenv("RETRY_BUDGET_MAX_TOKENS", "10"))
+
+# Response cache: TTL in seconds for each cached upstream (others are never cached)
+CACHE_TTLS = {
+    "chat": float(os.getenv("CACHE_TTL_CHAT", "30")),
+    "sentiment": float(os.getenv("CACHE_TTL_SENTIMENT", "60")),
+}
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "2048"))
+# Read-only endpoints that use POST for their query; the body becomes part of the key
+CACHEABLE_POST_PATHS = {"/sentiment/report"}
+
+# Access tokens are issued by the auth service; the gateway verifies them locally
+JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "YOUR_SECRET_KEY")
+JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+JWT_CACHE_MAX_ENTRIES = int(os.getenv("JWT_CACHE_MAX_ENTRIES", "10000"))
+# Upstreams that only accept authenticated requests
+AUTH_REQUIRED_UPSTREAMS = {"chat", "sentiment", "voice", "video"}
+# Trusted header carrying the verified user id to downstream services
+USER_ID_HEADER = "x-user-id"
+# Remaining time budget in seconds, sent with every forwarded request so that
+# downstream services can stop working on requests the gateway has given up on.
+# Clients may send it too, to ask for a tighter deadline than the gateway's.
+DEADLINE_HEADER = "x-request-timeout"
+# Shortest deadline a client may ask for; anything tighter is raised to this.
+# Timeouts of client-tightened deadlines never count against the upstream.
+MIN_CLIENT_DEADLINE = float(os.getenv("MIN_CLIENT_DEADLINE", "1.0"))
+
+# Load balancing across replicas: "p2c" (power of two choices) or "least_outstanding"
+LOAD_BALANCING_POLICY = os.getenv("LOAD_BALANCING_POLICY", "p2c")
+# Active health checks against each replica's root endpoint
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", "10.0"))
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", "2.0"))
+# A replica failing a health check, or this many requests in a row, is ejected for a while
+REPLICA_EJECT_AFTER_FAILURES = int(os.getenv("REPLICA_EJECT_AFTER_FAILURES", "3"))
+REPLICA_EJECT_DURATION = float(os.getenv("REPLICA_EJECT_DURATION", "30.0"))
@@ -0,0 +1,158 @@
+import time
+from contextlib import contextmanager
+from fastapi import FastAPI, Response
+from starlette.routing import Match
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+# Latency buckets in seconds, wide enough for LLM and media processing calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+REQUESTS = Counter(
+    "http_requests_total",
+    "HTTP requests handled, by route template and status code",
+    ["method", "route", "status"],
+)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request until its response body has been sent",
+    ["method", "route"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being handled",
+    ["method", "route"],
+)
+DEPENDENCY_LATENCY = Histogram(
+    "dependency_duration_seconds",
+    "Time spent waiting on a dependency (database, model, upstream service)",
+    ["dependency", "operation"],
+    buckets=LATENCY_BUCKETS,
+)
+DEPENDENCY_ERRORS = Counter(
+    "dependency_errors_total",
+    "Calls to a dependency that raised an error",
+    ["dependency", "operation"],
+)
+
+@contextmanager
+def track_dependency(dependency: str, operation: str = "call"):
+    """Time a block of code as a call to the given dependency"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        DEPENDENCY_ERRORS.labels(dependency, operation).inc()
+        raise
+    finally:
+        DEPENDENCY_LATENCY.labels(dependency, operation).observe(time.perf_counter() - start)
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request counts, latency and in-flight requests.
+    Requests are labelled with their route template (e.g. /chat/history/{user_id})
+    rather than the raw path, so label cardinality stays bounded.
+    """
+
+    def __init__(self, app, router):
+        self.app = app
+        self.router = router
+
+    def _route(self, scope) -> str:
+        for route in self.router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", "unmatched")
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = self._route(scope)
+        status = 500
+        start = time.perf_counter()
+        in_flight = REQUESTS_IN_FLIGHT.labels(method, route)
+        in_flight.inc()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_flight.dec()
+            REQUEST_LATENCY.labels(method, route).observe(time.perf_counter() - start)
+            REQUESTS.labels(method, route, str(status)).inc()
+
+# Admission control
+UPSTREAM_IN_FLIGHT = Gauge(
+    "gateway_upstream_in_flight",
+    "Requests currently being proxied to the upstream",
+    ["upstream"],
+)
+UPSTREAM_QUEUE_DEPTH = Gauge(
+    "gateway_upstream_queue_depth",
+    "Requests waiting for an upstream concurrency slot",
+    ["upstream"],
+)
+UPSTREAM_SHED = Counter(
+    "gateway_upstream_shed_total",
+    "Requests rejected by admission control",
+    ["upstream", "reason"],
+)
+
+# Replica load balancing
+REPLICA_OUTSTANDING = Gauge(
+    "gateway_replica_outstanding_requests",
+    "Requests currently outstanding on an upstream replica",
+    ["upstream", "replica"],
+)
+REPLICA_AVAILABLE = Gauge(
+    "gateway_replica_available",
+    "1 if the replica is receiving traffic, 0 while it is ejected",
+    ["upstream", "replica"],
+)
+
+# Response cache
+CACHE_REQUESTS = Counter(
+    "gateway_cache_requests_total",
+    "Cache lookups by outcome (hit, not_modified, miss)",
+    ["upstream", "result"],
+)
+CACHE_ENTRIES = Gauge(
+    "gateway_cache_entries",
+    "Responses currently held in the cache",
+)
+CACHE_HIT_RATIO = Gauge(
+    "gateway_cache_hit_ratio",
+    "Share of cache lookups served from the cache since startup",
+)
+
+# Request coalescing
+COALESCED_REQUESTS = Counter(
+    "gateway_coalesced_requests_total",
+    "Requests answered by sharing an identical in-flight upstream call",
+    ["upstream"],
+)
+
+# Access token verification
+AUTH_REQUESTS = Counter(
+    "gateway_auth_requests_total",
+    "Access token checks by outcome (cached, verified, rejected)",
+    ["result"],
+)
+
+def metrics_endpoint():
+    """Expose all metrics in the Prometheus text format"""
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+def instrument_app(app: FastAPI):
+    """Record request metrics for every route and serve them on /metrics"""
+    app.add_middleware(MetricsMiddleware, router=app.router)
+    app.add_api_route("/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False)
@@ -1,10 +1,13 @@
 from fastapi import APIRouter, Request
-from ..config import CHATBOT_SERVICE_URL, CHAT_TIMEOUT
 from ..utils import proxy_request
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
+# Server-sent events are relayed as they arrive rather than buffered
+@router.post("/message/stream")
+async def proxy_chat_stream(request: Request):
+    return await proxy_request(request, "/chat/message/stream", upstream="chat", stream=True)
+
 @router.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH"])
 async def proxy_chat(request: Request, path: str):
-    target_url = f"{CHATBOT_SERVICE_URL}/chat/{path}"
-    return await proxy_request(request, target_url, timeout=CHAT_TIMEOUT)
\ No newline at end of file
+    return await proxy_request(request, f"/chat/{path}", upstream="chat")
@@ -1,10 +1,8 @@
 from fastapi import APIRouter, Request
-from ..config import SENTIMENT_SERVICE_URL
 from ..utils import proxy_request
 
 router = APIRouter(prefix="/sentiment", tags=["sentiment"])
 
 @router.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH"])
 async def proxy_sentiment(request: Request, path: str):
-    target_url = f"{SENTIMENT_SERVICE_URL}/sentiment/{path}"
-    return await proxy_request(request, target_url)
\ No newline at end of file
+    return await proxy_request(request, f"/sentiment/{path}", upstream="sentiment")
\ No newline at end of file
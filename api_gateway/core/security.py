@@ -0,0 +1,66 @@
+import time
+import logging
+from collections import OrderedDict
+import jwt
+from fastapi import Request
+
+from .config import JWT_SECRET_KEY, JWT_ALGORITHM, JWT_CACHE_MAX_ENTRIES
+from .metrics import AUTH_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+class TokenError(Exception):
+    """Raised when a request does not carry a valid access token"""
+
+# Verified claims by token, kept until the token expires
+_claims_cache = OrderedDict()
+
+def _cached_claims(token: str):
+    claims = _claims_cache.get(token)
+    if claims is None:
+        return None
+    if claims["exp"] <= time.time():
+        del _claims_cache[token]
+        return None
+    _claims_cache.move_to_end(token)
+    return claims
+
+def verify_access_token(token: str) -> dict:
+    """
+    Verify an access token issued by the auth service and return its claims.
+    Successfully verified tokens are cached until their exp claim.
+    """
+    claims = _cached_claims(token)
+    if claims is not None:
+        AUTH_REQUESTS.labels("cached").inc()
+        return claims
+
+    try:
+        claims = jwt.decode(
+            token,
+            JWT_SECRET_KEY,
+            algorithms=[JWT_ALGORITHM],
+            options={"require": ["exp", "user_id"]},
+        )
+    except jwt.ExpiredSignatureError:
+        AUTH_REQUESTS.labels("rejected").inc()
+        raise TokenError("Access token has expired")
+    except jwt.InvalidTokenError as e:
+        AUTH_REQUESTS.labels("rejected").inc()
+        logger.warning(f"Rejected invalid access token: {e}")
+        raise TokenError("Invalid access token")
+
+    AUTH_REQUESTS.labels("verified").inc()
+    _claims_cache[token] = claims
+    while len(_claims_cache) > JWT_CACHE_MAX_ENTRIES:
+        _claims_cache.popitem(last=False)
+    return claims
+
+def authenticate(request: Request) -> dict:
+    """Verify the request's bearer token and return its claims"""
+    authorization = request.headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        AUTH_REQUESTS.labels("rejected").inc()
+        raise TokenError("Missing bearer token")
+    return verify_access_token(token.strip())
@@ -0,0 +1,26 @@
+import asyncio
+from typing import Awaitable, Callable, Hashable, Tuple
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one.
+    The first caller starts the work as a task; callers arriving while it
+    runs await the same task. The task is shielded, so the first caller
+    disconnecting does not cancel the result the others are waiting for.
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    def __len__(self):
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]) -> Tuple[object, bool]:
+        """Run fn once per key at a time; returns (result, shared)"""
+        task = self._calls.get(key)
+        shared = task is not None
+        if not shared:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task), shared
@@ -1,54 +1,394 @@
 import json
+import math
+import time
+from typing import Optional
 from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask, BackgroundTasks
 import httpx
 import logging
 
+from .clients import get_client
+from .breaker import breakers, retry_budgets
+from .admission import admission_controllers
+from .balancer import balancers
+from .cache import response_cache, cache_key, request_identity, SAFE_METHODS
+from .singleflight import SingleFlight
+from .security import authenticate, TokenError
+from .config import (
+    UPSTREAMS,
+    CONNECT_TIMEOUT,
+    RETRY_MAX_ATTEMPTS,
+    BREAKER_FAILURE_STATUS_CODES,
+    CACHE_TTLS,
+    AUTH_REQUIRED_UPSTREAMS,
+    USER_ID_HEADER,
+    DEADLINE_HEADER,
+    MIN_CLIENT_DEADLINE,
+)
+from .metrics import CACHE_REQUESTS, COALESCED_REQUESTS, track_dependency
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def proxy_request(request: Request, target_url: str, timeout: float = 10.0):
+# Identical idempotent requests currently being forwarded
+in_flight_requests = SingleFlight()
+
+# Connection-specific headers that must not be relayed between hops
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailers",
+    "transfer-encoding",
+    "upgrade",
+}
+
+# Only these methods are safe to send upstream more than once
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+# Upstream statuses worth retrying on another attempt
+RETRYABLE_STATUS_CODES = {502, 503, 504}
+
+def _request_headers(request: Request) -> dict:
     """
-    Generic proxy function that forwards requests to target services
-    and returns their responses.
+    Headers to forward upstream: everything except Host and hop-by-hop headers.
+    The trusted user id header is only ever set by the gateway itself, and
+    the deadline header always carries the budget left at the time of sending.
+    """
+    headers = {
+        k: v for k, v in request.headers.items()
+        if k.lower() not in ("host", USER_ID_HEADER, DEADLINE_HEADER) and k.lower() not in HOP_BY_HOP_HEADERS
+    }
+    user_id = getattr(request.state, "user_id", None)
+    if user_id is not None:
+        headers[USER_ID_HEADER] = str(user_id)
+    headers[DEADLINE_HEADER] = f"{_remaining(request):.3f}"
+    return headers
+
+def _request_deadline(request: Request, upstream: str, timeout: Optional[float]) -> float:
+    """
+    Monotonic time by which the request must be answered: the upstream's
+    timeout, or the client's own deadline header if that is tighter.
+    Client deadlines are raised to MIN_CLIENT_DEADLINE unless already spent;
+    request.state.client_deadline records whether the client's won.
+    """
+    budget = timeout if timeout is not None else UPSTREAMS[upstream]["timeout"]
+    request.state.client_deadline = False
+    try:
+        client_budget = float(request.headers.get(DEADLINE_HEADER, "inf"))
+    except ValueError:
+        client_budget = math.inf
+    if client_budget > 0:
+        client_budget = max(client_budget, MIN_CLIENT_DEADLINE)
+    if client_budget < budget:
+        budget = client_budget
+        request.state.client_deadline = True
+    return time.monotonic() + max(budget, 0.0)
+
+def _is_upstream_failure(request: Request, status_code: Optional[int] = None, error: Optional[Exception] = None) -> bool:
+    """
+    Whether an attempt's outcome counts against the upstream's breaker and
+    replica. Timeouts only do when the gateway's own timeout set the
+    deadline, so clients can't trip the breaker by asking for tiny ones.
+    """
+    timed_out = isinstance(error, httpx.TimeoutException) or status_code == 504
+    if timed_out and getattr(request.state, "client_deadline", False):
+        return False
+    if error is not None:
+        return isinstance(error, httpx.TransportError)
+    return status_code in BREAKER_FAILURE_STATUS_CODES
+
+def _remaining(request: Request) -> float:
+    """Seconds left before the request's deadline, never negative"""
+    return max(request.state.deadline - time.monotonic(), 0.0)
+
+async def _request_content(request: Request, stream: bool):
+    """
+    Body to send upstream. Streamed requests pipe the body through unless the
+    method is idempotent: those carry no meaningful body and may be retried,
+    which a consumed stream cannot be.
+    """
+    if stream and request.method not in IDEMPOTENT_METHODS:
+        return request.stream()
+    return await request.body()
+
+def _response_headers(resp: httpx.Response) -> dict:
+    """Headers to relay back to the client from a streamed upstream response"""
+    return {k: v for k, v in resp.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+
+def _buffered_response_headers(resp: httpx.Response) -> dict:
+    """
+    Headers to relay with a buffered upstream body. httpx has already decoded
+    the body, so its original encoding and length no longer apply.
+    """
+    return {
+        k: v for k, v in _response_headers(resp).items()
+        if k.lower() not in ("content-encoding", "content-length")
+    }
+
+def _error_response(message: str, status_code: int) -> Response:
+    return Response(
+        content=json.dumps({"error": message}),
+        status_code=status_code,
+        media_type="application/json"
+    )
+
+def _unauthorized_response(message: str) -> Response:
+    response = _error_response(message, 401)
+    response.headers["WWW-Authenticate"] = "Bearer"
+    return response
+
+def _unavailable_response(upstream: str, retry_after: float) -> Response:
+    """Fast 503 returned while an upstream's circuit is open"""
+    response = _error_response(
+        f"The {upstream} service is temporarily unavailable. Please try again later.",
+        503  # Service Unavailable
+    )
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
+
+def _overloaded_response(upstream: str, retry_after: float) -> Response:
+    """Fast 503 returned when admission control sheds a request"""
+    response = _error_response(
+        f"The {upstream} service is busy. Please try again shortly.",
+        503  # Service Unavailable
+    )
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
+
+def _deadline_exceeded_response() -> Response:
+    return _error_response(
+        "The request took too long to complete. Please try again later.",
+        504  # Gateway Timeout
+    )
+
+def _release_replica(replica):
+    replica.outstanding -= 1
+
+def _can_retry(method: str, attempt: int, upstream: str) -> bool:
+    """Only idempotent requests are retried, within the attempt limit and retry budget"""
+    return (
+        method in IDEMPOTENT_METHODS
+        and attempt < RETRY_MAX_ATTEMPTS
+        and breakers[upstream].allow_request()
+        and retry_budgets[upstream].try_withdraw()
+    )
+
+async def _forward(request: Request, path: str, upstream: str, stream: bool):
+    """
+    Send the request to a replica of the upstream through the breaker,
+    retrying idempotent requests on another replica while the deadline allows
     """
-    # Prepare request data
     method = request.method
-    headers = dict(request.headers)
-    body = await request.body()
+    client = get_client(upstream)
+    breaker = breakers[upstream]
+    balancer = balancers[upstream]
     
-    logger.info(f"Proxying {method} request to {target_url}")
+    if not breaker.allow_request():
+        logger.warning(f"Circuit for {upstream} is open, rejecting {method} request to {path}")
+        return _unavailable_response(upstream, breaker.retry_after())
+    retry_budgets[upstream].deposit()
     
-    try:
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            resp = await client.request(
+    attempt = 1
+    replica = None
+    while True:
+        replica = balancer.pick(exclude=replica)
+        target_url = f"{replica.url}{path}"
+        if attempt == 1:
+            logger.info(f"Proxying {method} request to {target_url}{' (streaming)' if stream else ''}")
+        
+        remaining = _remaining(request)
+        if remaining <= 0:
+            breaker.release()
+            logger.error(f"Deadline for {method} {target_url} passed before attempt {attempt}")
+            return _deadline_exceeded_response()
+        
+        outcome_recorded = False
+        replica.outstanding += 1
+        release_replica = True
+        try:
+            upstream_request = client.build_request(
                 method,
                 target_url,
-                headers={k: v for k, v in headers.items() if k.lower() != "host"},
-                content=body,
+                headers=_request_headers(request),
+                content=await _request_content(request, stream),
                 params=dict(request.query_params),
+                timeout=httpx.Timeout(remaining, connect=min(CONNECT_TIMEOUT, remaining)),
             )
-        
-        logger.info(f"Response from {target_url}: status={resp.status_code}")
-        return Response(
-            content=resp.content,
-            status_code=resp.status_code,
-            headers=dict(resp.headers),
-            media_type=resp.headers.get("content-type")
-        )
-    except httpx.ReadTimeout:
-        logger.error(f"Request to {target_url} timed out after {timeout}s")
-        return Response(
-            content=json.dumps({
-                "error": "The request took too long to complete. Please try again later."
-            }),
-            status_code=504,  # Gateway Timeout
-            media_type="application/json"
-        )
-    except Exception as e:
-        logger.error(f"Error proxying request to {target_url}: {e}")
-        return Response(
-            content=json.dumps({"error": str(e)}),
-            status_code=500,
-            media_type="application/json"
-        )
\ No newline at end of file
+            with track_dependency(upstream, "request"):
+                resp = await client.send(upstream_request, stream=stream)
+            
+            if _is_upstream_failure(request, status_code=resp.status_code):
+                breaker.record_failure()
+                balancer.record_failure(replica)
+                outcome_recorded = True
+            elif resp.status_code not in BREAKER_FAILURE_STATUS_CODES:
+                breaker.record_success()
+                balancer.record_success(replica)
+                outcome_recorded = True
+            
+            if resp.status_code in RETRYABLE_STATUS_CODES and _can_retry(method, attempt, upstream):
+                logger.warning(f"Retrying {method} {target_url} after status {resp.status_code}")
+                await resp.aclose()
+                attempt += 1
+                continue
+            
+            logger.info(f"Response from {target_url}: status={resp.status_code}")
+            if stream:
+                # Relay the raw (still encoded) bytes and close the upstream
+                # response once the client has received all of them
+                release_replica = False
+                return StreamingResponse(
+                    resp.aiter_raw(),
+                    status_code=resp.status_code,
+                    headers=_response_headers(resp),
+                    background=BackgroundTasks([
+                        BackgroundTask(resp.aclose),
+                        BackgroundTask(_release_replica, replica),
+                    ]),
+                )
+            return Response(
+                content=resp.content,
+                status_code=resp.status_code,
+                headers=_buffered_response_headers(resp),
+                media_type=resp.headers.get("content-type")
+            )
+        except Exception as e:
+            # Only failures to reach the upstream count against it
+            if _is_upstream_failure(request, error=e):
+                breaker.record_failure()
+                balancer.record_failure(replica)
+                outcome_recorded = True
+            
+            if isinstance(e, httpx.TransportError) and _can_retry(method, attempt, upstream):
+                logger.warning(f"Retrying {method} {target_url} after error: {e}")
+                attempt += 1
+                continue
+            
+            if isinstance(e, httpx.TimeoutException):
+                logger.error(f"Request to {target_url} timed out after {remaining:.1f}s")
+                return _deadline_exceeded_response()
+            logger.error(f"Error proxying request to {target_url}: {e}")
+            return _error_response(str(e), 500)
+        finally:
+            # A cancelled request must not hold on to the half-open probe slot
+            if not outcome_recorded:
+                breaker.release()
+            if release_replica:
+                _release_replica(replica)
+
+async def _admit_and_forward(request: Request, path: str, upstream: str, stream: bool):
+    """Forward the request once admission control grants the upstream a slot"""
+    admission = admission_controllers[upstream]
+    if not await admission.acquire():
+        return _overloaded_response(upstream, admission.max_queue_wait)
+    
+    try:
+        response = await _forward(request, path, upstream, stream)
+    except BaseException:
+        admission.release()
+        raise
+    
+    if isinstance(response, StreamingResponse):
+        # Keep the slot until the streamed body has been relayed
+        response.background = BackgroundTasks([response.background, BackgroundTask(admission.release)])
+    else:
+        admission.release()
+    return response
+
+def _copy_response(response: Response) -> Response:
+    """Independent copy of a buffered response for another waiting client"""
+    return Response(content=response.body, status_code=response.status_code, headers=dict(response.headers))
+
+async def _coalesced_forward(request: Request, path: str, upstream: str, stream: bool, identity: Optional[str]):
+    """
+    Forward the request, sharing one upstream call between identical
+    idempotent requests of the same user that are in flight together.
+    """
+    if stream or request.method not in IDEMPOTENT_METHODS:
+        return await _admit_and_forward(request, path, upstream, stream)
+    
+    key = (upstream, identity, request.method, request.url.path, tuple(sorted(request.query_params.multi_items())))
+    response, shared = await in_flight_requests.do(
+        key, lambda: _admit_and_forward(request, path, upstream, stream)
+    )
+    if not shared:
+        return response
+    
+    COALESCED_REQUESTS.labels(upstream).inc()
+    logger.info(f"Coalesced {request.method} request to {path} with an identical in-flight call")
+    return _copy_response(response)
+
+async def proxy_request(
+    request: Request,
+    path: str,
+    upstream: str,
+    timeout: Optional[float] = None,
+    stream: bool = False,
+):
+    """
+    Generic proxy function that forwards requests to target services
+    and returns their responses.
+    `path` is relative to the upstream; each attempt is sent to one of its
+    replicas, chosen by the upstream's load balancer.
+    Requests go through the pooled client of the given upstream; its
+    configured timeout applies unless an explicit timeout is passed.
+    With stream=True the request body is piped upstream chunk by chunk and
+    the upstream response is relayed as it arrives, so large uploads and
+    downloads are never held in gateway memory.
+    While the upstream's circuit breaker is open requests fail fast with a
+    503, and idempotent requests that fail are retried within the budget.
+    Each upstream admits a limited number of concurrent requests; the rest
+    wait in a bounded queue and are shed with a 503 if they wait too long.
+    Read requests of cached upstreams are answered from the response cache
+    when possible; state-changing requests invalidate the user's entries.
+    Identical idempotent requests in flight at the same time share a single
+    upstream call.
+    Upstreams that require authentication only receive requests with a valid
+    access token, verified locally, and get the caller's user id in a
+    trusted header.
+    Every request gets a deadline when it arrives. Time spent queueing and on
+    earlier attempts counts against it, and upstreams are told how much of
+    it is left so they can stop working on requests nobody waits for anymore.
+    """
+    request.state.deadline = _request_deadline(request, upstream, timeout)
+    if upstream in AUTH_REQUIRED_UPSTREAMS:
+        try:
+            claims = authenticate(request)
+        except TokenError as e:
+            logger.info(f"Rejecting {request.method} request to {path}: {e}")
+            return _unauthorized_response(str(e))
+        request.state.user_id = claims["user_id"]
+    
+    identity = request_identity(request)
+    key = None if stream else await cache_key(request, upstream, identity)
+    
+    if key is None:
+        response = await _coalesced_forward(request, path, upstream, stream, identity)
+        if identity is not None and request.method not in SAFE_METHODS:
+            response_cache.invalidate(identity)
+            if isinstance(response, StreamingResponse):
+                # The upstream may only change state once the body has been
+                # relayed, e.g. a streamed chat reply stored at its end
+                tasks = [response.background] if response.background is not None else []
+                response.background = BackgroundTasks(tasks + [BackgroundTask(response_cache.invalidate, identity)])
+        return response
+    
+    cached = response_cache.get(key)
+    if cached is not None:
+        revalidated = cached.to_response(request)
+        CACHE_REQUESTS.labels(upstream, "not_modified" if revalidated.status_code == 304 else "hit").inc()
+        return revalidated
+    CACHE_REQUESTS.labels(upstream, "miss").inc()
+    
+    generation = response_cache.generation(identity)
+    response = await _coalesced_forward(request, path, upstream, stream, identity)
+    if response.status_code == 200:
+        entry = response_cache.set(key, identity, generation, response, CACHE_TTLS[upstream])
+        if entry is not None:
+            return entry.to_response(request)
+    return response
@@ -0,0 +1,44 @@
+import jwt
+import pytest
+from datetime import datetime, timedelta, timezone
+
+from fastapi.testclient import TestClient
+
+from core.app import create_app
+from core.routes import register_routes
+from core.config import JWT_SECRET_KEY, JWT_ALGORITHM
+
+class FakeClock:
+    """Clock for code that takes a `clock` callable; tests move it by setting `now`"""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def make_token(user_id: int, expires_in: timedelta = timedelta(minutes=30)) -> str:
+    """Access token shaped like the ones the auth service issues"""
+    claims = {"user_id": user_id, "roles": ["user"], "exp": datetime.now(timezone.utc) + expires_in}
+    return jwt.encode(claims, JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
+
+@pytest.fixture
+def client():
+    """Client of a gateway app with every route registered"""
+    app = create_app()
+    register_routes(app)
+    return TestClient(app)
+
+@pytest.fixture
+def auth_headers():
+    def headers(user_id: int = 1) -> dict:
+        return {"Authorization": f"Bearer {make_token(user_id)}"}
+    return headers
+
+@pytest.fixture(autouse=True)
+def fresh_response_cache():
+    """Keep cached responses from leaking between tests"""
+    from unittest.mock import patch
+    from core.cache import ResponseCache
+    
+    with patch("core.utils.response_cache", ResponseCache(max_entries=64)) as cache:
+        yield cache
@@ -0,0 +1,52 @@
+import asyncio
+from unittest.mock import patch
+
+from core.admission import AdmissionController
+
+def test_waiter_gets_released_slot():
+    async def scenario():
+        controller = AdmissionController("test-handoff", max_concurrency=1, max_queue=1, max_queue_wait=1.0)
+        assert await controller.acquire()
+        
+        waiter = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        assert controller.queue_depth == 1
+        
+        controller.release()
+        assert await waiter
+        # The slot moved to the waiter instead of being freed
+        assert controller.in_flight == 1
+        assert controller.queue_depth == 0
+        
+        controller.release()
+        assert controller.in_flight == 0
+    
+    asyncio.run(scenario())
+
+def test_requests_are_shed_when_queue_full_or_wait_too_long():
+    async def scenario():
+        controller = AdmissionController("test-shed", max_concurrency=1, max_queue=1, max_queue_wait=0.05)
+        assert await controller.acquire()
+        
+        queued = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        # Queue is full: rejected immediately
+        assert not await controller.acquire()
+        # The queued request gives up after max_queue_wait
+        assert not await queued
+        assert controller.in_flight == 1
+        assert controller.queue_depth == 0
+    
+    asyncio.run(scenario())
+
+def test_shed_request_returns_503_and_is_counted(client, auth_headers):
+    controller = AdmissionController("voice", max_concurrency=0, max_queue=0, max_queue_wait=2.0)
+    with patch.dict("core.utils.admission_controllers", {"voice": controller}):
+        response = client.post("/voice/transcribe", content=b"audio", headers=auth_headers())
+    
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "2"
+    
+    metrics = client.get("/metrics").text
+    assert 'gateway_upstream_shed_total{reason="queue_full",upstream="voice"}' in metrics
+    assert 'gateway_upstream_queue_depth{upstream="chat"}' in metrics
@@ -1,7 +1,8 @@
 import pytest
 from fastapi.testclient import TestClient
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 import json
+import httpx
 
 from core.app import create_app
 from core.routes import register_routes
@@ -21,8 +22,8 @@ def test_root_endpoint(client):
     assert response.status_code == 200
     assert response.json() == {"message": "API Gateway is running"}
 
-@patch("core.utils.httpx.AsyncClient")
-def test_auth_proxy(mock_client, client):
+@patch("core.utils.get_client")
+def test_auth_proxy(mock_get_client, client):
     # Setup mock response
     mock_response = MagicMock()
     mock_response.status_code = 200
@@ -31,8 +32,8 @@ def test_auth_proxy(mock_client, client):
     
     # Configure the mock client
     mock_async_client = MagicMock()
-    mock_async_client.__aenter__.return_value.request.return_value = mock_response
-    mock_client.return_value = mock_async_client
+    mock_async_client.send = AsyncMock(return_value=mock_response)
+    mock_get_client.return_value = mock_async_client
     
     # Test the proxy endpoint
     response = client.post("/auth/login", json={"username": "test", "password": "test"})
@@ -40,17 +41,115 @@ def test_auth_proxy(mock_client, client):
     # Verify response
     assert response.status_code == 200
     assert response.json() == {"success": True}
+    mock_get_client.assert_called_with("auth")
 
-@patch("core.utils.httpx.AsyncClient")
-def test_proxy_timeout(mock_client, client):
+@patch("core.utils.get_client")
+def test_proxy_timeout(mock_get_client, client, auth_headers):
     # Setup mock to raise timeout
     mock_async_client = MagicMock()
-    mock_async_client.__aenter__.return_value.request.side_effect = TimeoutError("Request timed out")
-    mock_client.return_value = mock_async_client
+    mock_async_client.send = AsyncMock(side_effect=TimeoutError("Request timed out"))
+    mock_get_client.return_value = mock_async_client
     
     # Test the proxy endpoint with a timeout
-    response = client.get("/chat/history/1")
+    response = client.get("/chat/history/1", headers=auth_headers())
     
     # Verify proper error response
     assert response.status_code == 500
-    assert "error" in response.json()
\ No newline at end of file
+    assert "error" in response.json()
+
+def test_upstream_clients_follow_lifespan(app):
+    from core import clients
+    from core.config import UPSTREAMS, CHAT_TIMEOUT
+    
+    with TestClient(app):
+        # One pooled client per upstream, reused on every lookup
+        assert set(clients._clients) == set(UPSTREAMS)
+        chat_client = clients.get_client("chat")
+        assert clients.get_client("chat") is chat_client
+        assert chat_client.timeout.read == CHAT_TIMEOUT
+    
+    # Clients are closed and dropped on shutdown
+    assert clients._clients == {}
+    assert chat_client.is_closed
+
+@patch("core.utils.get_client")
+def test_streaming_proxy(mock_get_client, client, auth_headers):
+    received = {}
+    
+    async def handler(request):
+        # The upload arrives as a stream rather than a pre-buffered body
+        received["chunks"] = [chunk async for chunk in request.stream]
+        
+        async def download():
+            for _ in range(10):
+                yield b"x" * 10000
+        
+        return httpx.Response(200, content=download(), headers={"content-type": "application/octet-stream"})
+    
+    mock_get_client.return_value = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    
+    def upload():
+        for _ in range(4):
+            yield b"a" * 65536
+    
+    response = client.post("/video/analyze?user_id=1", content=upload(), headers=auth_headers())
+    
+    assert response.status_code == 200
+    assert response.content == b"x" * 100000
+    assert b"".join(received["chunks"]) == b"a" * 4 * 65536
+
+def test_metrics_use_route_templates(client):
+    client.get("/")
+    metrics = client.get("/metrics").text
+    
+    assert 'http_requests_total{method="GET",route="/",status="200"}' in metrics
+    assert 'http_request_duration_seconds_bucket{le="0.005",method="GET",route="/"}' in metrics
+    assert "http_requests_in_flight" in metrics
+
+@patch("core.utils.get_client")
+def test_deadline_forwarded_upstream(mock_get_client, client, auth_headers):
+    from core.config import CHAT_TIMEOUT
+    received = []
+    
+    def handler(request):
+        received.append(float(request.headers["x-request-timeout"]))
+        return httpx.Response(200, json={"ok": True})
+    
+    mock_get_client.return_value = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    
+    # Without a client deadline the upstream gets the gateway's own timeout
+    assert client.get("/chat/history/1", headers=auth_headers()).status_code == 200
+    assert CHAT_TIMEOUT - 1 < received[0] <= CHAT_TIMEOUT
+    
+    # A tighter client deadline wins
+    response = client.post("/chat/message", json={"message": "hi"}, headers={**auth_headers(), "X-Request-Timeout": "5"})
+    assert response.status_code == 200
+    assert 4 < received[1] <= 5
+
+@patch("core.utils.get_client")
+def test_expired_deadline_not_forwarded(mock_get_client, client, auth_headers):
+    mock_async_client = MagicMock()
+    mock_async_client.send = AsyncMock()
+    mock_get_client.return_value = mock_async_client
+    
+    response = client.post("/chat/message", json={"message": "hi"}, headers={**auth_headers(), "X-Request-Timeout": "0"})
+    
+    assert response.status_code == 504
+    mock_async_client.send.assert_not_called()
+
+@patch("core.utils.get_client")
+def test_chat_stream_relayed_unbuffered(mock_get_client, client, auth_headers):
+    async def handler(request):
+        async def events():
+            yield b'event: token\ndata: {"text": "Hi"}\n\n'
+            yield b'event: done\ndata: {"message_id": 1}\n\n'
+        return httpx.Response(200, content=events(), headers={"content-type": "text/event-stream"})
+    
+    mock_get_client.return_value = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    
+    with client.stream("POST", "/chat/message/stream", json={"user_id": 1, "message": "Hi"}, headers=auth_headers()) as response:
+        chunks = list(response.iter_bytes())
+    
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "text/event-stream"
+    assert b"".join(chunks) == b'event: token\ndata: {"text": "Hi"}\n\nevent: done\ndata: {"message_id": 1}\n\n'
@@ -0,0 +1,75 @@
+import asyncio
+import httpx
+from unittest.mock import patch
+
+from core.balancer import LoadBalancer
+from core.breaker import CircuitBreaker, RetryBudget
+from conftest import FakeClock
+
+def test_picks_replica_with_fewer_outstanding_requests():
+    for policy in ("p2c", "least_outstanding"):
+        balancer = LoadBalancer("test", ["http://a", "http://b"], policy=policy)
+        busy, idle = balancer.replicas
+        busy.outstanding = 5
+        assert all(balancer.pick() is idle for _ in range(20))
+
+def test_failing_replica_is_ejected_then_returns():
+    clock = FakeClock()
+    balancer = LoadBalancer("test", ["http://a", "http://b"], eject_after_failures=2,
+                            eject_duration=30.0, clock=clock)
+    bad, good = balancer.replicas
+    
+    balancer.record_failure(bad)
+    balancer.record_failure(bad)
+    assert all(balancer.pick() is good for _ in range(20))
+    
+    clock.now = 30.0
+    assert bad.available(clock.now)
+
+def test_fails_open_when_every_replica_is_ejected():
+    balancer = LoadBalancer("test", ["http://a"], eject_after_failures=1)
+    balancer.record_failure(balancer.replicas[0])
+    assert balancer.pick() is balancer.replicas[0]
+
+def test_health_check_ejects_and_restores_replicas():
+    healthy = {"http://a": True, "http://b": False}
+    
+    def handler(request):
+        base = f"{request.url.scheme}://{request.url.host}"
+        return httpx.Response(200 if healthy[base] else 503)
+    
+    balancer = LoadBalancer("test", ["http://a", "http://b"])
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    
+    with patch("core.balancer.get_client", return_value=mock_client):
+        asyncio.run(balancer.check_health())
+        assert [r["available"] for r in balancer.snapshot()] == [True, False]
+        
+        healthy["http://b"] = True
+        asyncio.run(balancer.check_health())
+        assert [r["available"] for r in balancer.snapshot()] == [True, True]
+
+def test_retry_goes_to_another_replica(client, auth_headers):
+    contacted = []
+    
+    def handler(request):
+        contacted.append(request.url.host)
+        if request.url.host == "chat-1":
+            raise httpx.ConnectError("Connection refused")
+        return httpx.Response(200, json=[])
+    
+    balancer = LoadBalancer("chat", ["http://chat-1:8001", "http://chat-2:8001"], policy="least_outstanding")
+    # Make the broken replica the first choice
+    balancer.replicas[1].outstanding = 1
+    mock_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    
+    with patch("core.utils.get_client", return_value=mock_client), \
+         patch.dict("core.utils.balancers", {"chat": balancer}), \
+         patch.dict("core.utils.breakers", {"chat": CircuitBreaker("chat", 5, 30.0)}), \
+         patch.dict("core.utils.retry_budgets", {"chat": RetryBudget(ratio=0.2, max_tokens=1)}):
+        response = client.get("/chat/history/1", headers=auth_headers())
+    
+    assert response.status_code == 200
+    assert contacted == ["chat-1", "chat-2"]
+    assert balancer.replicas[0].consecutive_failures == 1
+    assert balancer.replicas[1].outstanding == 1
@@ -0,0 +1,22 @@
+import asyncio
+
+from benchmarks.gateway_bench import run_benchmark, compare, percentile
+
+def test_percentile_uses_nearest_rank():
+    samples = list(range(1, 101))
+    assert percentile(samples, 50) == 50
+    assert percentile(samples, 99) == 99
+    assert percentile([], 95) == 0.0
+
+def test_benchmark_report_is_comparable():
+    report = asyncio.run(run_benchmark(
+        requests=20, concurrency=4, latency=0.0, payload_size=256,
+        upload_size=256 * 1024, upload_requests=2,
+        scenarios=["chat_history_cached", "video_upload_stream"],
+    ))
+
+    assert set(report["results"]) == {"chat_history_cached", "video_upload_stream"}
+    for result in report["results"].values():
+        assert result["errors"] == 0
+        assert set(result["overhead_ms"]) == {"p50", "p95", "p99"}
+    assert "chat_history_cached" in compare(report, report)
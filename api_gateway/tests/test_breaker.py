@@ -0,0 +1,126 @@
+from unittest.mock import patch, MagicMock, AsyncMock
+import httpx
+
+from core.breaker import CircuitBreaker, RetryBudget, CLOSED, OPEN, HALF_OPEN
+from conftest import FakeClock
+
+def test_breaker_opens_after_consecutive_failures():
+    clock = FakeClock()
+    breaker = CircuitBreaker("chat", failure_threshold=3, reset_timeout=10.0, clock=clock)
+    
+    for _ in range(2):
+        assert breaker.allow_request()
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+    
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow_request()
+    assert breaker.retry_after() == 10.0
+
+def test_breaker_half_open_allows_single_probe():
+    clock = FakeClock()
+    breaker = CircuitBreaker("chat", failure_threshold=1, reset_timeout=10.0, clock=clock)
+    breaker.record_failure()
+    
+    clock.now = 10.0
+    assert breaker.allow_request()
+    assert breaker.state == HALF_OPEN
+    # Only one probe at a time
+    assert not breaker.allow_request()
+    
+    # A failed probe re-opens the circuit, a successful one closes it
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    clock.now = 20.0
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.consecutive_failures == 0
+
+def test_retry_budget_is_bounded():
+    budget = RetryBudget(ratio=0.5, max_tokens=2)
+    assert budget.try_withdraw()
+    assert budget.try_withdraw()
+    assert not budget.try_withdraw()
+    
+    # Two regular requests earn one retry
+    budget.deposit()
+    budget.deposit()
+    assert budget.try_withdraw()
+    assert not budget.try_withdraw()
+
+@patch("core.utils.get_client")
+def test_open_circuit_fails_fast(mock_get_client, client, auth_headers):
+    mock_async_client = MagicMock()
+    mock_async_client.send = AsyncMock(side_effect=httpx.ConnectError("Connection refused"))
+    mock_get_client.return_value = mock_async_client
+    
+    breaker = CircuitBreaker("chat", failure_threshold=2, reset_timeout=30.0)
+    with patch.dict("core.utils.breakers", {"chat": breaker}), \
+         patch.dict("core.utils.retry_budgets", {"chat": RetryBudget(ratio=0.0, max_tokens=0)}):
+        for _ in range(2):
+            assert client.post("/chat/message", json={}, headers=auth_headers()).status_code == 500
+        
+        response = client.post("/chat/message", json={}, headers=auth_headers())
+        assert response.status_code == 503
+        assert int(response.headers["Retry-After"]) > 0
+        # The upstream was not contacted once the circuit opened
+        assert mock_async_client.send.await_count == 2
+        
+        assert client.get("/gateway/upstreams").json()["chat"]["state"] == OPEN
+
+@patch("core.utils.get_client")
+def test_idempotent_request_is_retried(mock_get_client, client, auth_headers):
+    ok_response = MagicMock()
+    ok_response.status_code = 200
+    ok_response.content = b"[]"
+    ok_response.headers = {"content-type": "application/json"}
+    
+    mock_async_client = MagicMock()
+    mock_async_client.send = AsyncMock(side_effect=[httpx.ConnectError("Connection reset"), ok_response])
+    mock_get_client.return_value = mock_async_client
+    
+    with patch.dict("core.utils.breakers", {"chat": CircuitBreaker("chat", 5, 30.0)}), \
+         patch.dict("core.utils.retry_budgets", {"chat": RetryBudget(ratio=0.2, max_tokens=1)}):
+        response = client.get("/chat/history/1", headers=auth_headers())
+    
+    assert response.status_code == 200
+    assert mock_async_client.send.await_count == 2
+
+@patch("core.utils.get_client")
+def test_application_errors_do_not_open_circuit(mock_get_client, client, auth_headers):
+    error_response = MagicMock()
+    error_response.status_code = 500
+    error_response.content = b'{"detail": "Error processing message"}'
+    error_response.headers = {"content-type": "application/json"}
+    
+    mock_async_client = MagicMock()
+    mock_async_client.send = AsyncMock(return_value=error_response)
+    mock_get_client.return_value = mock_async_client
+    
+    breaker = CircuitBreaker("chat", failure_threshold=2, reset_timeout=30.0)
+    with patch.dict("core.utils.breakers", {"chat": breaker}):
+        for _ in range(3):
+            assert client.post("/chat/message", json={}, headers=auth_headers()).status_code == 500
+    
+    assert breaker.state != OPEN
+    assert mock_async_client.send.await_count == 3
+
+@patch("core.utils.get_client")
+def test_client_tightened_timeouts_do_not_open_circuit(mock_get_client, client):
+    mock_async_client = MagicMock()
+    mock_async_client.send = AsyncMock(side_effect=httpx.ReadTimeout("timed out"))
+    mock_get_client.return_value = mock_async_client
+    
+    breaker = CircuitBreaker("auth", failure_threshold=2, reset_timeout=30.0)
+    with patch.dict("core.utils.breakers", {"auth": breaker}):
+        for _ in range(3):
+            response = client.post("/auth/login", json={}, headers={"X-Request-Timeout": "0.01"})
+            assert response.status_code == 504
+    
+    assert breaker.state == CLOSED
+    assert mock_async_client.send.await_count == 3
+    # The client's deadline was raised to the minimum
+    timeout = mock_async_client.build_request.call_args.kwargs["timeout"]
+    assert timeout.read > 0.5
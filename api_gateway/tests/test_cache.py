@@ -0,0 +1,116 @@
+import json
+from datetime import timedelta
+import pytest
+import httpx
+from fastapi import Response
+from unittest.mock import patch, MagicMock, AsyncMock
+
+from core.cache import ResponseCache
+from conftest import make_token, FakeClock
+
+AUTH_HEADERS = {"Authorization": f"Bearer {make_token(1)}"}
+
+@pytest.fixture
+def cache():
+    cache = ResponseCache(max_entries=16)
+    with patch("core.utils.response_cache", cache):
+        yield cache
+
+@pytest.fixture
+def upstream():
+    """Mock upstream client that counts calls and returns a fresh JSON body each time"""
+    def send(upstream_request, stream=False):
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.content = json.dumps({"call": mock_client.send.await_count}).encode()
+        mock_response.headers = httpx.Headers({"content-type": "application/json"})
+        return mock_response
+    
+    mock_client = MagicMock()
+    mock_client.send = AsyncMock(side_effect=send)
+    with patch("core.utils.get_client", return_value=mock_client):
+        yield mock_client
+
+def make_response(body: bytes) -> Response:
+    return Response(content=body, media_type="application/json")
+
+def test_entries_expire_and_are_evicted_lru():
+    clock = FakeClock()
+    cache = ResponseCache(max_entries=2, clock=clock)
+    
+    cache.set(("u1", "a"), "u1", 0, make_response(b"a"), ttl=10)
+    cache.set(("u1", "b"), "u1", 0, make_response(b"b"), ttl=10)
+    assert cache.get(("u1", "a")) is not None
+    # "b" is now least recently used
+    cache.set(("u1", "c"), "u1", 0, make_response(b"c"), ttl=10)
+    assert cache.get(("u1", "b")) is None
+    
+    clock.now = 10.0
+    assert cache.get(("u1", "a")) is None
+    assert cache.hits == 1
+    assert cache.misses == 2
+
+def test_invalidation_discards_in_flight_fetches():
+    cache = ResponseCache(max_entries=16)
+    generation = cache.generation("u1")
+    cache.set(("u1", "a"), "u1", generation, make_response(b"a"), ttl=10)
+    
+    cache.invalidate("u1")
+    assert len(cache) == 0
+    # A response fetched before the invalidation is not stored
+    assert cache.set(("u1", "a"), "u1", generation, make_response(b"a"), ttl=10) is None
+
+def test_get_is_served_from_cache(client, cache, upstream):
+    first = client.get("/chat/history/1", headers=AUTH_HEADERS)
+    second = client.get("/chat/history/1", headers=AUTH_HEADERS)
+    
+    assert first.status_code == second.status_code == 200
+    assert first.json() == second.json()
+    assert upstream.send.await_count == 1
+    assert cache.hit_ratio == 0.5
+    
+    # Different query or user means a different entry
+    client.get("/chat/history/1?limit=5", headers=AUTH_HEADERS)
+    client.get("/chat/history/1", headers={"Authorization": f"Bearer {make_token(2)}"})
+    assert upstream.send.await_count == 3
+
+def test_if_none_match_returns_304(client, cache, upstream):
+    etag = client.get("/chat/history/1", headers=AUTH_HEADERS).headers["etag"]
+    
+    response = client.get("/chat/history/1", headers={**AUTH_HEADERS, "If-None-Match": etag})
+    
+    assert response.status_code == 304
+    assert response.content == b""
+    assert upstream.send.await_count == 1
+
+def test_post_invalidates_users_entries(client, cache, upstream):
+    client.get("/chat/history/1", headers=AUTH_HEADERS)
+    client.post("/sentiment/report", json={"user_id": 1}, headers=AUTH_HEADERS)
+    assert upstream.send.await_count == 2
+    
+    client.post("/chat/message", json={"user_id": 1, "message": "hi"}, headers=AUTH_HEADERS)
+    client.get("/chat/history/1", headers=AUTH_HEADERS)
+    client.post("/sentiment/report", json={"user_id": 1}, headers=AUTH_HEADERS)
+    assert upstream.send.await_count == 5
+
+def test_cache_is_scoped_to_verified_user(client, cache, upstream):
+    # A fresh token for the same user shares that user's entries
+    client.get("/chat/history/1", headers=AUTH_HEADERS)
+    client.get("/chat/history/1", headers={"Authorization": f"Bearer {make_token(1, timedelta(minutes=5))}"})
+    assert upstream.send.await_count == 1
+
+def test_streamed_post_invalidates_after_body(client, cache):
+    # A history read while the reply streams, cached before the upstream stored it
+    async def handler(request):
+        async def events():
+            yield b'event: token\ndata: {"text": "Hi"}\n\n'
+            cache.set(("user:1", "history"), "user:1", cache.generation("user:1"), make_response(b"[]"), ttl=60)
+            yield b'event: done\ndata: {"message_id": 1}\n\n'
+        return httpx.Response(200, content=events(), headers={"content-type": "text/event-stream"})
+    
+    with patch("core.utils.get_client", return_value=httpx.AsyncClient(transport=httpx.MockTransport(handler))):
+        with client.stream("POST", "/chat/message/stream", json={"user_id": 1, "message": "Hi"}, headers=AUTH_HEADERS) as response:
+            response.read()
+    
+    assert response.status_code == 200
+    assert cache.get(("user:1", "history")) is None
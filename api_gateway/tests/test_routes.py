@@ -30,6 +30,7 @@ def test_register_routes(app):
     # Check for representative routes from each service
     assert "/auth/{path:path}" in route_paths
     assert "/chat/{path:path}" in route_paths
+    assert "/chat/message/stream" in route_paths
     assert "/sentiment/{path:path}" in route_paths
     assert "/voice/{path:path}" in route_paths
     assert "/video/{path:path}" in route_paths
\ No newline at end of file
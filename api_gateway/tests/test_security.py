@@ -0,0 +1,55 @@
+import pytest
+from datetime import timedelta
+from unittest.mock import patch, MagicMock, AsyncMock
+import httpx
+import jwt
+
+from core.security import verify_access_token, TokenError, _claims_cache
+from conftest import make_token
+
+@pytest.fixture
+def upstream():
+    mock_response = MagicMock()
+    mock_response.status_code = 200
+    mock_response.content = b"{}"
+    mock_response.headers = httpx.Headers({"content-type": "application/json"})
+    
+    mock_client = MagicMock()
+    mock_client.send = AsyncMock(return_value=mock_response)
+    mock_client.build_request = httpx.AsyncClient().build_request
+    with patch("core.utils.get_client", return_value=mock_client):
+        yield mock_client
+
+def test_verified_claims_are_cached():
+    token = make_token(7)
+    with patch("core.security.jwt.decode", wraps=jwt.decode) as decode:
+        assert verify_access_token(token)["user_id"] == 7
+        assert verify_access_token(token)["user_id"] == 7
+    assert decode.call_count == 1
+    assert token in _claims_cache
+
+def test_expired_and_forged_tokens_are_rejected():
+    with pytest.raises(TokenError, match="expired"):
+        verify_access_token(make_token(1, timedelta(minutes=-1)))
+    
+    forged = jwt.encode({"user_id": 1, "exp": 9999999999}, "not-the-secret", algorithm="HS256")
+    with pytest.raises(TokenError, match="Invalid"):
+        verify_access_token(forged)
+
+def test_unauthenticated_requests_never_reach_upstream(client, upstream):
+    assert client.get("/chat/history/1").status_code == 401
+    response = client.get("/chat/history/1", headers={"Authorization": "Bearer garbage"})
+    assert response.status_code == 401
+    assert response.headers["WWW-Authenticate"] == "Bearer"
+    upstream.send.assert_not_called()
+
+def test_login_does_not_require_a_token(client, upstream):
+    assert client.post("/auth/login", json={"email": "a@b.c", "password": "x"}).status_code == 200
+
+def test_trusted_user_id_header_is_injected(client, upstream):
+    headers = {"Authorization": f"Bearer {make_token(42)}", "X-User-Id": "1"}
+    client.post("/chat/message", json={"message": "hi"}, headers=headers)
+    
+    forwarded = upstream.send.await_args.args[0]
+    # The client-supplied value is replaced by the verified one
+    assert forwarded.headers.get_list("x-user-id") == ["42"]
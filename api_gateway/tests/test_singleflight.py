@@ -0,0 +1,74 @@
+import asyncio
+import httpx
+from unittest.mock import patch, MagicMock
+
+from core.app import create_app
+from core.routes import register_routes
+from core.singleflight import SingleFlight
+from core.cache import ResponseCache
+
+def test_concurrent_calls_share_one_execution():
+    calls = []
+    
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+    
+    async def scenario():
+        flight = SingleFlight()
+        results = await asyncio.gather(*(flight.do("key", fetch) for _ in range(5)))
+        assert [result for result, _ in results] == ["result"] * 5
+        assert [shared for _, shared in results].count(False) == 1
+        assert len(flight) == 0
+        
+        # Once finished, the next call runs again
+        await flight.do("key", fetch)
+    
+    asyncio.run(scenario())
+    assert len(calls) == 2
+
+def test_cancelled_leader_does_not_cancel_followers():
+    async def fetch():
+        await asyncio.sleep(0.01)
+        return "result"
+    
+    async def scenario():
+        flight = SingleFlight()
+        leader = asyncio.create_task(flight.do("key", fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do("key", fetch))
+        await asyncio.sleep(0)
+        leader.cancel()
+        assert await follower == ("result", True)
+    
+    asyncio.run(scenario())
+
+def test_identical_gets_reach_upstream_once(auth_headers):
+    app = create_app()
+    register_routes(app)
+    
+    async def send(upstream_request, stream=False):
+        await asyncio.sleep(0.05)
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.content = b'{"messages": []}'
+        mock_response.headers = httpx.Headers({"content-type": "application/json"})
+        return mock_response
+    
+    mock_client = MagicMock()
+    mock_client.send = MagicMock(side_effect=send)
+    
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://gateway") as client:
+            return await asyncio.gather(
+                *(client.get("/chat/history/1", headers=auth_headers()) for _ in range(5))
+            )
+    
+    with patch("core.utils.get_client", return_value=mock_client), \
+         patch("core.utils.response_cache", ResponseCache(max_entries=16)):
+        responses = asyncio.run(scenario())
+    
+    assert all(response.json() == {"messages": []} for response in responses)
+    assert mock_client.send.call_count == 1
@@ -1,9 +1,11 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from core.metrics import instrument_engine
 
 SQLALCHEMY_DATABASE_URL = "postgresql://user:pass@db:5432/wellness"
 
 engine = create_engine(SQLALCHEMY_DATABASE_URL, echo=True)
+instrument_engine(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def get_db():
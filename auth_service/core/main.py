@@ -4,6 +4,7 @@ from sqlalchemy.orm import Session
 from core.models import Base, User, RefreshToken
 from core.schemas import RegisterRequest, LoginRequest, RefreshRequest
 from core.database import get_db, engine
+from core.metrics import instrument_app
 from core.security import (
     create_access_token,
     create_refresh_token,
@@ -14,6 +15,7 @@ from core.security import (
 from datetime import datetime, timedelta
 
 app = FastAPI()
+instrument_app(app)
 
 Base.metadata.create_all(bind=engine)
 
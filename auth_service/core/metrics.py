@@ -0,0 +1,121 @@
+import time
+from contextlib import contextmanager
+from fastapi import FastAPI, Response
+from starlette.routing import Match
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+# Latency buckets in seconds, wide enough for LLM and media processing calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+REQUESTS = Counter(
+    "http_requests_total",
+    "HTTP requests handled, by route template and status code",
+    ["method", "route", "status"],
+)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request until its response body has been sent",
+    ["method", "route"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being handled",
+    ["method", "route"],
+)
+DEPENDENCY_LATENCY = Histogram(
+    "dependency_duration_seconds",
+    "Time spent waiting on a dependency (database, model, upstream service)",
+    ["dependency", "operation"],
+    buckets=LATENCY_BUCKETS,
+)
+DEPENDENCY_ERRORS = Counter(
+    "dependency_errors_total",
+    "Calls to a dependency that raised an error",
+    ["dependency", "operation"],
+)
+
+@contextmanager
+def track_dependency(dependency: str, operation: str = "call"):
+    """Time a block of code as a call to the given dependency"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        DEPENDENCY_ERRORS.labels(dependency, operation).inc()
+        raise
+    finally:
+        DEPENDENCY_LATENCY.labels(dependency, operation).observe(time.perf_counter() - start)
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request counts, latency and in-flight requests.
+    Requests are labelled with their route template (e.g. /chat/history/{user_id})
+    rather than the raw path, so label cardinality stays bounded.
+    """
+
+    def __init__(self, app, router):
+        self.app = app
+        self.router = router
+
+    def _route(self, scope) -> str:
+        for route in self.router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", "unmatched")
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = self._route(scope)
+        status = 500
+        start = time.perf_counter()
+        in_flight = REQUESTS_IN_FLIGHT.labels(method, route)
+        in_flight.inc()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_flight.dec()
+            REQUEST_LATENCY.labels(method, route).observe(time.perf_counter() - start)
+            REQUESTS.labels(method, route, str(status)).inc()
+
+def metrics_endpoint():
+    """Expose all metrics in the Prometheus text format"""
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+def instrument_app(app: FastAPI):
+    """Record request metrics for every route and serve them on /metrics"""
+    app.add_middleware(MetricsMiddleware, router=app.router)
+    app.add_api_route("/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False)
+
+def instrument_engine(engine):
+    """Time every query executed through a SQLAlchemy engine as a 'db' dependency"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_times", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _record_query_time(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info["query_start_times"].pop()
+        operation = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else "query"
+        DEPENDENCY_LATENCY.labels("db", operation).observe(time.perf_counter() - start)
+
+    @event.listens_for(engine, "handle_error")
+    def _record_query_error(exception_context):
+        start_times = exception_context.connection.info.get("query_start_times") if exception_context.connection else None
+        if start_times:
+            start_times.pop()
+        DEPENDENCY_ERRORS.labels("db", "query").inc()
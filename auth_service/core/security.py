@@ -1,19 +1,24 @@
+import os
 import bcrypt
 import jwt
 import secrets
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from core.models import RefreshToken
+from core.metrics import track_dependency
 
-SECRET_KEY = "YOUR_SECRET_KEY"
+# Shared with the API gateway, which verifies access tokens locally
+SECRET_KEY = os.getenv("JWT_SECRET_KEY", "YOUR_SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 def get_password_hash(password: str) -> str:
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    with track_dependency("bcrypt", "hash"):
+        return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt.hashpw(plain_password.encode("utf-8"), hashed_password.encode("utf-8")).decode("utf-8") == hashed_password
+    with track_dependency("bcrypt", "verify"):
+        return bcrypt.hashpw(plain_password.encode("utf-8"), hashed_password.encode("utf-8")).decode("utf-8") == hashed_password
 
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
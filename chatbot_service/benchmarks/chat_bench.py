@@ -0,0 +1,144 @@
+"""
+Offline chat pipeline benchmark.
+
+Drives POST /chat/message through the whole service (sentiment analysis,
+reply generation, persistence) with the stub LLM backend standing in for the
+model, so it needs no network access or API key. The stub's latency and the
+backend's concurrency limits are configurable, which shows how the pipeline
+behaves when model calls are slow or rate limited.
+
+Run from the chatbot_service directory:
+
+    python -m benchmarks.chat_bench --turns 200 --concurrency 16 --llm-latency-ms 200
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import contextlib
+from unittest.mock import patch
+
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from core.main import app, known_user_ids
+from core.database import Base, get_db
+from core.llm import StubBackend
+from core.sessions import SessionStore
+from core.sentiment_cache import SentimentCache
+from .persistence_bench import percentile
+
+# A mix of messages the local sentiment scorer is sure about and ones it hands to the model
+MESSAGES = [
+    "I'm so anxious about my exams",
+    "Today was a strange day",
+    "I feel really lonely since the baby was born",
+    "Can we talk about what happened at work?",
+]
+
+async def drive(client: httpx.AsyncClient, turns: int, concurrency: int, users: int) -> dict:
+    latencies = []
+    statuses = {}
+    counter = iter(range(turns))
+
+    async def worker():
+        for i in counter:
+            body = {"user_id": i % users + 1, "message": f"{MESSAGES[i % len(MESSAGES)]} ({i})"}
+            start = time.perf_counter()
+            response = await client.post("/chat/message", json=body)
+            latencies.append(time.perf_counter() - start)
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "turns": turns,
+        "concurrency": concurrency,
+        "statuses": dict(sorted(statuses.items())),
+        "turns_per_second": round(turns / elapsed, 1),
+        "latency_ms": {f"p{p}": round(percentile(latencies, p) * 1000, 3) for p in (50, 95, 99)},
+    }
+
+async def run_benchmark(database_url: str, turns: int = 200, concurrency: int = 16, users: int = 20,
+                        llm_latency: float = 0.2, llm_concurrency: int = 8, llm_queue: int = 32) -> dict:
+    """Run the turns against a fresh database and the stub backend and return the report"""
+    engine = create_engine(database_url, connect_args={"check_same_thread": False} if database_url.startswith("sqlite") else {})
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    known_user_ids.clear()
+
+    def override_get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    backend = StubBackend(latency=llm_latency, max_concurrency=llm_concurrency, max_queue=llm_queue)
+    try:
+        with patch.dict(app.dependency_overrides, {get_db: override_get_db}), \
+                patch("core.chatbot.llm", backend), \
+                patch("core.chatbot.chat_sessions", SessionStore()), \
+                patch("core.chatbot.sentiment_cache", SentimentCache()):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://chatbot", timeout=120) as client:
+                result = await drive(client, turns, concurrency, users)
+        Base.metadata.drop_all(bind=engine)
+    finally:
+        engine.dispose()
+
+    result["llm_calls"] = backend.calls
+    return {
+        "meta": {
+            "database": engine.dialect.name,
+            "config": {
+                "turns": turns,
+                "concurrency": concurrency,
+                "users": users,
+                "llm_latency_ms": llm_latency * 1000,
+                "llm_concurrency": llm_concurrency,
+                "llm_queue": llm_queue,
+            },
+        },
+        "results": result,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the chat pipeline offline with the stub LLM backend")
+    parser.add_argument("--database-url", help="database to run against; defaults to a temporary SQLite file")
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0, help="time each stub model call takes")
+    parser.add_argument("--llm-concurrency", type=int, default=8, help="model calls allowed at once")
+    parser.add_argument("--llm-queue", type=int, default=32, help="model calls allowed to wait for a slot")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    options = dict(turns=args.turns, concurrency=args.concurrency, users=args.users,
+                   llm_latency=args.llm_latency_ms / 1000, llm_concurrency=args.llm_concurrency, llm_queue=args.llm_queue)
+    # The service logs with print; keep stdout for the report
+    with contextlib.redirect_stdout(sys.stderr):
+        if args.database_url:
+            report = asyncio.run(run_benchmark(args.database_url, **options))
+        else:
+            with tempfile.TemporaryDirectory() as tmp:
+                report = asyncio.run(run_benchmark(f"sqlite:///{os.path.join(tmp, 'bench.db')}", **options))
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+class MicroBatcher:
+    """
+    Collects items submitted from many threads into batches and hands each
+    batch to `process` in one call. A batch is sent once it has max_size
+    items or `window` seconds after its first item arrived, whichever comes
+    first.
+    `process(items)` returns one result per item, in order; a result that is
+    an exception is raised to that item's caller only. Up to `workers`
+    batches are processed at the same time.
+    """
+
+    def __init__(self, process, window, max_size, workers=4, name="batch"):
+        self._process = process
+        self.window = window
+        self.max_size = max(1, max_size)
+        self._cond = threading.Condition()
+        # (item, future) pairs waiting for the next batch
+        self._pending = []
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._collector = None
+        self._name = name
+
+    def submit(self, item):
+        """Queue an item; the returned future resolves to its result"""
+        future = Future()
+        with self._cond:
+            self._pending.append((item, future))
+            if self._collector is None:
+                self._collector = threading.Thread(target=self._collect, name=f"{self._name}-collector", daemon=True)
+                self._collector.start()
+            self._cond.notify()
+        return future
+
+    def _collect(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                # Give other callers until the window closes to join the batch
+                closes_at = time.monotonic() + self.window
+                while len(self._pending) < self.max_size:
+                    left = closes_at - time.monotonic()
+                    if left <= 0:
+                        break
+                    self._cond.wait(left)
+                batch = self._pending[:self.max_size]
+                del self._pending[:self.max_size]
+            self._executor.submit(self._run, batch)
+
+    def _run(self, batch):
+        try:
+            results = self._process([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f"Expected {len(batch)} results, got {len(results)}")
+        except Exception as e:
+            results = [e] * len(batch)
+        for (_, future), result in zip(batch, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
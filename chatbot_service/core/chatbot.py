@@ -1,8 +1,21 @@
 import os
 import re
+import threading
+import concurrent.futures
 from datetime import datetime
 from dotenv import load_dotenv
 
+from .metrics import track_dependency, SENTIMENT_ANALYSES, SENTIMENT_BATCH_SIZE
+from .deadline import Deadline, DeadlineExceeded
+from .sessions import chat_sessions, new_session
+from .sentiment import score_sentiment, SENTIMENT_LABELS
+from .batching import MicroBatcher
+from .llm import LLM_BACKEND, GeminiBackend, StubBackend
+from .hedging import Hedger, LLM_HEDGING
+from .sentiment_cache import sentiment_cache
+from .web_search import WebSearchClient
+from .context import build_context, needs_summary, fold_history, drop_folded, SUMMARY_MAX_TOKENS
+
 # Try to load from .env but don't fail if it doesn't exist
 try:
     load_dotenv(verbose=True)
@@ -109,6 +122,32 @@ Overwhelmed: [score]
 Only provide the scores in this exact format. Be precise and clinical in your analysis.
 """
 
+SENTIMENT_BATCH_PROMPT = """
+You are an expert mental health sentiment analyzer. Analyze each of the following user messages
+separately and provide detailed emotional sentiment scores for every one of them.
+
+For each message, provide scores from 0-10 for these emotional states:
+{labels}
+
+Format your response EXACTLY like this, with one block per message, in the order given:
+
+Message 1:
+{score_lines}
+
+Message 2:
+{score_lines}
+
+Only provide the scores in this exact format. Be precise and clinical in your analysis.
+"""
+
+SUMMARY_PROMPT = """
+You keep a running summary of a conversation between a user and Dr. Sarah, a CBT therapist.
+Update the current summary with the new conversation turns. Keep what matters for continuing
+the conversation: the user's situation and concerns, how they have been feeling, coping
+strategies discussed and how they worked, and any safety concerns. Write in the third person,
+as plain prose, in no more than {max_words} words. Only provide the updated summary.
+"""
+
 # Chat model configuration
 generation_config = {
     "temperature": 0.4,
@@ -117,30 +156,54 @@ generation_config = {
     "max_output_tokens": 2048,
 }
 
-# Initialize models if available
-therapy_model = None
-sentiment_model = None
+# Generation settings of each model configuration
+generation_configs = {
+    "chat": generation_config,
+    "sentiment": {
+        "temperature": 0.1,
+        "top_p": 1,
+        "top_k": 1,
+        "max_output_tokens": 1024,
+    },
+    "summary": {
+        "temperature": 0.2,
+        "top_p": 1,
+        "top_k": 1,
+        "max_output_tokens": SUMMARY_MAX_TOKENS,
+    },
+}
 
-if HAS_GENAI and API_KEY:
-    print("Setting up Gemini models")
-    # For older versions of the API, we'll handle the history ourselves
-    therapy_model = genai.GenerativeModel(
-        model_name='gemini-1.5-flash-latest',
-        generation_config=generation_config
-    )
+def create_llm_backend():
+    """Backend serving every model call, or None if no model is available"""
+    if LLM_BACKEND == "stub":
+        print("Using the local stub LLM backend")
+        return StubBackend()
+    if HAS_GENAI and API_KEY:
+        print("Setting up Gemini models")
+        # For older versions of the API, we'll handle the history ourselves
+        return GeminiBackend(genai, 'gemini-1.5-flash-latest', generation_configs)
+    return None
 
-    sentiment_model = genai.GenerativeModel(
-        model_name='gemini-1.5-flash-latest',
-        generation_config={
-            "temperature": 0.1,
-            "top_p": 1,
-            "top_k": 1,
-            "max_output_tokens": 1024,
-        }
-    )
+llm = create_llm_backend()
 
-# User chat sessions cache
-user_chat_sessions = {}
+# Slow replies and sentiment calls get a backup request when hedging is enabled
+llm_hedger = Hedger() if LLM_HEDGING else None
+
+def hedged(kind, fn, timeout=None):
+    """fn(timeout), hedged when enabled"""
+    if llm_hedger is None:
+        return fn(timeout)
+    return llm_hedger.call(kind, fn, timeout)
+
+# Web search is optional: it only runs when the request's deadline leaves
+# enough time for it on top of the time reserved for the model's reply
+WEB_SEARCH_TIMEOUT = float(os.environ.get("WEB_SEARCH_TIMEOUT", "15"))
+WEB_SEARCH_MIN_TIMEOUT = float(os.environ.get("WEB_SEARCH_MIN_TIMEOUT", "2"))
+LLM_REPLY_RESERVE = float(os.environ.get("LLM_REPLY_RESERVE", "10"))
+
+def llm_timeout(deadline: Deadline = None):
+    """Time a model call may take: what is left of the deadline, if there is one"""
+    return deadline.remaining() if deadline else None
 
 def parse_sentiment_response(sentiment_text):
     """Parse the sentiment analysis response into a dictionary of emotion scores."""
@@ -159,77 +222,133 @@ def parse_sentiment_response(sentiment_text):
                 print(f"Parsing error on line '{line}': {e}")
     return sentiment_data
 
-def get_sentiment_analysis(message):
-    """Analyze the sentiment of a user message."""
-    if not HAS_GENAI or not API_KEY or not sentiment_model:
-        print("Sentiment analysis not available")
-        # Return default values for testing
-        return {
-            "Happy": 0.4, "Sad": 0.3, "Depressed": 0.2, "Anxious": 0.6, 
-            "Angry": 0.1, "Hopeful": 0.5, "Frustrated": 0.4, "Calm": 0.3,
-            "Stressed": 0.6, "Crisis/Suicidal": 0.0, "Lonely": 0.4, 
-            "Confident": 0.3, "Fearful": 0.5, "Grateful": 0.4, "Overwhelmed": 0.5
-        }
+def parse_sentiment_batch_response(sentiment_text, count):
+    """Split a batched sentiment response into one score dictionary per message, empty if missing."""
+    sections = [[] for _ in range(count)]
+    current = None
+    for line in sentiment_text.strip().split('\n'):
+        header = re.match(r'^[\W_]*message\s*#?\s*(\d+)[\W_]*$', line.strip(), re.IGNORECASE)
+        if header:
+            index = int(header.group(1)) - 1
+            current = index if 0 <= index < count else None
+        elif current is not None:
+            sections[current].append(line)
+    return [parse_sentiment_response('\n'.join(lines)) for lines in sections]
+
+def sentiment_batch_prompt():
+    return SENTIMENT_BATCH_PROMPT.format(
+        labels="\n".join(f"- {label}" for label in SENTIMENT_LABELS),
+        score_lines="\n".join(f"{label}: [score]" for label in SENTIMENT_LABELS),
+    )
+
+def analyze_sentiment_batch(requests):
+    """
+    Score a batch of (message, deadline) pairs with a single LLM call.
+    Returns the scores of each message, or the error for messages the
+    response had no scores for.
+    """
+    messages = [message for message, _ in requests]
+    # The call may run until the latest deadline; callers with earlier ones stop waiting on their own
+    remaining = [llm_timeout(deadline) for _, deadline in requests]
+    timeout = None if None in remaining else max(remaining)
+
+    if len(messages) == 1:
+        prompt = f"{SENTIMENT_ANALYSIS_PROMPT}\n\nAnalyze this message: {messages[0]}"
+    else:
+        numbered = "\n\n".join(f"Message {i}: {message}" for i, message in enumerate(messages, 1))
+        prompt = f"{sentiment_batch_prompt()}\n\nAnalyze these messages:\n\n{numbered}"
+
+    SENTIMENT_BATCH_SIZE.observe(len(messages))
+    with track_dependency("llm", "sentiment"):
+        response_text = hedged("sentiment", lambda timeout: llm.generate("sentiment", prompt, timeout=timeout), timeout)
+
+    if len(messages) == 1:
+        results = [parse_sentiment_response(response_text)]
+    else:
+        results = parse_sentiment_batch_response(response_text, len(messages))
+    return [
+        scores if scores else ValueError(f"No sentiment scores for message {i} in response: {response_text!r}")
+        for i, scores in enumerate(results, 1)
+    ]
+
+# Concurrent LLM sentiment requests arriving within the window share one call
+SENTIMENT_BATCH_WINDOW = float(os.environ.get("SENTIMENT_BATCH_WINDOW_MS", "25")) / 1000
+SENTIMENT_BATCH_MAX_SIZE = int(os.environ.get("SENTIMENT_BATCH_MAX_SIZE", "8"))
+SENTIMENT_BATCH_WORKERS = int(os.environ.get("SENTIMENT_BATCH_WORKERS", "4"))
+
+sentiment_batcher = MicroBatcher(
+    analyze_sentiment_batch,
+    window=SENTIMENT_BATCH_WINDOW,
+    max_size=SENTIMENT_BATCH_MAX_SIZE,
+    workers=SENTIMENT_BATCH_WORKERS,
+    name="sentiment-batch",
+)
+
+def get_sentiment_analysis(message, deadline: Deadline = None):
+    """
+    Analyze the sentiment of a user message.
+    Messages are scored locally first; the LLM is only asked when the local
+    scorer is unsure or the message shows signs of a crisis, batched with
+    other messages waiting for it. The local scores are used whenever the LLM
+    can't be. Scores are cached, so a repeated message is only scored once.
+    """
+    cached = sentiment_cache.get(message)
+    if cached is not None:
+        return cached
+    
+    local = score_sentiment(message)
+    if not local.needs_llm:
+        SENTIMENT_ANALYSES.labels("local").inc()
+        sentiment_cache.set(message, local.scores)
+        return local.scores
+    
+    if llm is None:
+        print("LLM sentiment analysis not available, using local scores")
+        SENTIMENT_ANALYSES.labels("local").inc()
+        return local.scores
     
     try:
-        # Include the sentiment prompt in the message
-        full_prompt = f"{SENTIMENT_ANALYSIS_PROMPT}\n\nAnalyze this message: {message}"
-        response = sentiment_model.generate_content(full_prompt)
-        return parse_sentiment_response(response.text)
+        # Batched with other messages waiting for the LLM at the same time
+        future = sentiment_batcher.submit((message, deadline))
+        sentiment_data = future.result(timeout=deadline.remaining() if deadline else None)
+        SENTIMENT_ANALYSES.labels("llm").inc()
+        sentiment_cache.set(message, sentiment_data)
+        return sentiment_data
     except Exception as e:
-        print(f"Sentiment analysis error: {e}")
-        # Return default values on error
-        return {
-            "Happy": 0.4, "Sad": 0.3, "Depressed": 0.2, "Anxious": 0.6, 
-            "Angry": 0.1, "Hopeful": 0.5, "Frustrated": 0.4, "Calm": 0.3,
-            "Stressed": 0.6, "Crisis/Suicidal": 0.0, "Lonely": 0.4, 
-            "Confident": 0.3, "Fearful": 0.5, "Grateful": 0.4, "Overwhelmed": 0.5
-        }
+        print(f"Sentiment analysis error, using local scores: {e}")
+        SENTIMENT_ANALYSES.labels("local").inc()
+        return local.scores
 
-import concurrent.futures
-import time
+def create_web_search_client():
+    """Shared search client, or None if the Custom Search API can't be used"""
+    if not (HAS_GOOGLE_API and SEARCH_API_KEY and SEARCH_ENGINE_ID):
+        return None
+    return WebSearchClient(lambda: build("customsearch", "v1", developerKey=SEARCH_API_KEY), SEARCH_ENGINE_ID)
+
+web_search_client = create_web_search_client()
 
-def get_web_results(query, num_results=3):
+def get_web_results(query, num_results=3, timeout=WEB_SEARCH_TIMEOUT):
     """Search the web for relevant resources using Google's Custom Search API."""
     # Check if official API is available
-    if HAS_GOOGLE_API and SEARCH_API_KEY and SEARCH_ENGINE_ID:
+    if web_search_client is not None:
         try:
             print(f"Searching web using Google API for: {query}")
             
-            # Create service object for Google Custom Search API
-            service = build("customsearch", "v1", developerKey=SEARCH_API_KEY)
-            
             # Add specific health-related terms to focus the search
             if "depression" in query.lower() or "anxiety" in query.lower() or "mental health" in query.lower():
                 search_query = f"{query} medical resource"
             else:
                 search_query = query
-                
-            # Execute the search with a timeout using concurrent.futures
-            def execute_search():
-                try:
-                    result = service.cse().list(q=search_query, cx=SEARCH_ENGINE_ID, num=num_results).execute()
-                    return result
-                except Exception as e:
-                    print(f"Error in execute_search: {e}")
-                    return None
             
-            # Use concurrent.futures to implement timeout
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                future = executor.submit(execute_search)
-                try:
-                    result = future.result(timeout=15)  # 15 second timeout
-                    
-                    if result and "items" in result:
-                        urls = [item["link"] for item in result["items"]]
-                        print(f"Found {len(urls)} results using Google API")
-                        return urls
-                    else:
-                        print("No results found using Google API")
-                except concurrent.futures.TimeoutError:
-                    print("Search operation timed out")
-                    future.cancel()
-                    raise TimeoutError("Search operation timed out")
+            # Cached and identical concurrent searches are shared; a timed out
+            # search keeps running in the background and fills the cache
+            urls = web_search_client.search(search_query, num_results, timeout=timeout)
+            if urls:
+                print(f"Found {len(urls)} results using Google API")
+                return urls
+            print("No results found using Google API")
+        except TimeoutError:
+            print("Search operation timed out")
         except HttpError as e:
             print(f"Google API search error: {e}")
         except Exception as e:
@@ -269,48 +388,176 @@ def get_web_results(query, num_results=3):
             "https://www.psychiatry.org/patients-families"
         ]
 
+# Messages mentioning any of these might benefit from web search
+SEARCH_KEYWORDS = ["resources", "information", "help", "find", "search", "link", "website", "article"]
+
+RESOURCES_NOTE = "[Note: I will provide relevant resources to the user after your response, so please acknowledge that you can help with finding resources but don't list specific websites in your response.]"
+
+def wants_resources(message):
+    """Whether the message might benefit from web search."""
+    return any(keyword in message.lower() for keyword in SEARCH_KEYWORDS)
+
+def web_search_timeout(deadline: Deadline):
+    """
+    Time the web search may take, or None if the deadline leaves too little
+    time for it on top of the reply.
+    """
+    remaining = deadline.remaining()
+    if remaining is None:
+        return WEB_SEARCH_TIMEOUT
+    timeout = min(WEB_SEARCH_TIMEOUT, remaining - LLM_REPLY_RESERVE)
+    if timeout < WEB_SEARCH_MIN_TIMEOUT:
+        print(f"Skipping web search, only {remaining:.1f}s left")
+        return None
+    return timeout
+
+def format_resources(search_results):
+    """Resource list appended to a reply, with a clear visual separator"""
+    text = "\n\n---\n\n**RESOURCES**\n\nHere are some helpful resources I found for you:\n"
+    for i, url in enumerate(search_results, 1):
+        text += f"{i}. {url}\n"
+    return text
+
+# Stands in for the model's reply to the system prompt, so that priming a
+# session does not take a model call
+DR_SARAH_ACKNOWLEDGEMENT = "Understood. I am Dr. Sarah, and I will follow these directives in every reply."
+
+def primed_history():
+    """The system prompt and its acknowledgement, pinned at the start of every context"""
+    return [
+        {"role": "user", "text": DR_SARAH_PROMPT},
+        {"role": "model", "text": DR_SARAH_ACKNOWLEDGEMENT},
+    ]
+
+def history_from_messages(messages):
+    """
+    Chat history built from stored ChatMessage rows, oldest first.
+    Consecutive messages from the same side are merged since turns have to
+    alternate, and the history starts with a user turn and ends on a bot
+    turn so it fits between the system prompt and the next user message.
+    """
+    history = []
+    for msg in messages:
+        role = "model" if msg.is_bot else "user"
+        if not history and role == "model":
+            continue
+        if history and role == history[-1]["role"]:
+            history[-1] = {"role": role, "text": f"{history[-1]['text']}\n\n{msg.message_text}"}
+        else:
+            history.append({"role": role, "text": msg.message_text})
+    if history and history[-1]["role"] == "user":
+        history.pop()
+    return history
+
+def get_session(user_id, deadline: Deadline):
+    """
+    Get the user's chat session. Sessions evicted from memory are restored
+    from the database.
+    """
+    deadline.check("calling the model")
+    session = chat_sessions.get(user_id)
+    if session is None:
+        print(f"Creating new chat session for user {user_id}")
+        session = new_session()
+    return session
+
+def chat_context(session):
+    """History a reply is generated from: the pinned system prompt and the session's budgeted context"""
+    return build_context(primed_history(), session)
+
+def summarize_turns(summary, turns):
+    """Rolling summary updated with the given turns"""
+    transcript = "\n".join(
+        f"{'Dr. Sarah' if turn['role'] == 'model' else 'User'}: {turn['text']}" for turn in turns
+    )
+    prompt = (
+        f"{SUMMARY_PROMPT.format(max_words=SUMMARY_MAX_TOKENS * 3 // 4)}\n\n"
+        f"Current summary:\n{summary or '(none yet)'}\n\n"
+        f"New conversation turns:\n{transcript}"
+    )
+    with track_dependency("llm", "summary"):
+        return llm.generate("summary", prompt)
+
+# Summaries are refreshed off the request path, one at a time per user
+summary_executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+summaries_in_progress = set()
+summaries_lock = threading.Lock()
+
+def refresh_summary(user_id):
+    """Fold the older turns of the user's session into its rolling summary."""
+    try:
+        session = chat_sessions.get(user_id)
+        if session is None or not needs_summary(session):
+            return
+        folded, summary = fold_history(session, summarize_turns)
+        if folded:
+            # Turns added meanwhile are kept; only the folded ones are dropped
+            chat_sessions.update(user_id, lambda current: drop_folded(current, folded, summary))
+    except Exception as e:
+        print(f"Error refreshing summary for user {user_id}: {e}")
+    finally:
+        with summaries_lock:
+            summaries_in_progress.discard(user_id)
+
+def record_turn(user_id, session, message, reply):
+    """Add an exchange to the user's session and refresh its summary if it grew too long"""
+    turns = [{"role": "user", "text": message}, {"role": "model", "text": reply}]
+    updated = chat_sessions.update(user_id, lambda current: {**current, "history": current["history"] + turns})
+    if updated is None:
+        updated = {**session, "history": session["history"] + turns}
+        chat_sessions.put(user_id, updated)
+    
+    if llm is not None and needs_summary(updated):
+        with summaries_lock:
+            if user_id in summaries_in_progress:
+                return
+            summaries_in_progress.add(user_id)
+        summary_executor.submit(refresh_summary, user_id)
+
 # Update the get_bot_response function to better maintain context
-def get_bot_response(user_id, message):
-    """Get a response from the chatbot for a user message."""
-    if not HAS_GENAI or not API_KEY or not therapy_model:
+def get_bot_response(user_id, message, deadline: Deadline = None):
+    """
+    Get a response from the chatbot for a user message.
+    Web search is skipped when the deadline leaves too little time for it,
+    and DeadlineExceeded is raised rather than calling the model too late.
+    """
+    deadline = deadline or Deadline()
+    if llm is None:
         print("Chatbot response not available")
         return "I'm sorry, I'm not able to respond right now. Please try again later."
     
     try:
         # Check if the message might benefit from web search
-        search_keywords = ["resources", "information", "help", "find", "search", "link", "website", "article"]
-        should_search = any(keyword in message.lower() for keyword in search_keywords)
+        should_search = wants_resources(message)
+        search_timeout = web_search_timeout(deadline) if should_search else None
+        should_search = search_timeout is not None
         
         search_results = []
-        
         if should_search:
             try:
                 print("Attempting web search...")
-                search_results = get_web_results(message)
+                search_results = get_web_results(message, timeout=search_timeout)
             except Exception as e:
                 print(f"Error during search: {e}")
                 # Continue without search results if there's an error
         
-        # Create or get a chat session for this user
-        if user_id not in user_chat_sessions:
-            print(f"Creating new chat session for user {user_id}")
-            chat = therapy_model.start_chat()
-            # Initialize with system prompt
-            chat.send_message(DR_SARAH_PROMPT)
-            user_chat_sessions[user_id] = chat
-        
-        chat_session = user_chat_sessions[user_id]
+        # Continue the user's chat from its stored session
+        session = get_session(user_id, deadline)
         
         # If we're going to search, add instructions to the user's message
         actual_message = message
         if should_search:
             # Add a note to the message to influence the model's response
-            actual_message = f"{message}\n\n[Note: I will provide relevant resources to the user after your response, so please acknowledge that you can help with finding resources but don't list specific websites in your response.]"
+            actual_message = f"{message}\n\n{RESOURCES_NOTE}"
         
         # Send the user message with potential instructions
         print(f"Sending message to model: {actual_message}")
-        response = chat_session.send_message(actual_message)
-        response_text = response.text
+        with track_dependency("llm", "chat"):
+            context = chat_context(session)
+            response_text = hedged(
+                "chat", lambda timeout: llm.chat(context, actual_message, timeout=timeout), llm_timeout(deadline)
+            )
+        record_turn(user_id, session, message, response_text)
         
         # If we have search results, append them to the response
         if search_results:
@@ -323,13 +570,50 @@ def get_bot_response(user_id, message):
                 # Replace the negative statement with a positive one
                 response_text = "I'd be happy to help you find some resources on that topic. Here's some information that might be helpful:\n\n" + response_text.split(".", 1)[1].strip() if "." in response_text else response_text
             
-            # Add the search results with a clear visual separator
-            response_text += "\n\n---\n\n**RESOURCES**\n\nHere are some helpful resources I found for you:\n"
-            for i, url in enumerate(search_results, 1):
-                response_text += f"{i}. {url}\n"
+            response_text += format_resources(search_results)
             
         return response_text
             
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        if deadline.expired():
+            raise DeadlineExceeded(f"Deadline passed while generating a reply: {e}")
+        print(f"Chatbot error: {e}")
+        return "I'm sorry, I encountered an error. Please try again."
+
+def stream_bot_response(user_id, message, with_resources=False, deadline: Deadline = None):
+    """
+    Yield the chatbot's reply to a user message piece by piece as the model
+    generates it. Web search is left to the caller, which can run it while
+    the reply streams; `with_resources` tells the model resources will follow.
+    """
+    deadline = deadline or Deadline()
+    if llm is None:
+        print("Chatbot response not available")
+        yield "I'm sorry, I'm not able to respond right now. Please try again later."
+        return
+    
+    streamed = False
+    try:
+        session = get_session(user_id, deadline)
+        actual_message = f"{message}\n\n{RESOURCES_NOTE}" if with_resources else message
+        
+        print(f"Streaming message to model: {actual_message}")
+        with track_dependency("llm", "chat_stream"):
+            parts = []
+            for text in llm.chat_stream(chat_context(session), actual_message, timeout=llm_timeout(deadline)):
+                streamed = True
+                parts.append(text)
+                yield text
+        record_turn(user_id, session, message, "".join(parts))
+    except DeadlineExceeded:
+        raise
     except Exception as e:
+        if deadline.expired():
+            raise DeadlineExceeded(f"Deadline passed while generating a reply: {e}")
+        if streamed:
+            # Part of the reply is already out; an apology can't replace it
+            raise
         print(f"Chatbot error: {e}")
-        return "I'm sorry, I encountered an error. Please try again."
\ No newline at end of file
+        yield "I'm sorry, I encountered an error. Please try again."
@@ -0,0 +1,86 @@
+import os
+
+# Token budget for the conversation sent with each turn (summary and recent
+# turns), on top of the pinned system prompt
+CONTEXT_MAX_TOKENS = int(os.environ.get("CONTEXT_MAX_TOKENS", "3000"))
+# When the history outgrows the budget, older turns are folded into the
+# summary until the verbatim part fits in this many tokens
+CONTEXT_RECENT_TOKENS = int(os.environ.get("CONTEXT_RECENT_TOKENS", "1500"))
+# Upper bound on the rolling summary itself
+SUMMARY_MAX_TOKENS = int(os.environ.get("SUMMARY_MAX_TOKENS", "500"))
+
+# Fixed reply to the summary turn, which keeps user and model turns alternating
+SUMMARY_ACKNOWLEDGEMENT = "Thank you, I will keep our earlier conversation in mind."
+
+def estimate_tokens(text):
+    """Cheap token estimate (about four characters per token) that needs no model call"""
+    return len(text) // 4 + 1
+
+def history_tokens(history):
+    return sum(estimate_tokens(turn["text"]) for turn in history)
+
+def truncate_to_tokens(text, max_tokens):
+    """Keep the end of `text` within roughly max_tokens"""
+    max_chars = max_tokens * 4
+    return text if len(text) <= max_chars else text[-max_chars:]
+
+def split_recent(history, max_tokens):
+    """
+    Split the history into older turns and the most recent ones that fit in
+    max_tokens. The recent part always starts with a user turn, so it can
+    follow the system prompt or summary exchange.
+    """
+    start = len(history)
+    used = 0
+    for i in range(len(history) - 1, -1, -1):
+        used += estimate_tokens(history[i]["text"])
+        if used > max_tokens:
+            break
+        if history[i]["role"] == "user":
+            start = i
+    return history[:start], history[start:]
+
+def summary_turns(summary):
+    """The rolling summary as a user/model exchange, or nothing without one"""
+    if not summary:
+        return []
+    return [
+        {"role": "user", "text": f"Summary of our conversation so far:\n{summary}"},
+        {"role": "model", "text": SUMMARY_ACKNOWLEDGEMENT},
+    ]
+
+def build_context(pinned, session, max_tokens=CONTEXT_MAX_TOKENS):
+    """
+    History to start a chat turn with: the pinned system prompt exchange,
+    the rolling summary and as many recent turns as the budget allows.
+    Turns beyond the budget that have not been summarized yet are left out,
+    so the prompt stays bounded however long the conversation gets.
+    """
+    summary = summary_turns(session.get("summary"))
+    _, recent = split_recent(session["history"], max(max_tokens - history_tokens(summary), 0))
+    return pinned + summary + recent
+
+def needs_summary(session, max_tokens=CONTEXT_MAX_TOKENS):
+    return history_tokens(session["history"]) > max_tokens
+
+def fold_history(session, summarize, keep_tokens=CONTEXT_RECENT_TOKENS):
+    """
+    Fold the turns older than the recent window into the rolling summary.
+    `summarize(summary, turns)` returns the updated summary; only the turns
+    new since the last refresh are passed to it.
+    Returns the folded turns and the new summary.
+    """
+    older, _ = split_recent(session["history"], keep_tokens)
+    if not older:
+        return [], session.get("summary", "")
+    summary = summarize(session.get("summary", ""), older)
+    return older, truncate_to_tokens(summary.strip(), SUMMARY_MAX_TOKENS)
+
+def drop_folded(session, folded, summary):
+    """
+    Session with the folded turns replaced by the new summary, or None if the
+    history changed in a way that no longer starts with those turns.
+    """
+    if session["history"][:len(folded)] != folded:
+        return None
+    return {"history": session["history"][len(folded):], "summary": summary}
@@ -0,0 +1,75 @@
+import time
+from typing import Optional
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# Remaining time budget in seconds set by the API gateway on every request
+DEADLINE_HEADER = "x-request-timeout"
+
+class DeadlineExceeded(Exception):
+    """Raised when a request runs out of time and its work should be abandoned"""
+
+class Deadline:
+    """
+    Point in time by which a request must be answered. A deadline without a
+    budget never expires, so requests that bypass the gateway behave as before.
+    """
+
+    def __init__(self, budget: Optional[float] = None, clock=time.monotonic):
+        self._clock = clock
+        self.expires_at = None if budget is None else clock() + max(budget, 0.0)
+
+    @classmethod
+    def from_header(cls, value: Optional[str]) -> "Deadline":
+        try:
+            return cls(float(value)) if value else cls()
+        except ValueError:
+            return cls()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, or None if the request has no deadline"""
+        if self.expires_at is None:
+            return None
+        return max(self.expires_at - self._clock(), 0.0)
+
+    def expired(self) -> bool:
+        return self.remaining() == 0.0
+
+    def allows(self, seconds: float) -> bool:
+        """Whether at least `seconds` of the budget are left"""
+        remaining = self.remaining()
+        return remaining is None or remaining >= seconds
+
+    def timeout(self, default: float) -> float:
+        """`default` capped at the time left"""
+        remaining = self.remaining()
+        return default if remaining is None else min(default, remaining)
+
+    def check(self, step: str):
+        """Raise DeadlineExceeded instead of starting `step` too late"""
+        if self.expired():
+            raise DeadlineExceeded(f"Deadline passed before {step}")
+
+    def headers(self) -> dict:
+        """Headers passing the remaining budget on to another service"""
+        remaining = self.remaining()
+        return {} if remaining is None else {DEADLINE_HEADER: f"{remaining:.3f}"}
+
+def request_deadline(request: Request) -> Deadline:
+    """FastAPI dependency returning the deadline of the current request"""
+    deadline = getattr(request.state, "deadline", None)
+    return deadline if deadline is not None else Deadline.from_header(request.headers.get(DEADLINE_HEADER))
+
+def install_deadlines(app: FastAPI):
+    """
+    Start every request's deadline as soon as it arrives, before its body is
+    read, and answer requests that ran out of time with a 504.
+    """
+    @app.middleware("http")
+    async def start_deadline(request: Request, call_next):
+        request.state.deadline = Deadline.from_header(request.headers.get(DEADLINE_HEADER))
+        return await call_next(request)
+
+    @app.exception_handler(DeadlineExceeded)
+    async def deadline_exceeded(request: Request, exc: DeadlineExceeded):
+        return JSONResponse(status_code=504, content={"detail": str(exc)})
@@ -0,0 +1,117 @@
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .metrics import LLM_HEDGES
+
+# Hedging is off unless enabled; every hedge is a second, billed model call
+LLM_HEDGING = os.environ.get("LLM_HEDGING", "false").lower() in ("1", "true", "yes")
+# A second request is sent once the first has taken longer than this percentile of recent calls
+LLM_HEDGE_PERCENTILE = float(os.environ.get("LLM_HEDGE_PERCENTILE", "95"))
+# At most this fraction of calls is hedged
+LLM_HEDGE_MAX_RATE = float(os.environ.get("LLM_HEDGE_MAX_RATE", "0.05"))
+# Recent call latencies the threshold is taken from, and how many are needed before hedging
+LLM_HEDGE_WINDOW = int(os.environ.get("LLM_HEDGE_WINDOW", "200"))
+LLM_HEDGE_MIN_SAMPLES = int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", "20"))
+# Never hedge sooner than this, however fast recent calls were
+LLM_HEDGE_MIN_DELAY = float(os.environ.get("LLM_HEDGE_MIN_DELAY_MS", "500")) / 1000
+LLM_HEDGE_WORKERS = int(os.environ.get("LLM_HEDGE_WORKERS", "32"))
+
+class Hedger:
+    """
+    Runs calls with a backup: when a call hasn't returned after the
+    `percentile` latency of recent calls of the same kind, an identical
+    second call is started and whichever succeeds first is returned. The
+    slower one is left to finish in the background, since model calls
+    can't be cancelled.
+
+    Hedges draw from a budget that grows by max_rate per call, so no more
+    than about max_rate of calls are hedged however slow the model gets.
+    Until min_samples latencies are known for a kind of call, it isn't hedged.
+    """
+
+    def __init__(self, percentile=LLM_HEDGE_PERCENTILE, max_rate=LLM_HEDGE_MAX_RATE, window=LLM_HEDGE_WINDOW,
+                 min_samples=LLM_HEDGE_MIN_SAMPLES, min_delay=LLM_HEDGE_MIN_DELAY, workers=LLM_HEDGE_WORKERS,
+                 clock=time.monotonic):
+        self.percentile = percentile
+        self.max_rate = max_rate
+        self.window = window
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self._budget = 1.0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm-hedge")
+
+    def threshold(self, kind):
+        """Seconds after which a call of this kind is hedged, or None while too few are known"""
+        with self._lock:
+            samples = sorted(self._latencies.get(kind, ()))
+        if len(samples) < self.min_samples:
+            return None
+        rank = max(1, -(-len(samples) * self.percentile // 100))
+        return max(self.min_delay, samples[int(rank) - 1])
+
+    def record(self, kind, latency):
+        with self._lock:
+            if kind not in self._latencies:
+                self._latencies[kind] = deque(maxlen=self.window)
+            self._latencies[kind].append(latency)
+
+    def _take_budget(self):
+        with self._lock:
+            if self._budget < 1:
+                return False
+            self._budget -= 1
+            return True
+
+    def call(self, kind, fn, timeout=None):
+        """
+        fn(timeout) with a hedge if it runs long. `timeout` is the time the
+        caller will wait overall; each attempt gets what is left of it.
+        Raises the first attempt's error if every attempt failed, and
+        TimeoutError if none finished in time.
+        """
+        started = self._clock()
+
+        def remaining():
+            return None if timeout is None else max(timeout - (self._clock() - started), 0.0)
+
+        def attempt():
+            attempt_started = self._clock()
+            result = fn(remaining())
+            self.record(kind, self._clock() - attempt_started)
+            return result
+
+        with self._lock:
+            self._budget = min(self._budget + self.max_rate, 1.0 + self.max_rate)
+        primary = self._executor.submit(attempt)
+        pending = {primary}
+
+        delay = self.threshold(kind)
+        if delay is not None and (timeout is None or delay < timeout):
+            done, _ = wait(pending, timeout=delay)
+            if not done:
+                if self._take_budget():
+                    LLM_HEDGES.labels(kind, "sent").inc()
+                    pending.add(self._executor.submit(attempt))
+                else:
+                    LLM_HEDGES.labels(kind, "over_budget").inc()
+
+        hedged = len(pending) > 1
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=remaining(), return_when=FIRST_COMPLETED)
+            if not done:
+                raise TimeoutError(f"No {kind} response within {timeout:.1f}s")
+            for future in done:
+                if future.exception() is None:
+                    if hedged:
+                        LLM_HEDGES.labels(kind, "won" if future is not primary else "lost").inc()
+                    return future.result()
+                if error is None or future is primary:
+                    error = future.exception()
+        raise error
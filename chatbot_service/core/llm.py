@@ -0,0 +1,188 @@
+import os
+import re
+import time
+import zlib
+import threading
+from contextlib import contextmanager
+
+from .metrics import LLM_WAITING, LLM_REJECTED
+
+# Which backend serves model calls: "gemini" or "stub" (offline, deterministic)
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "gemini")
+# Model calls running at once per backend; further calls wait in a bounded queue
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_QUEUE = int(os.environ.get("LLM_MAX_QUEUE", "32"))
+# Longest a call waits for its turn before giving up
+LLM_QUEUE_TIMEOUT = float(os.environ.get("LLM_QUEUE_TIMEOUT", "10"))
+# Time the stub backend takes per call
+LLM_STUB_LATENCY = float(os.environ.get("LLM_STUB_LATENCY_MS", "0")) / 1000
+
+class LLMBusy(Exception):
+    """Raised when a model call can't get a slot: the queue is full or the wait timed out"""
+
+class LLMBackend:
+    """
+    A source of model completions. Every call takes one of max_concurrency
+    slots for as long as it runs; calls beyond that wait in a queue of at
+    most max_queue, for at most queue_timeout (or their own timeout if
+    shorter), and fail with LLMBusy otherwise.
+
+    Histories are lists of {"role": "user" | "model", "text": ...} turns.
+    `model` names the configuration a completion uses ("chat", "sentiment"
+    or "summary"). Subclasses implement _generate, _chat and _chat_stream,
+    which get the time left for the call as `timeout` (None for no limit).
+    """
+
+    name = "llm"
+
+    def __init__(self, max_concurrency=LLM_MAX_CONCURRENCY, max_queue=LLM_MAX_QUEUE, queue_timeout=LLM_QUEUE_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self.waiting = 0
+
+    def generate(self, model, prompt, timeout=None):
+        """Completion of a single prompt"""
+        with self._slot(timeout) as remaining:
+            return self._generate(model, prompt, remaining)
+
+    def chat(self, history, message, timeout=None):
+        """Reply to `message` in a chat that went `history` so far"""
+        with self._slot(timeout) as remaining:
+            return self._chat(history, message, remaining)
+
+    def chat_stream(self, history, message, timeout=None):
+        """Like chat, yielding the reply piece by piece; the slot is held until the stream ends"""
+        with self._slot(timeout) as remaining:
+            yield from self._chat_stream(history, message, remaining)
+
+    @contextmanager
+    def _slot(self, timeout):
+        """Hold a call slot, yielding the part of `timeout` left after waiting for it"""
+        started = time.monotonic()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self.waiting >= self.max_queue:
+                    LLM_REJECTED.labels(self.name, "queue_full").inc()
+                    raise LLMBusy(f"{self.name}: {self.waiting} calls already waiting")
+                self.waiting += 1
+            LLM_WAITING.labels(self.name).inc()
+            try:
+                wait = self.queue_timeout if timeout is None else min(self.queue_timeout, timeout)
+                acquired = self._slots.acquire(timeout=wait)
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+                LLM_WAITING.labels(self.name).dec()
+            if not acquired:
+                LLM_REJECTED.labels(self.name, "queue_timeout").inc()
+                raise LLMBusy(f"{self.name}: no free slot after {wait:.1f}s")
+        try:
+            yield None if timeout is None else max(timeout - (time.monotonic() - started), 0.0)
+        finally:
+            self._slots.release()
+
+    def _generate(self, model, prompt, timeout):
+        raise NotImplementedError
+
+    def _chat(self, history, message, timeout):
+        raise NotImplementedError
+
+    def _chat_stream(self, history, message, timeout):
+        raise NotImplementedError
+
+def to_gemini_history(history):
+    """Chat history in the form Gemini's start_chat expects"""
+    return [{"role": turn["role"], "parts": [turn["text"]]} for turn in history]
+
+class GeminiBackend(LLMBackend):
+    """Google Gemini models, one per configuration in `generation_configs`"""
+
+    name = "gemini"
+
+    def __init__(self, genai, model_name, generation_configs, **limits):
+        super().__init__(**limits)
+        self._models = {
+            model: genai.GenerativeModel(model_name=model_name, generation_config=config)
+            for model, config in generation_configs.items()
+        }
+
+    @staticmethod
+    def _request_options(timeout):
+        """Request options that make a call give up when its time is up"""
+        return None if timeout is None else {"timeout": timeout}
+
+    def _generate(self, model, prompt, timeout):
+        return self._models[model].generate_content(prompt, request_options=self._request_options(timeout)).text
+
+    def _chat(self, history, message, timeout):
+        chat = self._models["chat"].start_chat(history=to_gemini_history(history))
+        return chat.send_message(message, request_options=self._request_options(timeout)).text
+
+    def _chat_stream(self, history, message, timeout):
+        chat = self._models["chat"].start_chat(history=to_gemini_history(history))
+        for chunk in chat.send_message(message, stream=True, request_options=self._request_options(timeout)):
+            if chunk.text:
+                yield chunk.text
+
+def stub_response(model, prompt):
+    """
+    Deterministic text for a prompt, shaped like what the real model would
+    return: score templates ("Label: [score]") are filled in for every
+    "Message N:" in the prompt, and chat gets a short reply quoting the
+    message.
+    """
+    labels = list(dict.fromkeys(re.findall(r"^\s*(\S[^:\n]*): \[score\]\s*$", prompt, re.MULTILINE)))
+    if labels:
+        messages = re.findall(r"^Message (\d+): (.*)$", prompt, re.MULTILINE)
+        blocks = messages or [("", prompt)]
+        lines = []
+        for number, text in blocks:
+            if number:
+                lines.append(f"Message {number}:")
+            lines.extend(f"{label}: {zlib.crc32(f'{label}|{text}'.encode()) % 11}" for label in labels)
+            lines.append("")
+        return "\n".join(lines).strip()
+    if model == "summary":
+        return "The user and Dr. Sarah talked about how the user has been feeling."
+    words = prompt.split()
+    quoted = " ".join(words[:8]) + ("..." if len(words) > 8 else "")
+    return f"I hear you. You said: \"{quoted}\" Can you tell me more about how that made you feel?"
+
+class StubBackend(LLMBackend):
+    """
+    Offline backend for tests and benchmarks: every call takes `latency`
+    seconds and answers with `respond(model, prompt)`, by default
+    stub_response. No network access is needed.
+    """
+
+    name = "stub"
+
+    def __init__(self, latency=LLM_STUB_LATENCY, respond=stub_response, **limits):
+        super().__init__(**limits)
+        self.latency = latency
+        self._respond = respond
+        self.calls = 0
+
+    def _wait(self, timeout):
+        self.calls += 1
+        if timeout is not None and timeout < self.latency:
+            time.sleep(timeout)
+            raise TimeoutError("Stub model call timed out")
+        time.sleep(self.latency)
+
+    def _generate(self, model, prompt, timeout):
+        self._wait(timeout)
+        return self._respond(model, prompt)
+
+    def _chat(self, history, message, timeout):
+        self._wait(timeout)
+        return self._respond("chat", message)
+
+    def _chat_stream(self, history, message, timeout):
+        self._wait(timeout)
+        words = self._respond("chat", message).split(" ")
+        for i in range(0, len(words), 4):
+            yield " ".join(words[i:i + 4]) + (" " if i + 4 < len(words) else "")
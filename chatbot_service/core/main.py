@@ -1,18 +1,39 @@
-from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import FastAPI, Depends, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool, iterate_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import insert, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, aliased
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Optional
 import time
 import json
+import asyncio
 import httpx
 import os
 
-from .database import get_db, init_db
-from .models import ChatMessage, SentimentScore, User, ChatSession
+from .database import get_db, init_db, SessionLocal
+from .models import ChatMessage, SentimentScore, User
+from .outbox import SentimentOutboxDispatcher, enqueue_sentiment
 from .schemas import MessageRequest, MessageResponse, SentimentData
-from .chatbot import get_sentiment_analysis, get_bot_response, user_chat_sessions, therapy_model, DR_SARAH_PROMPT
+from .metrics import instrument_app
+from .deadline import Deadline, DeadlineExceeded, install_deadlines, request_deadline
+from .sessions import chat_sessions
+from .sentiment_cache import sentiment_cache
+from .chatbot import (
+    get_sentiment_analysis,
+    get_bot_response,
+    stream_bot_response,
+    get_web_results,
+    wants_resources,
+    web_search_timeout,
+    format_resources,
+    history_from_messages,
+)
 
 app = FastAPI()
+instrument_app(app)
+install_deadlines(app)
 
 # Initialize the database on startup
 @app.on_event("startup")
@@ -20,184 +41,321 @@ async def startup_event():
     print("Initializing database...")
     init_db()
     print("Database initialized")
+    sentiment_outbox.start()
+    chat_sessions.start()
 
 @app.get("/")
 def read_root():
     return {"message": "Chatbot Service is running"}
 
+# Number of stored messages a re-initialized session starts with
+SESSION_INIT_MESSAGES = int(os.getenv("SESSION_INIT_MESSAGES", "20"))
+
 # Add this function to initialize a chat session
 @app.post("/chat/init-session/{user_id}")
 def initialize_chat_session(user_id: int, db: Session = Depends(get_db)):
-    """Initialize or reset a chat session with previous messages."""
+    """
+    Initialize or reset a chat session with previous messages.
+    The session is built directly from the stored messages, so no model
+    calls are made.
+    """
     try:
-        # Get the user's messages from the database
-        messages = db.query(ChatMessage).filter(
+        # Get the user's most recent messages from the database
+        rows = db.query(ChatMessage.is_bot, ChatMessage.message_text).filter(
             ChatMessage.user_id == user_id
-        ).order_by(ChatMessage.created_at).all()
-        
-        # If the user already has a chat session, reset it
-        if user_id in user_chat_sessions:
-            del user_chat_sessions[user_id]
-        
-        # Create a new chat session
-        chat = therapy_model.start_chat()
-        
-        # Initialize with system prompt
-        chat.send_message(DR_SARAH_PROMPT)
+        ).order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc()).limit(SESSION_INIT_MESSAGES).all()
         
-        # Load previous messages into the chat
-        for msg in messages[-10:]:  # Use the last 10 messages to avoid token limits
-            try:
-                if msg.is_bot:
-                    # Skip bot messages in initialization as we don't want to feed our own responses back
-                    continue
-                else:
-                    # Send user message
-                    chat.send_message(msg.message_text)
-            except Exception as e:
-                print(f"Error adding message to chat: {e}")
-        
-        # Store the chat session
-        user_chat_sessions[user_id] = chat
+        # Replace any existing session with one holding both sides of the
+        # recent conversation; the system prompt is added to every turn
+        chat_sessions.put(user_id, {"history": history_from_messages(reversed(rows)), "summary": ""})
         
         return {"message": "Chat session initialized successfully"}
     except Exception as e:
         print(f"Error initializing chat session: {e}")
         raise HTTPException(status_code=500, detail=f"Error initializing chat session: {str(e)}")
 
-# Add this function to handle chat sessions
-def get_or_create_chat_session(db, user_id):
-    """Get or create a chat session for a user."""
-    session = db.query(ChatSession).filter(ChatSession.user_id == user_id).first()
-    
-    if not session:
-        print(f"Creating new chat session for user {user_id}")
-        session = ChatSession(
-            user_id=user_id,
-            session_data=json.dumps([])
-        )
-        db.add(session)
+SENTIMENT_SERVICE_URL = os.getenv("SENTIMENT_SERVICE_URL", "http://sentiment-service:8002")
+
+# Shared client for calls to the sentiment service, closed on shutdown
+http_client = httpx.AsyncClient(timeout=10.0)
+
+# Delivers sentiment scores to the sentiment service in the background;
+# undelivered scores stay in the outbox table across restarts
+sentiment_outbox = SentimentOutboxDispatcher(SessionLocal, http_client, SENTIMENT_SERVICE_URL)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await sentiment_outbox.stop()
+    await http_client.aclose()
+    # Keep the histories of users still in memory for the next start
+    await run_in_threadpool(chat_sessions.stop)
+    await run_in_threadpool(chat_sessions.flush)
+    await run_in_threadpool(sentiment_cache.save)
+
+# Users known to exist, so most turns skip creating the placeholder user
+known_user_ids = set()
+KNOWN_USERS_MAX = int(os.getenv("KNOWN_USERS_MAX", "100000"))
+
+# Inserts that can skip rows that already exist, by database dialect
+UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+def ensure_user(db, user_id: int):
+    """Create a placeholder user unless the user exists; returns whether a statement was needed."""
+    if user_id in known_user_ids:
+        return False
+    values = {"id": user_id, "email": f"user_{user_id}@placeholder.com"}
+    upsert = UPSERT_INSERTS.get(db.get_bind().dialect.name)
+    if upsert is not None:
+        created = db.execute(upsert(User).values(**values).on_conflict_do_nothing()).rowcount
+    else:
+        created = db.get(User, user_id) is None
+        if created:
+            # A Core insert, so the user row is written before the message referencing it
+            db.execute(insert(User).values(**values))
+    if created:
+        print(f"User {user_id} not found, created placeholder record")
+    return True
+
+def remember_user(user_id: int):
+    if len(known_user_ids) >= KNOWN_USERS_MAX:
+        known_user_ids.clear()
+    known_user_ids.add(user_id)
+
+def message_values(request: MessageRequest, is_bot: bool, text: str):
+    return {
+        "user_id": request.user_id,
+        "is_bot": is_bot,
+        "message_text": text,
+        "translated_text": text,
+        "language": request.language,
+    }
+
+def store_user_message(db, request: MessageRequest) -> int:
+    """
+    Store the user's message in one transaction, creating a placeholder user
+    if needed, and return its id.
+    """
+    checked_user = ensure_user(db, request.user_id)
+    message_id = db.execute(
+        insert(ChatMessage).values(**message_values(request, False, request.message)).returning(ChatMessage.id)
+    ).scalar_one()
+    db.commit()
+    if checked_user:
+        remember_user(request.user_id)
+    return message_id
+
+def store_bot_message(db, request: MessageRequest, text: str, user_message_id: int, sentiment_data: dict) -> int:
+    """
+    Store the bot's reply together with the outbox entry for the user
+    message's sentiment scores, in one transaction, and return the reply's id.
+    """
+    bot_message_id = db.execute(
+        insert(ChatMessage).values(**message_values(request, True, text)).returning(ChatMessage.id)
+    ).scalar_one()
+    enqueue_sentiment(db, request.user_id, user_message_id, sentiment_data, request.language)
+    db.commit()
+    return bot_message_id
+
+def store_sentiment(request: MessageRequest, user_message_id: int, sentiment_data: dict):
+    """Add the scores of a message whose reply was never stored to the outbox"""
+    db = SessionLocal()
+    try:
+        enqueue_sentiment(db, request.user_id, user_message_id, sentiment_data, request.language)
         db.commit()
-        db.refresh(session)
-    
-    return session
+    finally:
+        db.close()
 
-# Update your process_message function
-SENTIMENT_SERVICE_URL = os.getenv("SENTIMENT_SERVICE_URL", "http://sentiment-service:8002")
+async def store_sentiment_when_ready(request: MessageRequest, user_message_id: int, sentiment_task):
+    try:
+        sentiment_data = await sentiment_task
+        await run_in_threadpool(store_sentiment, request, user_message_id, sentiment_data)
+        sentiment_outbox.wake()
+    except Exception as e:
+        print(f"Error storing sentiment of message {user_message_id}: {e}")
+
+# Keeps background tasks referenced until they are done
+background_tasks = set()
 
 @app.post("/chat/message", response_model=MessageResponse)
-def process_message(request: MessageRequest, db: Session = Depends(get_db)):
-    """Process a user message, store it, and return a bot response."""
+async def process_message(request: MessageRequest, db: Session = Depends(get_db), deadline: Deadline = Depends(request_deadline)):
+    """
+    Process a user message, store it, and return a bot response.
+    Sentiment analysis and the reply are generated concurrently, and database
+    work runs in the threadpool so the event loop is never blocked.
+    Work stops with a 504 once the request's deadline has passed.
+    """
     try:
         print(f"Processing message for user ID: {request.user_id}")
         
-        # Check if user exists, create if not
-        user = db.query(User).filter(User.id == request.user_id).first()
-        if not user:
-            print(f"User {request.user_id} not found, creating placeholder record")
-            user = User(id=request.user_id, email=f"user_{request.user_id}@placeholder.com")
-            db.add(user)
-            db.commit()
-        
         # 1. Store the user message
-        user_message = ChatMessage(
-            user_id=request.user_id,
-            is_bot=False,
-            message_text=request.message,
-            translated_text=request.message,
-            language=request.language
-        )
-        db.add(user_message)
-        db.commit()
-        db.refresh(user_message)
+        user_message_id = await run_in_threadpool(store_user_message, db, request)
         
-        print(f"User message stored with ID: {user_message.id}")
+        print(f"User message stored with ID: {user_message_id}")
         
-        # 2. Get sentiment analysis
-        sentiment_data = get_sentiment_analysis(request.message)
-        
-        # 3. Send sentiment data to sentiment service
+        # 2. Analyze sentiment and get the bot response at the same time
+        deadline.check("sentiment analysis and reply generation")
+        sentiment_task = asyncio.create_task(run_in_threadpool(get_sentiment_analysis, request.message, deadline))
         try:
-            sentiment_service_data = {
-                "user_id": request.user_id,
-                "chat_message_id": user_message.id,
-                "sentiments": sentiment_data,
-                "language": request.language
-            }
-            
-            sentiment_response = httpx.post(
-                f"{SENTIMENT_SERVICE_URL}/sentiment/chat", 
-                json=sentiment_service_data,
-                timeout=10.0
-            )
-            
-            if sentiment_response.status_code != 200:
-                print(f"Error from sentiment service: {sentiment_response.text}")
-            else:
-                print("Sentiment data sent to sentiment service successfully")
-                
-        except Exception as e:
-            print(f"Error sending sentiment data to sentiment service: {e}")
-            # Continue execution even if sentiment service fails
+            bot_response_text = await run_in_threadpool(get_bot_response, request.user_id, request.message, deadline)
+        except Exception:
+            # No reply to store the scores with; they are still recorded for the message
+            await store_sentiment_when_ready(request, user_message_id, sentiment_task)
+            raise
+        sentiment_data = await sentiment_task
         
         # Convert sentiment data to response format
         sentiment_scores = []
         for label, score in sentiment_data.items():
             sentiment_scores.append(SentimentData(label=label, score=score))
         
-        # 4. Get or update chat session
-        chat_session = get_or_create_chat_session(db, request.user_id)
-        
-        # 5. Get bot response with context from stored messages
-        bot_response_text = get_bot_response(request.user_id, request.message)
-        
-        # 6. Store bot response
-        bot_message = ChatMessage(
-            user_id=request.user_id,
-            is_bot=True,
-            message_text=bot_response_text,
-            translated_text=bot_response_text,
-            language=request.language
+        # 3. Store bot response; the scores are passed on to the sentiment
+        # service in the background
+        bot_message_id = await run_in_threadpool(
+            store_bot_message, db, request, bot_response_text, user_message_id, sentiment_data
         )
-        db.add(bot_message)
-        db.commit()
-        db.refresh(bot_message)
+        sentiment_outbox.wake()
         
-        print(f"Bot response stored with ID: {bot_message.id}")
+        print(f"Bot response stored with ID: {bot_message_id}")
         
-        # 7. Return response
+        # 4. Return response
         return MessageResponse(
-            message_id=bot_message.id,
+            message_id=bot_message_id,
             bot_message=bot_response_text,
             sentiment_scores=sentiment_scores,
             created_at=datetime.now()
         )
         
+    except DeadlineExceeded as e:
+        print(f"Abandoning message for user {request.user_id}: {e}")
+        raise
     except Exception as e:
         print(f"Error processing message: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing message: {str(e)}")
 
+def sse_event(event: str, data: dict) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@app.post("/chat/message/stream")
+async def stream_message(request: MessageRequest, db: Session = Depends(get_db), deadline: Deadline = Depends(request_deadline)):
+    """
+    Process a user message and stream the bot response as server-sent events.
+    "token" events carry the reply as it is generated, followed by a
+    "resources" event when web search found any, a "sentiment" event with
+    the message's scores and a final "done" event once the complete reply
+    has been stored. Failures after the stream started end it with an
+    "error" event.
+    """
+    print(f"Streaming message for user ID: {request.user_id}")
+    user_message_id = await run_in_threadpool(store_user_message, db, request)
+    deadline.check("sentiment analysis and reply generation")
+    
+    # Sentiment analysis and web search run while the reply streams
+    sentiment_task = asyncio.create_task(run_in_threadpool(get_sentiment_analysis, request.message, deadline))
+    search_timeout = web_search_timeout(deadline) if wants_resources(request.message) else None
+    search_task = None
+    if search_timeout is not None:
+        search_task = asyncio.create_task(run_in_threadpool(get_web_results, request.message, timeout=search_timeout))
+    
+    async def events():
+        stored = False
+        try:
+            parts = []
+            reply = stream_bot_response(request.user_id, request.message, search_task is not None, deadline)
+            async for text in iterate_in_threadpool(reply):
+                parts.append(text)
+                yield sse_event("token", {"text": text})
+            
+            resources = []
+            if search_task is not None:
+                try:
+                    resources = await search_task
+                except Exception as e:
+                    print(f"Error during search: {e}")
+            if resources:
+                yield sse_event("resources", {"urls": resources})
+                parts.append(format_resources(resources))
+            
+            sentiment_data = await sentiment_task
+            yield sse_event("sentiment", {
+                "sentiment_scores": [{"label": label, "score": score} for label, score in sentiment_data.items()]
+            })
+            
+            bot_message_id = await run_in_threadpool(
+                store_bot_message, db, request, "".join(parts), user_message_id, sentiment_data
+            )
+            stored = True
+            sentiment_outbox.wake()
+            print(f"Streamed bot response stored with ID: {bot_message_id}")
+            yield sse_event("done", {"message_id": bot_message_id, "created_at": datetime.now()})
+        except Exception as e:
+            print(f"Error streaming message: {e}")
+            yield sse_event("error", {"detail": str(e)})
+        finally:
+            # The resources are of no use once the client is gone or the stream
+            # failed; the sentiment of the stored message is still recorded
+            if search_task is not None and not search_task.done():
+                search_task.cancel()
+            if not stored:
+                task = asyncio.create_task(store_sentiment_when_ready(request, user_message_id, sentiment_task))
+                background_tasks.add(task)
+                task.add_done_callback(background_tasks.discard)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Messages per chat history page
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", "200"))
+
 @app.get("/chat/history/{user_id}")
-def get_chat_history(user_id: int, db: Session = Depends(get_db)):
-    """Get chat history for a user."""
+def get_chat_history(
+    user_id: int,
+    response: Response,
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    cursor: Optional[int] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Get a page of a user's chat history: the most recent messages before
+    `cursor`, oldest first. When there are older messages, the X-Next-Cursor
+    header holds the cursor of the next page.
+    Pages are read with a keyset query on (user_id, created_at, id), so the
+    time taken doesn't grow with the length of the history.
+    """
     try:
         print(f"Fetching chat history for user ID: {user_id}")
         
-        messages = db.query(ChatMessage).filter(
-            ChatMessage.user_id == user_id
-        ).order_by(ChatMessage.created_at).all()
+        query = db.query(
+            ChatMessage.id, ChatMessage.is_bot, ChatMessage.message_text, ChatMessage.created_at
+        ).filter(ChatMessage.user_id == user_id)
+        if cursor is not None:
+            # Compared with the stored row rather than a value sent back by the
+            # client, so timestamps never have to round-trip through the cursor
+            start = aliased(ChatMessage)
+            query = query.filter(tuple_(ChatMessage.created_at, ChatMessage.id) < select(
+                start.created_at, start.id
+            ).where(start.id == cursor, start.user_id == user_id).scalar_subquery())
+        rows = query.order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc()).limit(limit + 1).all()
+        
+        if len(rows) > limit:
+            rows = rows[:limit]
+            response.headers["X-Next-Cursor"] = str(rows[-1].id)
         
-        print(f"Found {len(messages)} messages for user ID: {user_id}")
+        print(f"Found {len(rows)} messages for user ID: {user_id}")
         
         return [
             {
-                "id": msg.id,
-                "is_bot": msg.is_bot,
-                "message": msg.message_text,
-                "created_at": msg.created_at
+                "id": row.id,
+                "is_bot": row.is_bot,
+                "message": row.message_text,
+                "created_at": row.created_at
             }
-            for msg in messages
+            for row in reversed(rows)
         ]
     except Exception as e:
         print(f"Error fetching chat history: {e}")
-        raise HTTPException(status_code=500, detail=f"Error fetching chat history: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error fetching chat history: {str(e)}")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Float, Text
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Float, Text, Index
 from sqlalchemy.sql import func
 from .database import Base
 
@@ -20,6 +20,13 @@ class ChatMessage(Base):
     translated_text = Column(Text)
     language = Column(String)
     created_at = Column(DateTime, default=func.now())
+    
+    # Serves the keyset-paginated history, newest first, without a sort.
+    # Not covering: message_text is unbounded and would push index entries
+    # past the btree size limit, so each page still reads its rows from the heap
+    __table_args__ = (
+        Index("ix_chat_messages_user_id_created_at_id", "user_id", "created_at", "id"),
+    )
 
 class SentimentScore(Base):
     __tablename__ = "sentiment_scores"
@@ -39,4 +46,18 @@ class ChatSession(Base):
     user_id = Column(Integer, ForeignKey("users.id"))
     session_data = Column(Text)  # JSON string of chat history
     created_at = Column(DateTime, default=func.now())
-    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
\ No newline at end of file
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+class SentimentOutbox(Base):
+    """Sentiment scores waiting to be delivered to the sentiment service"""
+    __tablename__ = "sentiment_outbox"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    chat_message_id = Column(Integer, ForeignKey("chat_messages.id"))
+    payload = Column(Text)  # JSON body of the sentiment service request
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, index=True)
+    last_error = Column(Text)
+    # Set once the entry is given up on; it is kept for inspection but never sent again
+    dead_lettered_at = Column(DateTime)
+    created_at = Column(DateTime, default=func.now())
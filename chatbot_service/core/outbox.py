@@ -0,0 +1,213 @@
+import os
+import json
+import asyncio
+from datetime import datetime, timedelta
+
+import httpx
+from fastapi.concurrency import run_in_threadpool
+
+from .models import SentimentOutbox
+from .metrics import track_dependency, OUTBOX_DELIVERIES
+
+# Entries delivered to the sentiment service per request
+OUTBOX_BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE", "50"))
+# How often the outbox is checked when nothing new was written to it
+OUTBOX_POLL_INTERVAL = float(os.environ.get("OUTBOX_POLL_INTERVAL", "5"))
+# Retry delays double from the base up to the maximum
+OUTBOX_RETRY_BASE = float(os.environ.get("OUTBOX_RETRY_BASE", "1"))
+OUTBOX_RETRY_MAX = float(os.environ.get("OUTBOX_RETRY_MAX", "300"))
+# Entries still failing after this many deliveries are dead-lettered
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "20"))
+# Claimed entries are left alone by other replicas for this long
+OUTBOX_LEASE = float(os.environ.get("OUTBOX_LEASE", "60"))
+OUTBOX_TIMEOUT = float(os.environ.get("OUTBOX_TIMEOUT", "10"))
+
+# Client errors worth retrying; any other 4xx will fail the same way every time
+RETRYABLE_CLIENT_ERRORS = {408, 429}
+
+def enqueue_sentiment(db, user_id, chat_message_id, sentiments, language):
+    """
+    Add the message's scores to the outbox. Not committed here, so the entry
+    is written in the same transaction as the caller's other changes.
+    """
+    db.add(SentimentOutbox(
+        chat_message_id=chat_message_id,
+        payload=json.dumps({
+            "user_id": user_id,
+            "chat_message_id": chat_message_id,
+            "sentiments": sentiments,
+            "language": language,
+        }),
+        attempts=0,
+        next_attempt_at=datetime.utcnow(),
+    ))
+
+def retry_delay(attempts):
+    """Seconds to wait before the next delivery of an entry that failed `attempts` times"""
+    return min(OUTBOX_RETRY_MAX, OUTBOX_RETRY_BASE * 2 ** (attempts - 1))
+
+class SentimentOutboxDispatcher:
+    """
+    Background task delivering outbox entries to the sentiment service in
+    batches. Delivered entries are deleted; failed ones are retried with
+    exponential backoff. A batch the service rejects as a whole is split
+    and its entries delivered one by one, so a bad entry can't hold back
+    the others. Entries the service rejects, and entries that fail
+    OUTBOX_MAX_ATTEMPTS times, are dead-lettered. Entries are claimed with
+    a lease before delivery, so several replicas can drain the same outbox.
+    """
+
+    def __init__(self, session_factory, client: httpx.AsyncClient, url: str,
+                 batch_size=OUTBOX_BATCH_SIZE, poll_interval=OUTBOX_POLL_INTERVAL):
+        self._session_factory = session_factory
+        self._client = client
+        self.url = url
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self):
+        """Deliver new entries now instead of at the next poll"""
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                delivered = await self.dispatch_once()
+            except Exception as e:
+                print(f"Error dispatching sentiment outbox: {e}")
+                delivered = 0
+            # A full batch means more entries are probably waiting
+            if delivered < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    async def dispatch_once(self):
+        """Deliver one batch of due entries; returns how many were delivered"""
+        entries = await run_in_threadpool(self._claim_due)
+        if not entries:
+            return 0
+        return await self._deliver(entries)
+
+    async def _deliver(self, entries):
+        ids = [entry_id for entry_id, _ in entries]
+        try:
+            with track_dependency("sentiment_service", "store_chat_sentiment_batch"):
+                response = await self._client.post(
+                    f"{self.url}/sentiment/chat/batch",
+                    json={"items": [payload for _, payload in entries]},
+                    timeout=OUTBOX_TIMEOUT,
+                )
+        except Exception as e:
+            print(f"Error delivering {len(ids)} sentiment outbox entries, will retry: {e}")
+            OUTBOX_DELIVERIES.labels("failed").inc(len(ids))
+            await run_in_threadpool(self._reschedule, ids, str(e))
+            return 0
+
+        if response.is_success:
+            # The status of each entry, in order; entries the service can never store are rejected
+            results = response.json().get("results") or [{"status": "stored"}] * len(ids)
+            rejected = {
+                entry_id: result.get("detail", "rejected")
+                for entry_id, result in zip(ids, results) if result.get("status") == "rejected"
+            }
+            delivered = [entry_id for entry_id in ids if entry_id not in rejected]
+            if rejected:
+                print(f"Sentiment service rejected outbox entries {sorted(rejected)}: {rejected}")
+                OUTBOX_DELIVERIES.labels("dead_lettered").inc(len(rejected))
+                await run_in_threadpool(self._dead_letter, rejected)
+            await run_in_threadpool(self._delete, delivered)
+            OUTBOX_DELIVERIES.labels("delivered").inc(len(delivered))
+            return len(delivered)
+
+        error = f"{response.status_code}: {response.text[:500]}"
+        transient = response.status_code >= 502 or response.status_code in RETRYABLE_CLIENT_ERRORS
+        if len(entries) > 1 and not transient:
+            # One bad entry may have failed the whole batch
+            print(f"Sentiment outbox batch failed with {error}, delivering its entries one by one")
+            delivered = 0
+            for entry in entries:
+                delivered += await self._deliver([entry])
+            return delivered
+
+        if 400 <= response.status_code < 500 and response.status_code not in RETRYABLE_CLIENT_ERRORS:
+            print(f"Sentiment service refused outbox entries {ids}: {error}")
+            OUTBOX_DELIVERIES.labels("dead_lettered").inc(len(ids))
+            await run_in_threadpool(self._dead_letter, {entry_id: error for entry_id in ids})
+            return 0
+
+        print(f"Error delivering {len(ids)} sentiment outbox entries, will retry: {error}")
+        OUTBOX_DELIVERIES.labels("failed").inc(len(ids))
+        await run_in_threadpool(self._reschedule, ids, error)
+        return 0
+
+    def _claim_due(self):
+        db = self._session_factory()
+        try:
+            now = datetime.utcnow()
+            rows = db.query(SentimentOutbox).filter(
+                SentimentOutbox.next_attempt_at <= now,
+                SentimentOutbox.dead_lettered_at.is_(None),
+            ).order_by(SentimentOutbox.next_attempt_at, SentimentOutbox.id).limit(
+                self.batch_size
+            ).with_for_update(skip_locked=True).all()
+            for row in rows:
+                row.next_attempt_at = now + timedelta(seconds=OUTBOX_LEASE)
+            db.commit()
+            return [(row.id, json.loads(row.payload)) for row in rows]
+        finally:
+            db.close()
+
+    def _reschedule(self, ids, error):
+        db = self._session_factory()
+        try:
+            now = datetime.utcnow()
+            for row in db.query(SentimentOutbox).filter(SentimentOutbox.id.in_(ids)).all():
+                row.attempts = (row.attempts or 0) + 1
+                row.last_error = error[:1000]
+                row.next_attempt_at = now + timedelta(seconds=retry_delay(row.attempts))
+                if row.attempts >= OUTBOX_MAX_ATTEMPTS:
+                    print(f"Giving up on sentiment outbox entry {row.id} after {row.attempts} attempts")
+                    OUTBOX_DELIVERIES.labels("dead_lettered").inc()
+                    row.dead_lettered_at = now
+            db.commit()
+        finally:
+            db.close()
+
+    def _dead_letter(self, errors):
+        """Stop delivering the entries, recording why; `errors` maps entry ids to the reason"""
+        db = self._session_factory()
+        try:
+            now = datetime.utcnow()
+            for row in db.query(SentimentOutbox).filter(SentimentOutbox.id.in_(list(errors))).all():
+                row.attempts = (row.attempts or 0) + 1
+                row.last_error = str(errors[row.id])[:1000]
+                row.dead_lettered_at = now
+            db.commit()
+        finally:
+            db.close()
+
+    def _delete(self, ids):
+        db = self._session_factory()
+        try:
+            db.query(SentimentOutbox).filter(SentimentOutbox.id.in_(ids)).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
@@ -0,0 +1,153 @@
+import os
+import re
+from dataclasses import dataclass
+
+# The emotional states scored for every message, in the order of SENTIMENT_ANALYSIS_PROMPT
+SENTIMENT_LABELS = [
+    "Happy", "Sad", "Depressed", "Anxious", "Angry", "Hopeful", "Frustrated", "Calm",
+    "Stressed", "Crisis/Suicidal", "Lonely", "Confident", "Fearful", "Grateful", "Overwhelmed",
+]
+
+# Local scores below this confidence are handed to the LLM instead
+SENTIMENT_MIN_CONFIDENCE = float(os.environ.get("SENTIMENT_MIN_CONFIDENCE", "0.5"))
+
+# Weighted cue words and phrases per label; weights are on a 1-3 scale
+LEXICON = {
+    "Happy": {
+        "happy": 3, "glad": 2, "joy": 3, "joyful": 3, "great": 2, "good": 1, "wonderful": 3,
+        "excited": 3, "fun": 2, "cheerful": 3, "smile": 2, "smiling": 2, "laughing": 2, "amazing": 2,
+        "delighted": 3, "better": 1, "enjoyed": 2, "enjoying": 2, "proud": 2,
+    },
+    "Sad": {
+        "sad": 3, "unhappy": 3, "down": 2, "cry": 3, "crying": 3, "cried": 3, "tears": 2, "upset": 2,
+        "miserable": 3, "heartbroken": 3, "grief": 3, "grieving": 3, "lost": 1, "hurt": 2, "hurting": 2,
+        "blue": 1, "gloomy": 2, "disappointed": 2, "miss": 1,
+    },
+    "Depressed": {
+        "depressed": 3, "depression": 3, "empty": 2, "numb": 2, "worthless": 3, "pointless": 2,
+        "hopeless": 3, "no energy": 2, "exhausted": 1, "can't get out of bed": 3, "no motivation": 2,
+        "nothing matters": 3, "dark place": 2, "unmotivated": 2,
+    },
+    "Anxious": {
+        "anxious": 3, "anxiety": 3, "worried": 3, "worry": 2, "worrying": 3, "nervous": 3, "panic": 3,
+        "panicking": 3, "uneasy": 2, "restless": 2, "on edge": 3, "racing thoughts": 3, "overthinking": 2,
+        "tense": 2, "jittery": 2,
+    },
+    "Angry": {
+        "angry": 3, "anger": 3, "mad": 2, "furious": 3, "rage": 3, "hate": 2, "pissed": 3,
+        "irritated": 2, "resent": 2, "livid": 3, "annoyed": 1,
+    },
+    "Hopeful": {
+        "hope": 2, "hopeful": 3, "hoping": 2, "optimistic": 3, "looking forward": 3, "better soon": 2,
+        "improving": 2, "progress": 2, "getting better": 3, "positive": 2,
+    },
+    "Frustrated": {
+        "frustrated": 3, "frustrating": 3, "frustration": 3, "stuck": 2, "fed up": 3, "annoying": 2,
+        "annoyed": 2, "sick of": 2, "tired of": 2, "nothing works": 3, "useless": 2,
+    },
+    "Calm": {
+        "calm": 3, "relaxed": 3, "peaceful": 3, "at peace": 3, "content": 2, "okay": 1, "fine": 1,
+        "rested": 2, "grounded": 2, "balanced": 2, "settled": 2,
+    },
+    "Stressed": {
+        "stressed": 3, "stress": 3, "stressful": 3, "pressure": 2, "deadline": 2, "deadlines": 2,
+        "burnout": 3, "burned out": 3, "burnt out": 3, "overworked": 3, "busy": 1, "tense": 1,
+    },
+    "Crisis/Suicidal": {
+        "suicide": 3, "suicidal": 3, "kill myself": 3, "end my life": 3, "end it all": 3,
+        "want to die": 3, "better off dead": 3, "self harm": 3, "self-harm": 3, "hurt myself": 3,
+        "cutting myself": 3, "no reason to live": 3, "don't want to live": 3, "dont want to live": 3,
+        "take my own life": 3, "overdose": 3,
+    },
+    "Lonely": {
+        "lonely": 3, "alone": 2, "isolated": 3, "no friends": 3, "nobody": 2, "no one": 2,
+        "left out": 2, "abandoned": 3, "disconnected": 2, "by myself": 2,
+    },
+    "Confident": {
+        "confident": 3, "capable": 2, "strong": 2, "proud": 2, "accomplished": 3, "i can do": 2,
+        "sure of myself": 3, "believe in myself": 3, "determined": 2, "motivated": 2,
+    },
+    "Fearful": {
+        "afraid": 3, "scared": 3, "fear": 3, "frightened": 3, "terrified": 3, "dread": 3,
+        "fearful": 3, "unsafe": 2, "threatened": 2, "nightmare": 2, "nightmares": 2,
+    },
+    "Grateful": {
+        "grateful": 3, "thankful": 3, "thanks": 2, "thank you": 2, "appreciate": 3,
+        "appreciated": 2, "blessed": 2, "lucky": 2,
+    },
+    "Overwhelmed": {
+        "overwhelmed": 3, "overwhelming": 3, "too much": 3, "can't cope": 3, "cant cope": 3,
+        "drowning": 3, "falling apart": 3, "can't handle": 3, "breaking down": 3, "swamped": 2,
+    },
+}
+
+# Cues that mean the message needs the LLM (and a careful reading) whatever the local score
+CRISIS_LABEL = "Crisis/Suicidal"
+
+NEGATIONS = {"not", "no", "never", "don't", "dont", "isn't", "wasn't", "aren't", "can't", "cannot", "hardly", "barely"}
+INTENSIFIERS = {"very", "so", "really", "extremely", "incredibly", "completely", "totally", "super", "deeply"}
+
+# Points per unit of cue weight on the 0-10 scale the LLM uses
+POINTS_PER_WEIGHT = 2.5
+# Total cue weight at which the local scorer is fully confident
+CONFIDENT_WEIGHT = 4.0
+
+def _tokenize(text):
+    return re.findall(r"[a-z]+(?:['-][a-z]+)*", text.lower())
+
+# Cues by their first word, longest phrases first, so lookups only check phrases that can match
+_CUES = {}
+for _label, _cues in LEXICON.items():
+    for _cue, _weight in _cues.items():
+        _words = tuple(_tokenize(_cue))
+        _CUES.setdefault(_words[0], []).append((_words, _label, _weight))
+for _entries in _CUES.values():
+    _entries.sort(key=lambda entry: -len(entry[0]))
+
+@dataclass
+class LocalSentiment:
+    scores: dict
+    confidence: float
+    crisis: bool
+
+    @property
+    def needs_llm(self):
+        """Whether the message should be scored by the LLM instead"""
+        return self.crisis or self.confidence < SENTIMENT_MIN_CONFIDENCE
+
+def score_sentiment(message):
+    """
+    Score a message on the 15 emotional states with a weighted lexicon.
+    Scores use the 0-1 scale of parse_sentiment_response; cues preceded by a
+    negation are ignored and intensifiers strengthen them. Confidence grows
+    with the total weight of the cues found.
+    """
+    tokens = _tokenize(message)
+    points = dict.fromkeys(SENTIMENT_LABELS, 0.0)
+    matched = 0.0
+    crisis = False
+
+    i = 0
+    while i < len(tokens):
+        before = tokens[max(0, i - 3):i]
+        negated = any(token in NEGATIONS for token in before)
+        intensity = 1.5 if any(token in INTENSIFIERS for token in before[-2:]) else 1.0
+        match_length = 0
+        for words, label, weight in _CUES.get(tokens[i], ()):
+            # Only the longest matching phrase counts, for every label it cues
+            if len(words) < match_length:
+                break
+            if tuple(tokens[i:i + len(words)]) != words:
+                continue
+            match_length = len(words)
+            # Crisis cues count even when negated ("I don't want to hurt myself") so they get a closer look
+            if label == CRISIS_LABEL:
+                crisis = True
+            elif negated:
+                continue
+            points[label] += weight * intensity * POINTS_PER_WEIGHT
+            matched += weight
+        i += max(match_length, 1)
+
+    scores = {label: round(min(10.0, value), 1) / 10.0 for label, value in points.items()}
+    return LocalSentiment(scores=scores, confidence=min(1.0, matched / CONFIDENT_WEIGHT), crisis=crisis)
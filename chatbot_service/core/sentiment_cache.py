@@ -0,0 +1,96 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+from .metrics import SENTIMENT_CACHE_LOOKUPS
+
+SENTIMENT_CACHE_MAX_ENTRIES = int(os.environ.get("SENTIMENT_CACHE_MAX_ENTRIES", "10000"))
+# File the cache is kept in across restarts; unset keeps it in memory only
+SENTIMENT_CACHE_PATH = os.environ.get("SENTIMENT_CACHE_PATH", "")
+
+def normalize_message(message):
+    """Message text as compared by the cache: case, spacing and surrounding punctuation don't matter"""
+    text = re.sub(r"\s+", " ", message.lower()).strip()
+    return text.strip(" .,!?;:~\"'()[]-") or text
+
+def message_key(message):
+    """Cache key of a message; only this hash is stored, never the text itself"""
+    return hashlib.sha256(normalize_message(message).encode("utf-8")).hexdigest()
+
+class SentimentCache:
+    """
+    LRU cache of sentiment scores keyed on a hash of the normalized message,
+    so messages repeated verbatim ("I'm tired", "thank you") are scored once.
+    With a path, the entries are loaded from it on creation and written back
+    by save().
+    """
+
+    def __init__(self, max_entries=SENTIMENT_CACHE_MAX_ENTRIES, path=None):
+        self.max_entries = max_entries
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if path:
+            self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, message):
+        """Scores cached for the message, or None"""
+        key = message_key(message)
+        with self._lock:
+            scores = self._entries.get(key)
+            if scores is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        SENTIMENT_CACHE_LOOKUPS.labels("miss" if scores is None else "hit").inc()
+        return None if scores is None else dict(scores)
+
+    def set(self, message, scores):
+        key = message_key(message)
+        with self._lock:
+            self._entries[key] = dict(scores)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def load(self):
+        """Read the entries saved at `path`, if any"""
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Error loading sentiment cache from {self.path}: {e}")
+            return
+        with self._lock:
+            # Saved least recently used first
+            for key, scores in list(entries.items())[-self.max_entries:]:
+                if isinstance(scores, dict):
+                    self._entries[key] = scores
+
+    def save(self):
+        """Write the entries to `path`, replacing the previous file in one step"""
+        if not self.path:
+            return
+        with self._lock:
+            entries = dict(self._entries)
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Error saving sentiment cache to {self.path}: {e}")
+
+# Sentiment scores of messages seen before
+sentiment_cache = SentimentCache(path=SENTIMENT_CACHE_PATH or None)
@@ -0,0 +1,278 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+
+from .database import SessionLocal
+from .models import ChatSession
+
+# Limits of the in-memory chat session store
+SESSION_MAX_SESSIONS = int(os.environ.get("SESSION_MAX_SESSIONS", "10000"))
+SESSION_MAX_BYTES = int(os.environ.get("SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+SESSION_IDLE_TTL = float(os.environ.get("SESSION_IDLE_TTL", "1800"))
+# How often changed and evicted sessions are written to the database
+SESSION_WRITE_INTERVAL = float(os.environ.get("SESSION_WRITE_INTERVAL", "5"))
+
+# Rough per-turn overhead on top of the text itself
+TURN_OVERHEAD_BYTES = 64
+
+def new_session():
+    return {"history": [], "summary": ""}
+
+def copy_session(session):
+    return {"history": list(session["history"]), "summary": session.get("summary", "")}
+
+def session_size(session):
+    """Approximate memory held by a chat session"""
+    return len(session["summary"]) + sum(len(turn["text"]) + TURN_OVERHEAD_BYTES for turn in session["history"])
+
+class SessionStore:
+    """
+    In-memory chat sessions, one per user. A session is a plain dict holding
+    the recent turns as {"role": "user" | "model", "text": ...} and a rolling
+    summary of the older ones.
+    The store is bounded by number of sessions and total size, and sessions
+    idle for longer than idle_ttl are dropped. Misses are filled from `load`.
+    Nothing is written while serving requests: changed and evicted sessions
+    are handed to `save` as one list of (user_id, session) pairs by sync(),
+    which a background thread runs every write_interval seconds once the
+    store is started.
+    """
+
+    def __init__(self, load=None, save=None, max_sessions=SESSION_MAX_SESSIONS, max_bytes=SESSION_MAX_BYTES,
+                 idle_ttl=SESSION_IDLE_TTL, write_interval=SESSION_WRITE_INTERVAL, clock=time.monotonic):
+        self._load = load
+        self._save = save
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.write_interval = write_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        # user_id -> (session, size, last_used), least recently used first
+        self._sessions = OrderedDict()
+        self.size_bytes = 0
+        # Users whose session in memory changed since it was last saved
+        self._dirty = set()
+        # Evicted sessions waiting to be saved, and those being saved right now
+        self._unsaved = {}
+        self._saving = {}
+        self._stopped = threading.Event()
+        self._writer = None
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, user_id):
+        return user_id in self._sessions
+
+    def get(self, user_id):
+        """A copy of the user's session, loaded from storage on a miss, or None if there is none"""
+        with self._lock:
+            entry = self._sessions.get(user_id)
+            if entry is not None:
+                session, size, _ = entry
+                self._sessions[user_id] = (session, size, self._clock())
+                self._sessions.move_to_end(user_id)
+                return copy_session(session)
+            # Evicted but not saved yet: storage doesn't have it
+            pending = self._unsaved.pop(user_id, None) or self._saving.get(user_id)
+            if pending is not None:
+                self._insert(user_id, copy_session(pending))
+                self._dirty.add(user_id)
+                self._evict_over_limits()
+                return copy_session(pending)
+
+        session = self._load_session(user_id)
+        if session is not None:
+            with self._lock:
+                if user_id not in self._sessions:
+                    self._insert(user_id, copy_session(session))
+                    self._evict_over_limits()
+        return session
+
+    def put(self, user_id, session):
+        """Store the user's latest session, evicting others if over the limits"""
+        with self._lock:
+            self._insert(user_id, copy_session(session))
+            self._dirty.add(user_id)
+            self._unsaved.pop(user_id, None)
+            self._evict_over_limits()
+
+    def update(self, user_id, change):
+        """
+        Replace the user's session with change(session) atomically and return
+        the new session. Nothing happens, and None is returned, if the session
+        is not in memory or `change` returns None.
+        """
+        with self._lock:
+            entry = self._sessions.get(user_id)
+            if entry is None:
+                return None
+            session = change(copy_session(entry[0]))
+            if session is None:
+                return None
+            self._insert(user_id, copy_session(session))
+            self._dirty.add(user_id)
+            self._evict_over_limits()
+        return session
+
+    def discard(self, user_id):
+        """Forget the user's session without persisting it"""
+        with self._lock:
+            self._remove(user_id)
+            self._dirty.discard(user_id)
+            self._unsaved.pop(user_id, None)
+
+    def sync(self):
+        """Drop idle sessions and save every changed or evicted session in one batch"""
+        with self._lock:
+            self._evict_idle()
+            batch = dict(self._unsaved)
+            batch.update((user_id, self._sessions[user_id][0]) for user_id in self._dirty)
+            self._unsaved.clear()
+            self._dirty.clear()
+            self._saving = batch
+        self._persist(batch)
+
+    def flush(self):
+        """Persist every session, e.g. before shutting down"""
+        with self._lock:
+            batch = dict(self._unsaved)
+            batch.update((user_id, entry[0]) for user_id, entry in self._sessions.items())
+            self._unsaved.clear()
+            self._dirty.clear()
+            self._saving = batch
+        self._persist(batch)
+
+    def start(self):
+        """Save changes in the background every write_interval seconds"""
+        if self._writer is None:
+            self._stopped.clear()
+            self._writer = threading.Thread(target=self._write_loop, name="session-writer", daemon=True)
+            self._writer.start()
+
+    def stop(self):
+        if self._writer is not None:
+            self._stopped.set()
+            self._writer.join()
+            self._writer = None
+
+    def _write_loop(self):
+        while not self._stopped.wait(self.write_interval):
+            try:
+                self.sync()
+            except Exception as e:
+                print(f"Error saving chat sessions: {e}")
+
+    def _insert(self, user_id, session):
+        self._remove(user_id)
+        size = session_size(session)
+        self._sessions[user_id] = (session, size, self._clock())
+        self.size_bytes += size
+
+    def _evict(self, user_id):
+        """Drop a session from memory, keeping it for the next save if it changed"""
+        session = self._remove(user_id)
+        if user_id in self._dirty:
+            self._dirty.discard(user_id)
+            self._unsaved[user_id] = session
+
+    def _evict_over_limits(self):
+        while len(self._sessions) > 1 and (
+            len(self._sessions) > self.max_sessions or self.size_bytes > self.max_bytes
+        ):
+            self._evict(next(iter(self._sessions)))
+
+    def _remove(self, user_id):
+        entry = self._sessions.pop(user_id, None)
+        if entry is None:
+            return None
+        self.size_bytes -= entry[1]
+        return entry[0]
+
+    def _evict_idle(self):
+        """Drop sessions unused for longer than idle_ttl; they are the oldest ones"""
+        now = self._clock()
+        while self._sessions:
+            user_id, (_, _, last_used) = next(iter(self._sessions.items()))
+            if now - last_used < self.idle_ttl:
+                break
+            self._evict(user_id)
+
+    def _load_session(self, user_id):
+        if self._load is None:
+            return None
+        try:
+            return self._load(user_id)
+        except Exception as e:
+            print(f"Error loading chat session for user {user_id}: {e}")
+            return None
+
+    def _persist(self, batch):
+        try:
+            if self._save is not None and batch:
+                self._save(list(batch.items()))
+        except Exception as e:
+            print(f"Error saving {len(batch)} chat sessions, will retry: {e}")
+            with self._lock:
+                # Keep them for the next save unless they changed meanwhile
+                for user_id, session in batch.items():
+                    if user_id in self._sessions:
+                        self._dirty.add(user_id)
+                    else:
+                        self._unsaved.setdefault(user_id, session)
+        finally:
+            with self._lock:
+                self._saving = {}
+
+def parse_session_data(session_data):
+    """
+    Chat session stored in ChatSession.session_data as
+    {"history": [...], "summary": "..."}. Older rows hold a bare JSON list.
+    """
+    if not session_data:
+        return new_session()
+    data = json.loads(session_data)
+    if isinstance(data, list):
+        data = {"history": data}
+    history = [
+        {"role": turn["role"], "text": turn["text"]}
+        for turn in data.get("history", [])
+        if isinstance(turn, dict) and "role" in turn and "text" in turn
+    ]
+    return {"history": history, "summary": data.get("summary") or ""}
+
+def load_session(user_id):
+    """Session persisted for the user, or None if they have none yet"""
+    db = SessionLocal()
+    try:
+        row = db.query(ChatSession).filter(ChatSession.user_id == user_id).first()
+        session = parse_session_data(row.session_data) if row else new_session()
+        return session if session["history"] or session["summary"] else None
+    finally:
+        db.close()
+
+def save_sessions(sessions):
+    """Write (user_id, session) pairs into the users' ChatSession rows in one transaction"""
+    db = SessionLocal()
+    try:
+        user_ids = [user_id for user_id, _ in sessions]
+        rows = {row.user_id: row for row in db.query(ChatSession).filter(ChatSession.user_id.in_(user_ids))}
+        for user_id, session in sessions:
+            row = rows.get(user_id)
+            if row is None:
+                row = rows[user_id] = ChatSession(user_id=user_id)
+                db.add(row)
+            row.session_data = json.dumps(session)
+        db.commit()
+    finally:
+        db.close()
+
+def save_session(user_id, session):
+    """Write the user's session into their ChatSession row"""
+    save_sessions([(user_id, session)])
+
+# Chat sessions of active users
+chat_sessions = SessionStore(load=load_session, save=save_sessions)
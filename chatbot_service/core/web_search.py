@@ -0,0 +1,92 @@
+import os
+import re
+import time
+import threading
+import concurrent.futures
+from collections import OrderedDict
+
+from .metrics import track_dependency, WEB_SEARCH_CACHE_LOOKUPS
+
+# Searches run on a shared pool; a search keeps running after its caller timed out
+WEB_SEARCH_WORKERS = int(os.environ.get("WEB_SEARCH_WORKERS", "4"))
+WEB_SEARCH_CACHE_MAX_ENTRIES = int(os.environ.get("WEB_SEARCH_CACHE_MAX_ENTRIES", "1000"))
+WEB_SEARCH_CACHE_TTL = float(os.environ.get("WEB_SEARCH_CACHE_TTL", "3600"))
+
+def normalize_query(query):
+    return re.sub(r"\s+", " ", query.lower()).strip()
+
+class WebSearchClient:
+    """
+    Process-wide client for the Custom Search API. Results are cached for
+    `ttl` seconds in an LRU of max_entries queries, and callers searching for
+    a query that is already being searched wait for that search instead of
+    starting another one.
+    `build_service()` creates the API service object; it is built once per
+    pool thread, as the underlying HTTP client can't be shared between
+    threads.
+    """
+
+    def __init__(self, build_service, engine_id, workers=WEB_SEARCH_WORKERS,
+                 max_entries=WEB_SEARCH_CACHE_MAX_ENTRIES, ttl=WEB_SEARCH_CACHE_TTL, clock=time.monotonic):
+        self._build_service = build_service
+        self.engine_id = engine_id
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="web-search")
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # (query, num_results) -> (urls, expires_at), least recently used first
+        self._entries = OrderedDict()
+        # (query, num_results) -> future of the search running for it
+        self._in_flight = {}
+
+    def search(self, query, num_results=3, timeout=None):
+        """
+        URLs found for the query. Raises TimeoutError if no result arrives
+        within `timeout`, or the search's error if it failed.
+        """
+        key = (normalize_query(query), num_results)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > self._clock():
+                self._entries.move_to_end(key)
+                WEB_SEARCH_CACHE_LOOKUPS.labels("hit").inc()
+                return list(entry[0])
+            future = self._in_flight.get(key)
+            started = future is None
+            if started:
+                future = self._executor.submit(self._execute, query, num_results)
+                self._in_flight[key] = future
+        WEB_SEARCH_CACHE_LOOKUPS.labels("miss" if started else "shared").inc()
+        if started:
+            # Added outside the lock: it runs right away if the search is already done
+            future.add_done_callback(lambda done: self._finish(key, done))
+
+        try:
+            return list(future.result(timeout=timeout))
+        except concurrent.futures.TimeoutError:
+            raise TimeoutError("Search operation timed out")
+
+    def _service(self):
+        service = getattr(self._local, "service", None)
+        if service is None:
+            service = self._local.service = self._build_service()
+        return service
+
+    def _execute(self, query, num_results):
+        with track_dependency("web_search", "search"):
+            result = self._service().cse().list(q=query, cx=self.engine_id, num=num_results).execute()
+        return [item["link"] for item in result.get("items", [])]
+
+    def _finish(self, key, future):
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+            # Failed searches are not cached, so the next caller tries again
+            if future.cancelled() or future.exception() is not None:
+                return
+            self._entries[key] = (future.result(), self._clock() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
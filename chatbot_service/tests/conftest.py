@@ -0,0 +1,7 @@
+class FakeClock:
+    """Clock for code that takes a `clock` callable; tests move it by setting `now`"""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
@@ -1,11 +1,12 @@
 import pytest
 from fastapi.testclient import TestClient
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
+import json
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 import os
 
-from core.main import app
+from core.main import app, known_user_ids
 from core.database import Base, get_db
 from core.models import User, ChatMessage, SentimentScore
 from core.schemas import MessageRequest
@@ -31,6 +32,7 @@ client = TestClient(app)
 def test_db():
     # Create the tables
     Base.metadata.create_all(bind=engine)
+    known_user_ids.clear()
     yield
     # Drop the tables after test
     Base.metadata.drop_all(bind=engine)
@@ -42,8 +44,8 @@ def test_read_root():
 
 @patch("core.main.get_sentiment_analysis")
 @patch("core.main.get_bot_response")
-@patch("core.main.httpx.post")
-def test_process_message(mock_httpx_post, mock_get_bot_response, mock_get_sentiment_analysis, test_db):
+@patch("core.main.http_client")
+def test_process_message(mock_http_client, mock_get_bot_response, mock_get_sentiment_analysis, test_db):
     # Setup mocks
     mock_get_sentiment_analysis.return_value = {
         "Happy": 0.4, "Sad": 0.3, "Anxious": 0.6
@@ -53,7 +55,7 @@ def test_process_message(mock_httpx_post, mock_get_bot_response, mock_get_sentim
     
     mock_response = MagicMock()
     mock_response.status_code = 200
-    mock_httpx_post.return_value = mock_response
+    mock_http_client.post = AsyncMock(return_value=mock_response)
     
     # Test message processing
     request_data = {
@@ -71,4 +73,211 @@ def test_process_message(mock_httpx_post, mock_get_bot_response, mock_get_sentim
     assert "bot_message" in response_data
     assert response_data["bot_message"] == "This is a test response from the bot."
     assert "sentiment_scores" in response_data
-    assert len(response_data["sentiment_scores"]) == 3  # Happy, Sad, Anxious
\ No newline at end of file
+    assert len(response_data["sentiment_scores"]) == 3  # Happy, Sad, Anxious
+    
+    # The scores wait in the outbox, stored along with the reply, for delivery to the sentiment service
+    from core.models import SentimentOutbox
+    db = TestingSessionLocal()
+    entries = db.query(SentimentOutbox).all()
+    user_message = db.query(ChatMessage).filter(ChatMessage.is_bot == False).one()
+    db.close()
+    assert len(entries) == 1
+    assert entries[0].chat_message_id == user_message.id
+    assert json.loads(entries[0].payload)["sentiments"] == mock_get_sentiment_analysis.return_value
+    mock_http_client.post.assert_not_called()
+
+@patch("core.main.get_sentiment_analysis")
+@patch("core.main.get_bot_response")
+@patch("core.main.http_client")
+def test_process_message_runs_stages_concurrently(mock_http_client, mock_get_bot_response, mock_get_sentiment_analysis, test_db):
+    import time
+    
+    def slow(result):
+        def call(*args):
+            time.sleep(0.3)
+            return result
+        return call
+    
+    mock_get_sentiment_analysis.side_effect = slow({"Calm": 0.7})
+    mock_get_bot_response.side_effect = slow("I hear you.")
+    mock_http_client.post = AsyncMock(return_value=MagicMock(status_code=200))
+    
+    start = time.perf_counter()
+    response = client.post("/chat/message", json={"user_id": 1, "message": "Hello"})
+    elapsed = time.perf_counter() - start
+    
+    assert response.status_code == 200
+    assert response.json()["bot_message"] == "I hear you."
+    # Roughly the slower stage rather than the sum of both
+    assert elapsed < 0.55
+
+
+@patch("core.main.get_sentiment_analysis")
+@patch("core.main.get_bot_response")
+def test_process_message_persists_turn_in_two_transactions(mock_get_bot_response, mock_get_sentiment_analysis, test_db):
+    from sqlalchemy import event
+    
+    mock_get_sentiment_analysis.return_value = {"Calm": 0.7}
+    mock_get_bot_response.return_value = "I hear you."
+    statements, commits = [], []
+    
+    def count_statement(conn, cursor, statement, *args):
+        statements.append(statement)
+    
+    def count_commit(conn):
+        commits.append(conn)
+    
+    event.listen(engine, "before_cursor_execute", count_statement)
+    event.listen(engine, "commit", count_commit)
+    try:
+        first = client.post("/chat/message", json={"user_id": 1, "message": "Hello"})
+        first_turn = (len(statements), len(commits))
+        second = client.post("/chat/message", json={"user_id": 1, "message": "Hello again"})
+    finally:
+        event.remove(engine, "before_cursor_execute", count_statement)
+        event.remove(engine, "commit", count_commit)
+    
+    assert first.status_code == second.status_code == 200
+    # User upsert, two message inserts returning their ids and the outbox entry
+    assert first_turn == (4, 2)
+    # The user is known to exist from then on
+    assert (len(statements) - first_turn[0], len(commits) - first_turn[1]) == (3, 2)
+    
+    db = TestingSessionLocal()
+    assert db.query(User).count() == 1
+    assert db.query(ChatMessage).count() == 4
+    db.close()
+
+@patch.dict("core.main.UPSERT_INSERTS", clear=True)
+@patch("core.main.get_sentiment_analysis")
+@patch("core.main.get_bot_response")
+def test_placeholder_user_is_written_before_messages_without_upsert(mock_get_bot_response, mock_get_sentiment_analysis, test_db):
+    from sqlalchemy import event
+    
+    mock_get_sentiment_analysis.return_value = {"Calm": 0.7}
+    mock_get_bot_response.return_value = "I hear you."
+    inserts = []
+    
+    def record_insert(conn, cursor, statement, *args):
+        if statement.startswith("INSERT"):
+            inserts.append(statement.split()[2])
+    
+    event.listen(engine, "before_cursor_execute", record_insert)
+    try:
+        response = client.post("/chat/message", json={"user_id": 1, "message": "Hello"})
+    finally:
+        event.remove(engine, "before_cursor_execute", record_insert)
+    
+    assert response.status_code == 200
+    assert inserts[:2] == ["users", "chat_messages"]
+
+@patch("core.main.get_sentiment_analysis")
+@patch("core.main.get_bot_response")
+def test_process_message_past_deadline(mock_get_bot_response, mock_get_sentiment_analysis, test_db):
+    request_data = {"user_id": 1, "message": "Hello", "language": "en"}
+    
+    response = client.post("/chat/message", json=request_data, headers={"X-Request-Timeout": "0"})
+    
+    assert response.status_code == 504
+    mock_get_sentiment_analysis.assert_not_called()
+    mock_get_bot_response.assert_not_called()
+
+@patch("core.main.SessionLocal", TestingSessionLocal)
+@patch("core.main.get_sentiment_analysis")
+@patch("core.main.get_bot_response")
+def test_process_message_keeps_sentiment_when_reply_fails(mock_get_bot_response, mock_get_sentiment_analysis, test_db):
+    from core.models import SentimentOutbox
+    
+    mock_get_sentiment_analysis.return_value = {"Anxious": 0.8}
+    mock_get_bot_response.side_effect = RuntimeError("model error")
+    
+    response = client.post("/chat/message", json={"user_id": 1, "message": "Hello"})
+    
+    assert response.status_code == 500
+    db = TestingSessionLocal()
+    entries = db.query(SentimentOutbox).all()
+    user_message = db.query(ChatMessage).one()
+    db.close()
+    assert [entry.chat_message_id for entry in entries] == [user_message.id]
+    assert json.loads(entries[0].payload)["sentiments"] == {"Anxious": 0.8}
+
+@patch("core.main.get_sentiment_analysis")
+@patch("core.main.stream_bot_response")
+@patch("core.main.http_client")
+def test_stream_message(mock_http_client, mock_stream_bot_response, mock_get_sentiment_analysis, test_db):
+    import json
+    
+    mock_get_sentiment_analysis.return_value = {"Calm": 0.7}
+    mock_stream_bot_response.return_value = iter(["I hear ", "you."])
+    mock_http_client.post = AsyncMock(return_value=MagicMock(status_code=200))
+    
+    response = client.post("/chat/message/stream", json={"user_id": 1, "message": "Hello"})
+    
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [
+        (block.split("\n")[0][len("event: "):], json.loads(block.split("\n")[1][len("data: "):]))
+        for block in response.text.strip().split("\n\n")
+    ]
+    assert [name for name, _ in events] == ["token", "token", "sentiment", "done"]
+    assert events[2][1]["sentiment_scores"] == [{"label": "Calm", "score": 0.7}]
+    
+    # The complete reply is stored once the stream has ended
+    history = client.get("/chat/history/1").json()
+    assert [msg["message"] for msg in history] == ["Hello", "I hear you."]
+    assert history[1]["id"] == events[-1][1]["message_id"]
+
+@patch("core.sessions.SessionLocal", TestingSessionLocal)
+def test_session_round_trips_through_database(test_db):
+    from core.sessions import save_session, load_session
+    
+    session = {
+        "history": [{"role": "user", "text": "Hello"}, {"role": "model", "text": "Hi, I'm Dr. Sarah."}],
+        "summary": "The user has been feeling anxious.",
+    }
+    assert load_session(1) is None
+    
+    save_session(1, session)
+    
+    assert load_session(1) == session
+
+@patch("core.chatbot.llm")
+def test_initialize_chat_session_without_model_calls(mock_llm, test_db):
+    from core.sessions import SessionStore
+    
+    db = TestingSessionLocal()
+    for is_bot, text in [(False, "Hello"), (True, "Hi, how are you feeling?"), (False, "Tired")]:
+        db.add(ChatMessage(user_id=1, is_bot=is_bot, message_text=text))
+    db.commit()
+    db.close()
+    
+    store = SessionStore()
+    with patch("core.main.chat_sessions", store):
+        response = client.post("/chat/init-session/1")
+    
+    assert response.status_code == 200
+    assert store.get(1)["history"] == [
+        {"role": "user", "text": "Hello"},
+        {"role": "model", "text": "Hi, how are you feeling?"},
+    ]
+    assert not mock_llm.method_calls
+
+def test_chat_history_is_paginated_newest_first(test_db):
+    db = TestingSessionLocal()
+    db.add(User(id=1, email="test@example.com"))
+    db.add_all([ChatMessage(user_id=1, is_bot=i % 2 == 1, message_text=f"message {i}") for i in range(5)])
+    db.add(ChatMessage(user_id=2, message_text="someone else's message"))
+    db.commit()
+    db.close()
+    
+    pages = []
+    response = client.get("/chat/history/1", params={"limit": 2})
+    pages.append([msg["message"] for msg in response.json()])
+    while "x-next-cursor" in response.headers:
+        response = client.get("/chat/history/1", params={"limit": 2, "cursor": response.headers["x-next-cursor"]})
+        pages.append([msg["message"] for msg in response.json()])
+    
+    # Each page is in chronological order, pages go back in time
+    assert pages == [["message 3", "message 4"], ["message 1", "message 2"], ["message 0"]]
+    assert client.get("/chat/history/1").json()[0]["message"] == "message 0"
+    assert client.get("/chat/history/1", params={"limit": 1000}).status_code == 422
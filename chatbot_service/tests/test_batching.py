@@ -0,0 +1,68 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from core.batching import MicroBatcher
+
+def test_concurrent_items_share_a_batch():
+    batches = []
+    def process(items):
+        batches.append(list(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(process, window=0.2, max_size=10)
+    futures = [batcher.submit(i) for i in range(5)]
+
+    assert [future.result(timeout=2) for future in futures] == [0, 2, 4, 6, 8]
+    assert batches == [[0, 1, 2, 3, 4]]
+
+def test_full_batch_is_sent_without_waiting_for_the_window():
+    batches = []
+    def process(items):
+        batches.append(list(items))
+        return items
+
+    batcher = MicroBatcher(process, window=60, max_size=3)
+    futures = [batcher.submit(i) for i in range(3)]
+
+    assert [future.result(timeout=2) for future in futures] == [0, 1, 2]
+    assert batches == [[0, 1, 2]]
+
+def test_batches_are_capped_at_max_size():
+    sizes = []
+    lock = threading.Lock()
+    def process(items):
+        with lock:
+            sizes.append(len(items))
+        return items
+
+    batcher = MicroBatcher(process, window=0.05, max_size=4)
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        results = list(pool.map(lambda i: batcher.submit(i).result(timeout=2), range(10)))
+
+    assert results == list(range(10))
+    assert sum(sizes) == 10
+    assert max(sizes) <= 4
+
+def test_errors_reach_only_their_callers():
+    def process(items):
+        return [ValueError(item) if item == "bad" else item for item in items]
+
+    batcher = MicroBatcher(process, window=0.05, max_size=10)
+    good, bad = batcher.submit("good"), batcher.submit("bad")
+
+    assert good.result(timeout=2) == "good"
+    with pytest.raises(ValueError):
+        bad.result(timeout=2)
+
+def test_failed_batch_fails_every_item():
+    def process(items):
+        raise RuntimeError("LLM unavailable")
+
+    batcher = MicroBatcher(process, window=0.05, max_size=10)
+    futures = [batcher.submit(i) for i in range(3)]
+
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=2)
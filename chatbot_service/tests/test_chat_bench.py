@@ -0,0 +1,16 @@
+import asyncio
+
+from benchmarks.chat_bench import run_benchmark
+
+def test_chat_benchmark_runs_offline_with_stub_backend(tmp_path):
+    report = asyncio.run(run_benchmark(
+        f"sqlite:///{tmp_path / 'bench.db'}", turns=12, concurrency=4, users=3,
+        llm_latency=0.01, llm_concurrency=2, llm_queue=8,
+    ))
+    
+    results = report["results"]
+    assert report["meta"]["database"] == "sqlite"
+    assert results["statuses"] == {"200": 12}
+    # At least one reply per turn went through the stub
+    assert results["llm_calls"] >= 12
+    assert set(results["latency_ms"]) == {"p50", "p95", "p99"}
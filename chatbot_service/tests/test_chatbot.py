@@ -1,6 +1,5 @@
 import pytest
 from unittest.mock import patch, MagicMock
-import os
 
 from core.chatbot import parse_sentiment_response, get_sentiment_analysis
 
@@ -24,8 +23,8 @@ def test_parse_sentiment_response():
     assert "Angry" in result
     assert result["Angry"] == 0.1
 
-@patch("core.chatbot.sentiment_model")
-def test_get_sentiment_analysis(mock_sentiment_model):
+@patch("core.chatbot.llm")
+def test_get_sentiment_analysis(mock_llm):
     # Setup mock response
     mock_response = MagicMock()
     mock_response.text = """
@@ -47,13 +46,10 @@ def test_get_sentiment_analysis(mock_sentiment_model):
     """
     
     # Configure the mock sentiment model
-    mock_sentiment_model.generate_content.return_value = mock_response
+    mock_llm.generate.return_value = mock_response.text
     
-    # Set API key for testing
-    os.environ["GOOGLE_API_KEY"] = "test_api_key"
-    
-    # Call the function
-    result = get_sentiment_analysis("I'm feeling a bit down today")
+    # Call the function; the local scorer finds no clear cues in this message
+    result = get_sentiment_analysis("Today was a strange day, I don't know what to make of it")
     
     # Verify results
     assert isinstance(result, dict)
@@ -62,4 +58,204 @@ def test_get_sentiment_analysis(mock_sentiment_model):
     assert "Anxious" in result
     assert result["Happy"] == 0.4
     assert result["Sad"] == 0.3
-    assert result["Anxious"] == 0.6
\ No newline at end of file
+    assert result["Anxious"] == 0.6
+    mock_llm.generate.assert_called_once()
+
+@patch("core.chatbot.llm")
+def test_get_sentiment_analysis_scores_clear_messages_locally(mock_llm):
+    result = get_sentiment_analysis("I'm so anxious and worried about my exams")
+    
+    assert result["Anxious"] == 1.0
+    assert len(result) == 15
+    mock_llm.generate.assert_not_called()
+
+@patch("core.chatbot.llm")
+def test_get_sentiment_analysis_sends_crisis_messages_to_llm(mock_llm):
+    mock_llm.generate.return_value = "Crisis/Suicidal: 9\nSad: 8"
+    
+    result = get_sentiment_analysis("I'm so sad, I want to end it all")
+    
+    assert result["Crisis/Suicidal"] == 0.9
+    mock_llm.generate.assert_called_once()
+
+@patch("core.chatbot.llm")
+def test_repeated_messages_are_scored_once(mock_llm):
+    from core.sentiment_cache import SentimentCache
+    
+    mock_llm.generate.return_value = "Calm: 3"
+    
+    with patch("core.chatbot.sentiment_cache", SentimentCache(max_entries=10)):
+        first = get_sentiment_analysis("ok")
+        second = get_sentiment_analysis("OK.")
+    
+    assert first == second == {"Calm": 0.3}
+    mock_llm.generate.assert_called_once()
+
+@patch("core.chatbot.llm")
+def test_fallback_scores_are_not_cached(mock_llm):
+    from core.sentiment_cache import SentimentCache
+    
+    mock_llm.generate.side_effect = Exception("quota exceeded")
+    cache = SentimentCache(max_entries=10)
+    
+    with patch("core.chatbot.sentiment_cache", cache):
+        get_sentiment_analysis("ok")
+    
+    assert len(cache) == 0
+
+def test_parse_sentiment_batch_response():
+    from core.chatbot import parse_sentiment_batch_response
+    
+    test_input = """
+    **Message 1:**
+    Happy: 4
+    Sad: 3
+
+    Message 2:
+    Anxious: 7
+    """
+    
+    result = parse_sentiment_batch_response(test_input, 3)
+    
+    assert result[0] == {"Happy": 0.4, "Sad": 0.3}
+    assert result[1] == {"Anxious": 0.7}
+    assert result[2] == {}
+
+@patch("core.chatbot.llm")
+def test_concurrent_sentiment_analyses_share_one_llm_call(mock_llm):
+    from concurrent.futures import ThreadPoolExecutor
+    from core.chatbot import sentiment_batcher
+    
+    mock_llm.generate.return_value = "Message 1:\nCalm: 2\n\nMessage 2:\nCalm: 2"
+    messages = ["Today was a strange day", "I don't know what to make of it"]
+    
+    with patch.object(sentiment_batcher, "window", 1.0), patch.object(sentiment_batcher, "max_size", 2):
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            results = list(pool.map(get_sentiment_analysis, messages))
+    
+    assert results == [{"Calm": 0.2}, {"Calm": 0.2}]
+    mock_llm.generate.assert_called_once()
+    prompt = mock_llm.generate.call_args[0][1]
+    assert "Message 1: Today was a strange day" in prompt
+    assert "Message 2: I don't know what to make of it" in prompt
+
+@patch("core.chatbot.get_web_results")
+@patch("core.chatbot.llm")
+def test_get_bot_response_skips_search_near_deadline(mock_llm, mock_get_web_results):
+    from core.chatbot import get_bot_response
+    from core.sessions import SessionStore
+    from core.deadline import Deadline
+    
+    mock_llm.chat.return_value = "I hear you."
+    
+    with patch("core.chatbot.chat_sessions", SessionStore()):
+        # Too little time left for a search on top of the reply
+        reply = get_bot_response(1, "Can you find resources on anxiety?", Deadline(5.0))
+    
+    assert reply == "I hear you."
+    mock_get_web_results.assert_not_called()
+    assert mock_llm.chat.call_args.kwargs["timeout"] <= 5.0
+
+@patch("core.chatbot.llm")
+def test_get_bot_response_hedges_slow_replies(mock_llm):
+    import time
+    from core.chatbot import get_bot_response
+    from core.hedging import Hedger
+    from core.sessions import SessionStore
+    
+    replies = iter(["slow reply", "fast reply"])
+    
+    def chat(history, message, timeout=None):
+        reply = next(replies)
+        time.sleep(1 if reply == "slow reply" else 0.01)
+        return reply
+    
+    mock_llm.chat.side_effect = chat
+    hedger = Hedger(min_samples=1, min_delay=0, max_rate=1)
+    hedger.record("chat", 0.05)
+    
+    with patch("core.chatbot.llm_hedger", hedger), patch("core.chatbot.chat_sessions", SessionStore()):
+        assert get_bot_response(1, "Hello") == "fast reply"
+    assert mock_llm.chat.call_count == 2
+
+@patch("core.chatbot.llm")
+def test_get_bot_response_abandons_after_deadline(mock_llm):
+    from core.chatbot import get_bot_response
+    from core.deadline import Deadline, DeadlineExceeded
+    
+    with pytest.raises(DeadlineExceeded):
+        get_bot_response(1, "Hello", Deadline(0.0))
+    mock_llm.chat.assert_not_called()
+
+@patch("core.chatbot.llm")
+def test_stream_bot_response_yields_chunks(mock_llm):
+    from core.chatbot import stream_bot_response
+    from core.sessions import SessionStore
+    
+    mock_llm.chat_stream.return_value = iter(["I hear ", "you."])
+    
+    with patch("core.chatbot.chat_sessions", SessionStore()):
+        assert list(stream_bot_response(1, "Hello")) == ["I hear ", "you."]
+    mock_llm.chat_stream.assert_called_once()
+
+@patch("core.chatbot.llm")
+def test_get_bot_response_rehydrates_stored_session(mock_llm):
+    from core.chatbot import get_bot_response, primed_history
+    from core.sessions import SessionStore
+    
+    stored = {
+        "history": [
+            {"role": "user", "text": "I can't sleep."},
+            {"role": "model", "text": "That sounds exhausting."},
+        ],
+        "summary": "",
+    }
+    store = SessionStore(load=lambda user_id: stored)
+    mock_llm.chat.return_value = "Tell me more."
+    
+    with patch("core.chatbot.chat_sessions", store):
+        assert get_bot_response(1, "I had a rough day") == "Tell me more."
+    
+    # The stored history follows the pinned system prompt, which is not sent as a message
+    mock_llm.chat.assert_called_once_with(primed_history() + stored["history"], "I had a rough day", timeout=None)
+    assert store.get(1)["history"][-2:] == [
+        {"role": "user", "text": "I had a rough day"},
+        {"role": "model", "text": "Tell me more."},
+    ]
+
+def test_history_from_messages_alternates_turns():
+    from core.chatbot import history_from_messages
+    
+    messages = [
+        MagicMock(is_bot=True, message_text="Welcome back."),
+        MagicMock(is_bot=False, message_text="Hi"),
+        MagicMock(is_bot=False, message_text="Are you there?"),
+        MagicMock(is_bot=True, message_text="I'm here."),
+        MagicMock(is_bot=False, message_text="Unanswered"),
+    ]
+    
+    assert history_from_messages(messages) == [
+        {"role": "user", "text": "Hi\n\nAre you there?"},
+        {"role": "model", "text": "I'm here."},
+    ]
+
+@patch("core.chatbot.llm")
+def test_refresh_summary_folds_older_turns(mock_llm):
+    from core.chatbot import refresh_summary
+    from core.sessions import SessionStore
+    
+    mock_llm.generate.return_value = "The user talked about work stress."
+    history = []
+    for i in range(40):
+        history += [{"role": "user", "text": f"message {i} " * 40}, {"role": "model", "text": f"reply {i} " * 40}]
+    store = SessionStore()
+    store.put(1, {"history": history, "summary": ""})
+    
+    with patch("core.chatbot.chat_sessions", store):
+        refresh_summary(1)
+    
+    session = store.get(1)
+    assert session["summary"] == "The user talked about work stress."
+    assert 0 < len(session["history"]) < len(history)
+    assert session["history"] == history[-len(session["history"]):]
+    assert session["history"][0]["role"] == "user"
@@ -0,0 +1,53 @@
+from core.context import build_context, split_recent, fold_history, drop_folded, history_tokens, SUMMARY_ACKNOWLEDGEMENT
+
+PINNED = [{"role": "user", "text": "system prompt"}, {"role": "model", "text": "ok"}]
+
+def conversation(turns, words=50):
+    history = []
+    for i in range(turns):
+        history += [{"role": "user", "text": f"question {i} " * words}, {"role": "model", "text": f"answer {i} " * words}]
+    return history
+
+def test_context_stays_within_budget_however_long_the_history():
+    for turns in (1, 10, 100, 1000):
+        context = build_context(PINNED, {"history": conversation(turns), "summary": "earlier"}, max_tokens=1000)
+        
+        assert context[:2] == PINNED
+        assert history_tokens(context[2:]) <= 1000
+        assert context[2]["role"] == "user" and context[-1]["role"] == "model"
+
+def test_summary_follows_pinned_prompt():
+    context = build_context(PINNED, {"history": conversation(1), "summary": "The user is anxious."}, max_tokens=1000)
+    
+    assert "The user is anxious." in context[2]["text"]
+    assert context[3] == {"role": "model", "text": SUMMARY_ACKNOWLEDGEMENT}
+
+def test_split_recent_starts_with_user_turn():
+    history = conversation(5)
+    older, recent = split_recent(history, history_tokens(history[-3:]))
+    
+    assert older + recent == history
+    assert recent == history[-2:]
+
+def test_fold_passes_only_new_turns_to_summarizer():
+    history = conversation(10)
+    calls = []
+    
+    def summarize(summary, turns):
+        calls.append((summary, turns))
+        return "new summary"
+    
+    folded, summary = fold_history({"history": history, "summary": "old summary"}, summarize, keep_tokens=200)
+    
+    assert calls == [("old summary", folded)]
+    assert folded == history[:len(folded)]
+    assert summary == "new summary"
+
+def test_drop_folded_keeps_turns_added_meanwhile():
+    history = conversation(4)
+    folded = history[:4]
+    current = {"history": history + conversation(1), "summary": ""}
+    
+    assert drop_folded(current, folded, "s") == {"history": history[4:] + conversation(1), "summary": "s"}
+    # The history was replaced in the meantime, e.g. by a re-initialization
+    assert drop_folded({"history": conversation(1), "summary": ""}, folded, "s") is None
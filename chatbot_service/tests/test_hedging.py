@@ -0,0 +1,89 @@
+import time
+import threading
+
+import pytest
+
+from core.hedging import Hedger
+
+def warm(hedger, kind="chat", latency=0.01, count=20):
+    for _ in range(count):
+        hedger.record(kind, latency)
+
+def test_no_hedge_until_enough_latencies_are_known():
+    hedger = Hedger(min_samples=5, min_delay=0)
+    calls = []
+    
+    assert hedger.call("chat", lambda timeout: calls.append(timeout) or "reply") == "reply"
+    assert hedger.threshold("chat") is None
+    assert calls == [None]
+
+def test_threshold_is_percentile_of_recent_latencies():
+    hedger = Hedger(percentile=95, window=100, min_samples=10, min_delay=0)
+    for latency in range(1, 101):
+        hedger.record("chat", latency / 100)
+    
+    assert hedger.threshold("chat") == pytest.approx(0.95)
+    assert hedger.threshold("sentiment") is None
+    assert Hedger(min_samples=1, min_delay=0.5).threshold("chat") is None
+
+def test_slow_call_is_hedged_and_faster_response_wins():
+    hedger = Hedger(min_samples=20, min_delay=0, max_rate=1)
+    warm(hedger)
+    attempts = []
+    lock = threading.Lock()
+    
+    def call(timeout):
+        with lock:
+            attempts.append(timeout)
+            first = len(attempts) == 1
+        time.sleep(1 if first else 0.01)
+        return "slow" if first else "fast"
+    
+    start = time.perf_counter()
+    assert hedger.call("chat", call, timeout=5) == "fast"
+    assert time.perf_counter() - start < 0.5
+    assert len(attempts) == 2
+    # The hedge only gets the time the caller has left
+    assert attempts[1] < attempts[0] <= 5
+
+def test_hedge_rate_is_capped():
+    hedger = Hedger(min_samples=20, min_delay=0, max_rate=0.25)
+    warm(hedger)
+    attempts = []
+    
+    def call(timeout):
+        attempts.append(timeout)
+        time.sleep(0.03)
+        return "reply"
+    
+    for _ in range(8):
+        hedger.call("chat", call)
+    
+    # One hedge up front, then one per four calls
+    assert len(attempts) - 8 <= 3
+
+def test_failed_attempt_falls_back_to_the_other():
+    hedger = Hedger(min_samples=20, min_delay=0, max_rate=1)
+    warm(hedger)
+    attempts = []
+    
+    def call(timeout):
+        attempts.append(timeout)
+        if len(attempts) == 1:
+            time.sleep(0.05)
+            raise RuntimeError("model error")
+        time.sleep(0.1)
+        return "reply"
+    
+    assert hedger.call("chat", call) == "reply"
+
+def test_errors_and_timeouts_reach_the_caller():
+    hedger = Hedger(min_samples=1)
+    
+    def fail(timeout):
+        raise RuntimeError("model error")
+    
+    with pytest.raises(RuntimeError):
+        hedger.call("chat", fail)
+    with pytest.raises(TimeoutError):
+        hedger.call("chat", lambda timeout: time.sleep(0.5), timeout=0.05)
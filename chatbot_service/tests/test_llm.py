@@ -0,0 +1,130 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+import pytest
+
+from core.llm import LLMBusy, GeminiBackend, StubBackend, stub_response
+from core.chatbot import SENTIMENT_ANALYSIS_PROMPT, parse_sentiment_response, sentiment_batch_prompt, parse_sentiment_batch_response
+
+class BlockingBackend(StubBackend):
+    """Stub whose calls run until released, counting how many run at once"""
+
+    def __init__(self, **limits):
+        super().__init__(**limits)
+        self.release = threading.Event()
+        self.running = 0
+        self.max_running = 0
+        self._count_lock = threading.Lock()
+
+    def _generate(self, model, prompt, timeout):
+        with self._count_lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        self.release.wait(2)
+        with self._count_lock:
+            self.running -= 1
+        return "done"
+
+def test_concurrent_calls_are_capped():
+    backend = BlockingBackend(max_concurrency=2, max_queue=10, queue_timeout=2)
+    
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        futures = [pool.submit(backend.generate, "sentiment", "prompt") for _ in range(6)]
+        time.sleep(0.1)
+        assert backend.running == 2
+        assert backend.waiting == 4
+        backend.release.set()
+        assert [future.result() for future in futures] == ["done"] * 6
+    
+    assert backend.max_running == 2
+
+def test_calls_beyond_the_queue_are_rejected():
+    backend = BlockingBackend(max_concurrency=1, max_queue=1, queue_timeout=2)
+    
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        running = pool.submit(backend.generate, "sentiment", "prompt")
+        queued = pool.submit(backend.generate, "sentiment", "prompt")
+        time.sleep(0.1)
+        with pytest.raises(LLMBusy):
+            backend.generate("sentiment", "prompt")
+        backend.release.set()
+        assert running.result() == queued.result() == "done"
+
+def test_queued_calls_give_up_after_their_timeout():
+    backend = BlockingBackend(max_concurrency=1, max_queue=5, queue_timeout=10)
+    
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        running = pool.submit(backend.generate, "sentiment", "prompt")
+        time.sleep(0.05)
+        start = time.monotonic()
+        with pytest.raises(LLMBusy):
+            backend.generate("sentiment", "prompt", timeout=0.1)
+        assert time.monotonic() - start < 1
+        backend.release.set()
+        running.result()
+    assert backend.waiting == 0
+
+def test_stream_holds_its_slot_until_it_ends():
+    backend = StubBackend(max_concurrency=1, max_queue=0)
+    stream = backend.chat_stream([], "Hello")
+    
+    next(stream)
+    with pytest.raises(LLMBusy):
+        backend.chat([], "Hello")
+    list(stream)
+    assert backend.chat([], "Hello")
+
+def test_stub_responses_are_deterministic_and_parseable():
+    backend = StubBackend(latency=0.0)
+    prompt = f"{SENTIMENT_ANALYSIS_PROMPT}\n\nAnalyze this message: Today was long"
+    
+    scores = parse_sentiment_response(backend.generate("sentiment", prompt))
+    assert len(scores) == 15
+    assert scores == parse_sentiment_response(backend.generate("sentiment", prompt))
+    
+    batch = f"{sentiment_batch_prompt()}\n\nAnalyze these messages:\n\nMessage 1: one\n\nMessage 2: two"
+    assert [len(scores) for scores in parse_sentiment_batch_response(backend.generate("sentiment", batch), 2)] == [15, 15]
+    
+    reply = backend.chat([], "I had a rough day")
+    assert reply == stub_response("chat", "I had a rough day")
+    assert "".join(backend.chat_stream([], "I had a rough day")) == reply
+
+def test_stub_latency_respects_the_timeout():
+    backend = StubBackend(latency=1.0)
+    
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        backend.chat([], "Hello", timeout=0.05)
+    assert time.monotonic() - start < 0.5
+
+def test_gemini_backend_passes_history_and_timeout():
+    genai = MagicMock()
+    model = genai.GenerativeModel.return_value
+    model.start_chat.return_value.send_message.return_value.text = "I hear you."
+    backend = GeminiBackend(genai, "gemini-test", {"chat": {"temperature": 0.4}})
+    
+    reply = backend.chat([{"role": "user", "text": "Hi"}, {"role": "model", "text": "Hello"}], "How are you?", timeout=5.0)
+    
+    assert reply == "I hear you."
+    model.start_chat.assert_called_once_with(history=[
+        {"role": "user", "parts": ["Hi"]},
+        {"role": "model", "parts": ["Hello"]},
+    ])
+    assert model.start_chat.return_value.send_message.call_args.kwargs["request_options"]["timeout"] <= 5.0
+
+def test_gemini_backend_matches_the_installed_sdk():
+    genai = pytest.importorskip("google.generativeai")
+    from unittest.mock import patch
+    
+    backend = GeminiBackend(genai, "gemini-1.5-flash-latest", {"chat": {}, "sentiment": {}})
+    response = MagicMock(text="reply")
+    # autospec checks every call against the SDK's real signatures
+    with patch.object(genai.GenerativeModel, "generate_content", autospec=True, return_value=response) as generate, \
+            patch.object(genai.ChatSession, "send_message", autospec=True, return_value=response) as send:
+        assert backend.generate("sentiment", "Hello", timeout=5) == "reply"
+        assert backend.chat([{"role": "user", "text": "Hi"}], "Hello") == "reply"
+    
+    assert 4 < generate.call_args.kwargs["request_options"]["timeout"] <= 5
+    assert send.call_args.kwargs["request_options"] is None
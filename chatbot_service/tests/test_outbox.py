@@ -0,0 +1,136 @@
+import json
+import asyncio
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from core.database import Base
+from core.models import SentimentOutbox
+from core.outbox import SentimentOutboxDispatcher, enqueue_sentiment, retry_delay
+
+engine = create_engine("sqlite:///./test.db", connect_args={"check_same_thread": False})
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+@pytest.fixture(scope="function")
+def test_db():
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+def add_entries(count):
+    db = TestingSessionLocal()
+    for message_id in range(1, count + 1):
+        enqueue_sentiment(db, 1, message_id, {"Calm": 0.5}, "en")
+    db.commit()
+    db.close()
+
+def outbox_rows():
+    db = TestingSessionLocal()
+    rows = db.query(SentimentOutbox).order_by(SentimentOutbox.id).all()
+    db.close()
+    return rows
+
+def dispatcher(handler, batch_size=10):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return SentimentOutboxDispatcher(TestingSessionLocal, client, "http://sentiment", batch_size=batch_size)
+
+def test_entries_are_delivered_in_batches_and_removed(test_db):
+    add_entries(3)
+    batches = []
+    def handler(request):
+        batches.append(json.loads(request.content)["items"])
+        return httpx.Response(200, json={"stored": len(batches[-1])})
+    
+    outbox = dispatcher(handler, batch_size=2)
+    delivered = [asyncio.run(outbox.dispatch_once()) for _ in range(3)]
+    
+    assert delivered == [2, 1, 0]
+    assert [[item["chat_message_id"] for item in batch] for batch in batches] == [[1, 2], [3]]
+    assert batches[0][0] == {"user_id": 1, "chat_message_id": 1, "sentiments": {"Calm": 0.5}, "language": "en"}
+    assert outbox_rows() == []
+
+def test_failed_deliveries_are_kept_and_retried_later(test_db):
+    add_entries(2)
+    outbox = dispatcher(lambda request: httpx.Response(503))
+    
+    before = datetime.utcnow()
+    assert asyncio.run(outbox.dispatch_once()) == 0
+    
+    rows = outbox_rows()
+    assert [row.attempts for row in rows] == [1, 1]
+    assert all("503" in row.last_error for row in rows)
+    assert all(row.next_attempt_at >= before + timedelta(seconds=retry_delay(1)) for row in rows)
+    # Not due again until the backoff has passed
+    assert asyncio.run(outbox.dispatch_once()) == 0
+    assert [row.attempts for row in outbox_rows()] == [1, 1]
+
+def test_unreachable_service_keeps_entries(test_db):
+    add_entries(1)
+    def handler(request):
+        raise httpx.ConnectError("connection refused")
+    
+    assert asyncio.run(dispatcher(handler).dispatch_once()) == 0
+    assert len(outbox_rows()) == 1
+
+def test_rejected_entries_are_dead_lettered(test_db):
+    add_entries(2)
+    def handler(request):
+        return httpx.Response(200, json={"stored": 1, "results": [
+            {"chat_message_id": 1, "status": "stored"},
+            {"chat_message_id": 2, "status": "rejected", "detail": "Label too long"},
+        ]})
+    
+    outbox = dispatcher(handler)
+    assert asyncio.run(outbox.dispatch_once()) == 1
+    
+    rows = outbox_rows()
+    assert [(row.chat_message_id, row.last_error) for row in rows] == [(2, "Label too long")]
+    assert rows[0].dead_lettered_at is not None
+    # Dead-lettered entries are never sent again
+    db = TestingSessionLocal()
+    db.query(SentimentOutbox).update({"next_attempt_at": datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+    db.close()
+    assert asyncio.run(outbox.dispatch_once()) == 0
+
+def test_failed_batch_is_split_around_a_bad_entry(test_db):
+    add_entries(3)
+    sizes = []
+    def handler(request):
+        items = json.loads(request.content)["items"]
+        sizes.append(len(items))
+        if any(item["chat_message_id"] == 2 for item in items):
+            return httpx.Response(422, json={"detail": "invalid"})
+        return httpx.Response(200, json={"stored": len(items)})
+    
+    assert asyncio.run(dispatcher(handler).dispatch_once()) == 2
+    
+    assert sizes == [3, 1, 1, 1]
+    rows = outbox_rows()
+    assert [row.chat_message_id for row in rows] == [2]
+    assert rows[0].dead_lettered_at is not None and "422" in rows[0].last_error
+
+def test_entries_are_dead_lettered_after_max_attempts(test_db):
+    from core.outbox import OUTBOX_MAX_ATTEMPTS
+    
+    add_entries(1)
+    db = TestingSessionLocal()
+    db.query(SentimentOutbox).update({"attempts": OUTBOX_MAX_ATTEMPTS - 1})
+    db.commit()
+    db.close()
+    
+    assert asyncio.run(dispatcher(lambda request: httpx.Response(503)).dispatch_once()) == 0
+    
+    row = outbox_rows()[0]
+    assert row.attempts == OUTBOX_MAX_ATTEMPTS
+    assert row.dead_lettered_at is not None
+
+def test_retry_delay_backs_off_exponentially_up_to_the_maximum():
+    from core.outbox import OUTBOX_RETRY_BASE, OUTBOX_RETRY_MAX
+    
+    assert retry_delay(1) == OUTBOX_RETRY_BASE
+    assert retry_delay(3) == OUTBOX_RETRY_BASE * 4
+    assert retry_delay(100) == OUTBOX_RETRY_MAX
@@ -0,0 +1,10 @@
+from benchmarks.persistence_bench import run_benchmark
+
+def test_current_turn_persistence_takes_fewer_round_trips(tmp_path):
+    report = run_benchmark(f"sqlite:///{tmp_path / 'bench.db'}", turns=20, users=4)
+    
+    legacy, current = report["results"]["legacy"], report["results"]["current"]
+    assert report["meta"]["database"] == "sqlite"
+    assert current["commits_per_turn"] == 2.0
+    assert current["statements_per_turn"] < legacy["statements_per_turn"]
+    assert set(current["latency_ms"]) == {"p50", "p95", "p99"}
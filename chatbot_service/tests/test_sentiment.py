@@ -0,0 +1,29 @@
+from core.sentiment import score_sentiment, SENTIMENT_LABELS
+
+def test_scores_cover_every_label_on_the_llm_scale():
+    result = score_sentiment("I feel really lonely and overwhelmed, it is all too much")
+    
+    assert list(result.scores) == SENTIMENT_LABELS
+    assert all(0.0 <= score <= 1.0 for score in result.scores.values())
+    assert result.scores["Lonely"] > 0.5
+    assert result.scores["Overwhelmed"] > 0.5
+    assert not result.needs_llm
+
+def test_messages_without_cues_need_the_llm():
+    result = score_sentiment("Hello, how does this work?")
+    
+    assert result.confidence == 0.0
+    assert result.needs_llm
+
+def test_negated_cues_are_ignored():
+    assert score_sentiment("I am not happy at all").scores["Happy"] == 0.0
+    assert score_sentiment("I am happy").scores["Happy"] > 0.0
+
+def test_intensifiers_strengthen_cues():
+    assert score_sentiment("I'm very sad").scores["Sad"] > score_sentiment("I'm sad").scores["Sad"]
+
+def test_crisis_cues_always_need_the_llm():
+    for message in ("Sometimes I want to die", "I don't want to hurt myself", "I have been thinking about suicide"):
+        result = score_sentiment(message)
+        assert result.crisis
+        assert result.needs_llm
@@ -0,0 +1,43 @@
+from core.sentiment_cache import SentimentCache, normalize_message
+
+def test_normalized_messages_share_an_entry():
+    cache = SentimentCache(max_entries=10)
+    cache.set("I'm tired", {"Depressed": 0.5})
+    
+    assert normalize_message("  I'M   tired!! ") == "i'm tired"
+    assert cache.get("i'm TIRED.") == {"Depressed": 0.5}
+    assert cache.get("I'm not tired") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SentimentCache(max_entries=2)
+    cache.set("ok", {"Calm": 0.3})
+    cache.set("thank you", {"Grateful": 0.8})
+    cache.get("ok")
+    cache.set("hello", {"Calm": 0.1})
+    
+    assert len(cache) == 2
+    assert cache.get("thank you") is None
+    assert cache.get("ok") == {"Calm": 0.3}
+
+def test_cached_scores_cannot_be_changed_by_callers():
+    cache = SentimentCache(max_entries=10)
+    cache.set("ok", {"Calm": 0.3})
+    cache.get("ok")["Calm"] = 1.0
+    
+    assert cache.get("ok") == {"Calm": 0.3}
+
+def test_entries_persist_across_restarts(tmp_path):
+    path = tmp_path / "sentiment_cache.json"
+    cache = SentimentCache(max_entries=10, path=str(path))
+    cache.set("thank you", {"Grateful": 0.8})
+    cache.save()
+    
+    assert "thank you" not in path.read_text()
+    assert SentimentCache(max_entries=10, path=str(path)).get("Thank you!") == {"Grateful": 0.8}
+
+def test_unreadable_file_starts_an_empty_cache(tmp_path):
+    path = tmp_path / "sentiment_cache.json"
+    path.write_text("not json")
+    
+    assert len(SentimentCache(max_entries=10, path=str(path))) == 0
@@ -0,0 +1,124 @@
+import json
+
+from core.sessions import SessionStore, parse_session_data
+from conftest import FakeClock
+
+class SavedSessions(dict):
+    """Stands in for the database, recording each batch written"""
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+    
+    def __call__(self, sessions):
+        self.batches.append([user_id for user_id, _ in sessions])
+        self.update(sessions)
+
+def turns(*texts):
+    return {"history": [{"role": "user", "text": text} for text in texts], "summary": ""}
+
+def test_least_recently_used_session_is_evicted_and_saved():
+    saved = SavedSessions()
+    store = SessionStore(save=saved, max_sessions=2)
+    
+    store.put(1, turns("a"))
+    store.put(2, turns("b"))
+    store.get(1)
+    store.put(3, turns("c"))
+    
+    assert 2 not in store and 1 in store and 3 in store
+    # Nothing is written while serving requests
+    assert saved == {}
+    # Until saved, the evicted session is still served from memory
+    assert store.get(2) == turns("b")
+    
+    store.sync()
+    assert len(saved.batches) == 1
+    assert sorted(saved.batches[0]) == [1, 2, 3]
+
+def test_memory_cap_evicts_until_under_limit():
+    saved = SavedSessions()
+    store = SessionStore(save=saved, max_bytes=200)
+    
+    store.put(1, turns("x" * 50))
+    store.put(2, turns("y" * 50))
+    store.sync()
+    
+    assert 1 not in store
+    assert saved == {1: turns("x" * 50), 2: turns("y" * 50)}
+    assert store.size_bytes <= 200
+
+def test_idle_sessions_expire():
+    clock = FakeClock()
+    saved = SavedSessions()
+    store = SessionStore(save=saved, idle_ttl=60, clock=clock)
+    
+    store.put(1, turns("a"))
+    clock.now = 61
+    store.put(2, turns("b"))
+    store.sync()
+    
+    assert 1 not in store and 2 in store
+    assert saved == {1: turns("a"), 2: turns("b")}
+    assert len(saved.batches) == 1
+
+def test_miss_is_loaded_from_storage():
+    store = SessionStore(load=lambda user_id: turns("stored") if user_id == 1 else None)
+    
+    assert store.get(1) == turns("stored")
+    assert 1 in store
+    assert store.get(2) is None
+
+def test_flush_saves_every_session():
+    saved = SavedSessions()
+    store = SessionStore(save=saved)
+    store.put(1, turns("a"))
+    store.put(2, turns("b"))
+    
+    store.flush()
+    
+    assert saved == {1: turns("a"), 2: turns("b")}
+
+def test_sync_writes_only_changed_sessions():
+    saved = SavedSessions()
+    store = SessionStore(load=lambda user_id: turns("stored"), save=saved)
+    store.get(1)
+    store.put(2, turns("b"))
+    
+    store.sync()
+    store.sync()
+    store.update(2, lambda session: {**session, "summary": "talked about b"})
+    store.sync()
+    
+    assert saved.batches == [[2], [2]]
+    assert saved[2]["summary"] == "talked about b"
+
+def test_failed_save_is_retried():
+    attempts = []
+    def save(sessions):
+        attempts.append(dict(sessions))
+        if len(attempts) == 1:
+            raise RuntimeError("database unavailable")
+    store = SessionStore(save=save, max_sessions=1)
+    store.put(1, turns("a"))
+    store.put(2, turns("b"))
+    
+    store.sync()
+    store.sync()
+    
+    assert attempts[1] == {1: turns("a"), 2: turns("b")}
+
+def test_update_applies_change_atomically():
+    store = SessionStore()
+    store.put(1, turns("a"))
+    
+    updated = store.update(1, lambda session: {**session, "summary": "talked about a"})
+    
+    assert updated == store.get(1) == {**turns("a"), "summary": "talked about a"}
+    assert store.update(2, lambda session: session) is None
+    assert store.update(1, lambda session: None) is None
+
+def test_parse_session_data_accepts_legacy_rows():
+    assert parse_session_data(json.dumps([])) == turns()
+    assert parse_session_data(None) == turns()
+    assert parse_session_data(json.dumps(turns("a")["history"])) == turns("a")
+    assert parse_session_data(json.dumps({**turns("a"), "summary": "s"})) == {**turns("a"), "summary": "s"}
@@ -0,0 +1,86 @@
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+
+from core.web_search import WebSearchClient
+from conftest import FakeClock
+
+def fake_service(links, release=None):
+    """Service object whose searches return `links`, optionally waiting for `release`"""
+    service = MagicMock()
+    def execute():
+        if release is not None:
+            release.wait(2)
+        return {"items": [{"link": link} for link in links]}
+    service.cse.return_value.list.return_value.execute.side_effect = execute
+    return service
+
+def test_service_is_built_once():
+    build = MagicMock(return_value=fake_service(["https://a"]))
+    client = WebSearchClient(build, "engine", workers=1)
+    
+    client.search("anxiety help", timeout=2)
+    client.search("depression help", timeout=2)
+    
+    build.assert_called_once()
+
+def test_results_are_cached_by_normalized_query_until_they_expire():
+    service = fake_service(["https://a", "https://b"])
+    clock = FakeClock()
+    client = WebSearchClient(lambda: service, "engine", ttl=60, clock=clock)
+    
+    assert client.search("Postpartum depression resources", timeout=2) == ["https://a", "https://b"]
+    assert client.search("  postpartum   DEPRESSION resources", timeout=2) == ["https://a", "https://b"]
+    assert service.cse.return_value.list.call_count == 1
+    
+    clock.now = 61
+    client.search("postpartum depression resources", timeout=2)
+    assert service.cse.return_value.list.call_count == 2
+
+def test_least_recently_used_query_is_evicted():
+    service = fake_service(["https://a"])
+    client = WebSearchClient(lambda: service, "engine", max_entries=1)
+    
+    client.search("anxiety", timeout=2)
+    client.search("stress", timeout=2)
+    client.search("anxiety", timeout=2)
+    
+    assert service.cse.return_value.list.call_count == 3
+
+def test_concurrent_identical_searches_share_one_request():
+    release = threading.Event()
+    service = fake_service(["https://a"], release)
+    client = WebSearchClient(lambda: service, "engine")
+    results = []
+    
+    callers = [threading.Thread(target=lambda: results.append(client.search("anxiety", timeout=2))) for _ in range(3)]
+    for caller in callers:
+        caller.start()
+    release.set()
+    for caller in callers:
+        caller.join()
+    
+    assert results == [["https://a"]] * 3
+    assert service.cse.return_value.list.call_count == 1
+
+def test_timed_out_search_still_fills_the_cache():
+    release = threading.Event()
+    service = fake_service(["https://a"], release)
+    client = WebSearchClient(lambda: service, "engine")
+    
+    with pytest.raises(TimeoutError):
+        client.search("anxiety", timeout=0.01)
+    release.set()
+    
+    assert client.search("anxiety", timeout=2) == ["https://a"]
+    assert service.cse.return_value.list.call_count == 1
+
+def test_failed_searches_are_not_cached():
+    service = fake_service(["https://a"])
+    service.cse.return_value.list.return_value.execute.side_effect = [Exception("quota exceeded"), {"items": []}]
+    client = WebSearchClient(lambda: service, "engine")
+    
+    with pytest.raises(Exception):
+        client.search("anxiety", timeout=2)
+    assert client.search("anxiety", timeout=2) == []
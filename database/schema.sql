@@ -35,6 +35,9 @@ CREATE TABLE IF NOT EXISTS chat_messages (
     created_at TIMESTAMP NOT NULL DEFAULT NOW()
 );
 
+-- Chat history is read page by page per user, newest first
+CREATE INDEX IF NOT EXISTS ix_chat_messages_user_id_created_at_id ON chat_messages (user_id, created_at, id);
+
 -- Sentiment scores table
 CREATE TABLE IF NOT EXISTS sentiment_scores (
     id SERIAL PRIMARY KEY,
@@ -45,6 +48,20 @@ CREATE TABLE IF NOT EXISTS sentiment_scores (
     recorded_at TIMESTAMP NOT NULL DEFAULT NOW()
 );
 
+-- Sentiment scores the chatbot service has yet to deliver to the sentiment service
+CREATE TABLE IF NOT EXISTS sentiment_outbox (
+    id SERIAL PRIMARY KEY,
+    chat_message_id INT REFERENCES chat_messages(id),
+    payload TEXT NOT NULL,
+    attempts INT NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    last_error TEXT,
+    dead_lettered_at TIMESTAMP,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS ix_sentiment_outbox_next_attempt_at ON sentiment_outbox (next_attempt_at);
+
 -- Video sentiment analysis table
 CREATE TABLE IF NOT EXISTS video_sentiments (
     id SERIAL PRIMARY KEY,
@@ -1,10 +1,11 @@
-import React, { useState } from 'react';
+import React, { useState, useEffect } from 'react';
 import { BrowserRouter, Routes, Route, Navigate } from 'react-router-dom';
 import Auth from './pages/Auth';
 import Dashboard from './pages/Dashboard';
 import Chat from './pages/Chat';
 import Resources from './pages/Resources';
 import { login } from './services/authService';
+import { SESSION_EXPIRED_EVENT } from './services/api';
 
 const App = () => {
   const [isAuthenticated, setIsAuthenticated] = useState(
@@ -12,6 +13,13 @@ const App = () => {
   );
   const [error, setError] = useState(null);
 
+  // Back to the login page once the session can no longer be renewed
+  useEffect(() => {
+    const handleSessionExpired = () => setIsAuthenticated(false);
+    window.addEventListener(SESSION_EXPIRED_EVENT, handleSessionExpired);
+    return () => window.removeEventListener(SESSION_EXPIRED_EVENT, handleSessionExpired);
+  }, []);
+
   const handleLogin = async (email, password) => {
     try {
       setError(null);
@@ -42,10 +42,11 @@ const formatMessageWithLinks = (text) => {
   });
 };
 
-const ChatInterface = ({ messages, onSendMessage, onSendAudio, isLoading }) => {
+const ChatInterface = ({ messages, onSendMessage, onSendAudio, isLoading, hasOlderMessages, onLoadOlder, isLoadingOlder }) => {
   const [input, setInput] = useState('');
   const [showVoiceRecorder, setShowVoiceRecorder] = useState(false);
   const messagesEndRef = useRef(null);
+  const lastMessageIdRef = useRef(null);
 
   const handleSend = () => {
     if (input.trim() !== '' && !isLoading) {
@@ -67,11 +68,22 @@ const ChatInterface = ({ messages, onSendMessage, onSendAudio, isLoading }) => {
     }
   };
 
-  // Auto-scroll to bottom when messages change
+  // Auto-scroll to bottom when a new message arrives, not when older ones are loaded
   useEffect(() => {
-    messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
+    const lastMessageId = messages && messages.length > 0 ? messages[messages.length - 1].id : null;
+    if (lastMessageId !== lastMessageIdRef.current) {
+      lastMessageIdRef.current = lastMessageId;
+      messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
+    }
   }, [messages]);
 
+  // Scrolling to the top loads the previous page of the conversation
+  const handleScroll = (e) => {
+    if (e.currentTarget.scrollTop === 0 && hasOlderMessages && !isLoadingOlder) {
+      onLoadOlder();
+    }
+  };
+
   return (
     <div style={{
       backgroundColor: colors.cardBackground,
@@ -100,7 +112,17 @@ const ChatInterface = ({ messages, onSendMessage, onSendAudio, isLoading }) => {
         gap: '16px',
         marginBottom: '16px',
         padding: '10px'
-      }}>
+      }} onScroll={handleScroll}>
+        {hasOlderMessages && (
+          <Button
+            onClick={onLoadOlder}
+            variant="ghost"
+            size="small"
+            style={{ alignSelf: 'center' }}
+          >
+            {isLoadingOlder ? 'Loading...' : 'Load earlier messages'}
+          </Button>
+        )}
         {messages && messages.length > 0 ? (
           messages.map((msg) => (
             <div 
@@ -19,6 +19,7 @@ const Header = ({ onLogout }) => {
       // Clear all chat-related data
       localStorage.removeItem('chatMessages');
       localStorage.removeItem('chatSessionInitialized');
+      localStorage.removeItem('chatHistoryCursor');
       
       // Call the onLogout prop to update App state
       onLogout();
@@ -8,6 +8,24 @@ const Chat = ({ onLogout }) => {
   const [messages, setMessages] = useState([]);
   const [isLoading, setIsLoading] = useState(false);
   const [error, setError] = useState(null);
+  // Cursor of the next older page of history, if there is one
+  const [olderCursor, setOlderCursor] = useState(localStorage.getItem('chatHistoryCursor'));
+  const [isLoadingOlder, setIsLoadingOlder] = useState(false);
+  
+  const updateOlderCursor = (cursor) => {
+    setOlderCursor(cursor || null);
+    if (cursor) {
+      localStorage.setItem('chatHistoryCursor', cursor);
+    } else {
+      localStorage.removeItem('chatHistoryCursor');
+    }
+  };
+  
+  const formatHistory = (history) => history.map(msg => ({
+    id: msg.id,
+    text: msg.message,
+    sender: msg.is_bot ? 'ai' : 'user'
+  }));
   
   // Load chat history on component mount - only once after login
   useEffect(() => {
@@ -49,19 +67,16 @@ const Chat = ({ onLogout }) => {
           localStorage.setItem('chatSessionInitialized', 'true');
         }
         
-        // Fetch the history
+        // Fetch the most recent page; older pages are loaded on demand
         console.log('Fetching chat history for user:', userId);
         const response = await api.get(`/chat/history/${userId}`);
         
         if (response.data && Array.isArray(response.data)) {
-          const formattedMessages = response.data.map(msg => ({
-            id: msg.id,
-            text: msg.message,
-            sender: msg.is_bot ? 'ai' : 'user'
-          }));
+          const formattedMessages = formatHistory(response.data);
           
           // Update state
           setMessages(formattedMessages);
+          updateOlderCursor(response.headers['x-next-cursor']);
           
           // Store in localStorage
           localStorage.setItem('chatMessages', JSON.stringify(formattedMessages));
@@ -77,6 +92,34 @@ const Chat = ({ onLogout }) => {
     fetchChatHistory();
   }, []);
 
+  // Prepend the next older page of history
+  const loadOlderMessages = async () => {
+    const userId = localStorage.getItem('user_id');
+    if (!olderCursor || !userId || isLoadingOlder) return;
+    
+    setIsLoadingOlder(true);
+    try {
+      const response = await api.get(`/chat/history/${userId}`, {
+        params: { cursor: olderCursor }
+      });
+      if (Array.isArray(response.data)) {
+        const olderMessages = formatHistory(response.data);
+        // Messages sent while the page was loading stay in place
+        setMessages(current => {
+          const combined = [...olderMessages, ...current];
+          localStorage.setItem('chatMessages', JSON.stringify(combined));
+          return combined;
+        });
+        updateOlderCursor(response.headers['x-next-cursor']);
+      }
+    } catch (err) {
+      console.error('Failed to load earlier messages:', err);
+      setError('Failed to load earlier messages. Please try again.');
+    } finally {
+      setIsLoadingOlder(false);
+    }
+  };
+
   // Function to update message storage
   const updateMessageStorage = (newMessages) => {
     setMessages(newMessages);
@@ -237,6 +280,7 @@ const Chat = ({ onLogout }) => {
     // Clear chat-related items from localStorage on logout
     localStorage.removeItem('chatMessages');
     localStorage.removeItem('chatSessionInitialized');
+    localStorage.removeItem('chatHistoryCursor');
     
     // Call the original onLogout function
     onLogout();
@@ -273,6 +317,9 @@ const Chat = ({ onLogout }) => {
           onSendMessage={handleSendMessage}
           onSendAudio={handleSendAudio}
           isLoading={isLoading}
+          hasOlderMessages={!!olderCursor}
+          onLoadOlder={loadOlderMessages}
+          isLoadingOlder={isLoadingOlder}
         />
       </div>
     </div>
@@ -22,4 +22,66 @@ api.interceptors.request.use(
   (error) => Promise.reject(error)
 );
 
+// Fired when the session can't be renewed and the user has to log in again
+export const SESSION_EXPIRED_EVENT = 'session-expired';
+
+const clearSession = () => {
+  localStorage.removeItem('token');
+  localStorage.removeItem('refresh_token');
+  localStorage.removeItem('user_id');
+  localStorage.removeItem('chatMessages');
+  localStorage.removeItem('chatSessionInitialized');
+  localStorage.removeItem('chatHistoryCursor');
+  window.dispatchEvent(new Event(SESSION_EXPIRED_EVENT));
+};
+
+// One refresh at a time; requests failing meanwhile wait for the same one
+let refreshing = null;
+
+const refreshAccessToken = () => {
+  if (!refreshing) {
+    const refresh_token = localStorage.getItem('refresh_token');
+    refreshing = (refresh_token
+      ? axios.post(`${API_URL}/auth/refresh`, { refresh_token })
+      : Promise.reject(new Error('No refresh token'))
+    )
+      .then((response) => {
+        localStorage.setItem('token', response.data.access_token);
+        return response.data.access_token;
+      })
+      .finally(() => {
+        refreshing = null;
+      });
+  }
+  return refreshing;
+};
+
+// Access tokens expire; renew the token once and retry, or end the session
+api.interceptors.response.use(
+  (response) => response,
+  async (error) => {
+    const config = error.config;
+    if (
+      !error.response ||
+      error.response.status !== 401 ||
+      !config ||
+      config._retried ||
+      config.url.startsWith('/auth/')
+    ) {
+      return Promise.reject(error);
+    }
+
+    try {
+      const token = await refreshAccessToken();
+      config._retried = true;
+      config.headers.Authorization = `Bearer ${token}`;
+      return api(config);
+    } catch (refreshError) {
+      console.error('Session expired, logging out:', refreshError);
+      clearSession();
+      return Promise.reject(error);
+    }
+  }
+);
+
 export default api;
\ No newline at end of file
@@ -1,11 +1,13 @@
 from fastapi import FastAPI
 from app.api.endpoints import router as api_router
+from app.core.metrics import instrument_app
 
 app = FastAPI(
     title="Serene RAG Backend",
     description="RAG-powered resource recommendation and sentiment analysis API for mental health support.",
     version="1.0.0"
 )
+instrument_app(app)
 
 app.include_router(api_router, prefix="/api")
 
@@ -1,22 +1,25 @@
 from app.core.database import get_db_connection
+from app.core.metrics import track_dependency
 
 def save_user_message(user_id, message, sentiment_score):
     conn = get_db_connection()
     c = conn.cursor()
-    c.execute(
-        "INSERT INTO user_history (user_id, message, sentiment_score) VALUES (?, ?, ?)",
-        (user_id, message, sentiment_score)
-    )
-    conn.commit()
+    with track_dependency("db", "insert"):
+        c.execute(
+            "INSERT INTO user_history (user_id, message, sentiment_score) VALUES (?, ?, ?)",
+            (user_id, message, sentiment_score)
+        )
+        conn.commit()
     conn.close()
 
 def get_user_history(user_id, limit=10):
     conn = get_db_connection()
     c = conn.cursor()
-    c.execute(
-        "SELECT message, sentiment_score, timestamp FROM user_history WHERE user_id = ? ORDER BY timestamp DESC LIMIT ?",
-        (user_id, limit)
-    )
-    rows = c.fetchall()
+    with track_dependency("db", "select"):
+        c.execute(
+            "SELECT message, sentiment_score, timestamp FROM user_history WHERE user_id = ? ORDER BY timestamp DESC LIMIT ?",
+            (user_id, limit)
+        )
+        rows = c.fetchall()
     conn.close()
     return [dict(row) for row in rows]
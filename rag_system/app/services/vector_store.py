@@ -2,6 +2,8 @@ import faiss
 import numpy as np
 from sentence_transformers import SentenceTransformer
 
+from app.core.metrics import track_dependency
+
 class VectorStore:
     def __init__(self, resources):
         self.model = SentenceTransformer("all-MiniLM-L6-v2")
@@ -17,6 +19,8 @@ class VectorStore:
         self.index.add(np.array(self.embeddings, dtype=np.float32))
 
     def query(self, query_text, top_k=3):
-        query_vec = self.model.encode([query_text])
-        D, I = self.index.search(np.array(query_vec, dtype=np.float32), top_k)
+        with track_dependency("embedding", "encode"):
+            query_vec = self.model.encode([query_text])
+        with track_dependency("faiss", "search"):
+            D, I = self.index.search(np.array(query_vec, dtype=np.float32), top_k)
         return [self.resources[i] for i in I[0]]
@@ -5,12 +5,15 @@ from typing import List, Dict
 from datetime import datetime, timedelta
 import pandas as pd
 import json
+import math
 
 from .database import get_db
+from .metrics import instrument_app
 from .models import User, ChatMessage, SentimentScore, VideoSentiment
-from .schemas import SentimentRequest, SentimentResponse, DailySentiment, VideoEmotionData, VideoSentimentResponse, ChatSentimentData
+from .schemas import SentimentRequest, SentimentResponse, DailySentiment, VideoEmotionData, VideoSentimentResponse, ChatSentimentData, ChatSentimentBatch
 
 app = FastAPI()
+instrument_app(app)
 
 @app.get("/")
 def read_root():
@@ -204,4 +207,65 @@ def store_chat_sentiment(data: ChatSentimentData, db: Session = Depends(get_db))
         return {"message": "Sentiment scores stored successfully"}
     
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error storing sentiment scores: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error storing sentiment scores: {str(e)}")
+
+# Limits of the sentiment_scores columns: label VARCHAR(50), score NUMERIC(3,1)
+MAX_LABEL_LENGTH = 50
+MAX_SCORE = 99.9
+
+def chat_sentiment_problem(item: ChatSentimentData):
+    """Why an item's scores can't be stored, or None if they can"""
+    for label, score in item.sentiments.items():
+        if not label or len(label) > MAX_LABEL_LENGTH:
+            return f"Label must be 1 to {MAX_LABEL_LENGTH} characters: {label[:60]!r}"
+        if not math.isfinite(score) or abs(score) > MAX_SCORE:
+            return f"Score of {label!r} out of range: {score}"
+    return None
+
+@app.post("/sentiment/chat/batch")
+def store_chat_sentiment_batch(data: ChatSentimentBatch, db: Session = Depends(get_db)):
+    """
+    Store sentiment scores for several chat messages in one transaction.
+    Called by the chatbot service's outbox, which may deliver a message more
+    than once: scores already stored for a message are replaced.
+    Items that can never be stored are rejected without failing the rest;
+    `results` holds the status of each item, in order.
+    """
+    results = []
+    for item in data.items:
+        problem = chat_sentiment_problem(item)
+        if problem:
+            results.append({"chat_message_id": item.chat_message_id, "status": "rejected", "detail": problem})
+        else:
+            results.append({"chat_message_id": item.chat_message_id, "status": "stored"})
+    items = [item for item, result in zip(data.items, results) if result["status"] == "stored"]
+    
+    try:
+        user_ids = {item.user_id for item in items}
+        existing = {row[0] for row in db.query(User.id).filter(User.id.in_(user_ids)).all()}
+        for user_id in user_ids - existing:
+            db.add(User(id=user_id, email=f"user_{user_id}@placeholder.com"))
+        db.flush()
+        
+        message_ids = [item.chat_message_id for item in items]
+        db.query(SentimentScore).filter(
+            SentimentScore.chat_message_id.in_(message_ids)
+        ).delete(synchronize_session=False)
+        
+        db.add_all([
+            SentimentScore(
+                user_id=item.user_id,
+                chat_message_id=item.chat_message_id,
+                score=score,
+                label=label
+            )
+            for item in items
+            for label, score in item.sentiments.items()
+        ])
+        db.commit()
+        
+        return {"message": "Sentiment scores stored successfully", "stored": len(items), "results": results}
+    
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error storing sentiment scores: {str(e)}")
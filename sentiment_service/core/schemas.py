@@ -31,4 +31,7 @@ class ChatSentimentData(BaseModel):
     user_id: int
     chat_message_id: int
     sentiments: Dict[str, float]
-    language: Optional[str] = "en"
\ No newline at end of file
+    language: Optional[str] = "en"
+
+class ChatSentimentBatch(BaseModel):
+    items: List[ChatSentimentData]
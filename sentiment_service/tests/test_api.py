@@ -64,6 +64,39 @@ def test_store_chat_sentiment(test_db):
     assert len(scores) == 3  # Happy, Sad, Anxious
     db.close()
 
+def test_store_chat_sentiment_batch(test_db):
+    items = [
+        {"user_id": 1, "chat_message_id": 1, "sentiments": {"Happy": 0.4, "Sad": 0.3}, "language": "en"},
+        {"user_id": 2, "chat_message_id": 2, "sentiments": {"Anxious": 0.6}, "language": "en"},
+    ]
+    
+    response = client.post("/sentiment/chat/batch", json={"items": items})
+    # Redelivered entries replace the scores stored before
+    client.post("/sentiment/chat/batch", json={"items": items[:1]})
+    
+    assert response.status_code == 200
+    assert response.json()["stored"] == 2
+    db = TestingSessionLocal()
+    assert sorted((s.chat_message_id, s.label) for s in db.query(SentimentScore).all()) == [
+        (1, "Happy"), (1, "Sad"), (2, "Anxious")
+    ]
+    assert db.query(User).count() == 2
+    db.close()
+
+def test_store_chat_sentiment_batch_rejects_bad_items_only(test_db):
+    items = [
+        {"user_id": 1, "chat_message_id": 1, "sentiments": {"Happy": 0.4}},
+        {"user_id": 1, "chat_message_id": 2, "sentiments": {"x" * 51: 0.6}},
+    ]
+    
+    response = client.post("/sentiment/chat/batch", json={"items": items})
+    
+    assert response.status_code == 200
+    assert [result["status"] for result in response.json()["results"]] == ["stored", "rejected"]
+    db = TestingSessionLocal()
+    assert [(s.chat_message_id, s.label) for s in db.query(SentimentScore).all()] == [(1, "Happy")]
+    db.close()
+
 def test_store_video_emotions(test_db):
     # Create test user
     db = TestingSessionLocal()
@@ -104,5 +137,18 @@ def test_store_video_emotions(test_db):
             assert emotion.percentage == (5 / total) * 100
         elif emotion.emotion == "neutral":
             assert emotion.percentage == (20 / total) * 100
+
+    db.close()
+
+
+def test_metrics_record_requests(test_db):
+    client.post("/sentiment/chat", json={
+        "user_id": 1,
+        "chat_message_id": 1,
+        "sentiments": {"Happy": 0.4},
+        "language": "en"
+    })
     
-    db.close()
\ No newline at end of file
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert 'http_requests_total{method="POST",route="/sentiment/chat",status="200"}' in response.text
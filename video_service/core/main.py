@@ -4,11 +4,13 @@ import uuid
 import cv2
 import numpy as np
 from typing import Dict, List, Optional
-from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks
+from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks, Depends
 from pydantic import BaseModel
 import httpx
 import logging
 from .utils import process_video_frames, analyze_emotions
+from .metrics import instrument_app, track_dependency
+from .deadline import Deadline, DeadlineExceeded, install_deadlines, request_deadline
 from .schemas import EmotionAnalysisResult, VideoAnalysisRequest, VideoAnalysisResponse
 
 # Set up logging
@@ -17,6 +19,8 @@ logger = logging.getLogger(__name__)
 
 # Initialize FastAPI app
 app = FastAPI()
+instrument_app(app)
+install_deadlines(app)
 
 # Environment variables
 SENTIMENT_SERVICE_URL = os.getenv("SENTIMENT_SERVICE_URL", "http://sentiment-service:8002")
@@ -30,11 +34,14 @@ async def analyze_video(
     background_tasks: BackgroundTasks,
     user_id: int,
     file: UploadFile = File(...),
-    frame_sample_rate: int = 10  # Process every Nth frame
+    frame_sample_rate: int = 10,  # Process every Nth frame
+    deadline: Deadline = Depends(request_deadline)
 ):
     """
     Analyze emotions in a video file and send results to sentiment service.
     The analysis runs in the background while immediately returning a response.
+    If the request's deadline passed while the upload was being received,
+    nobody is waiting for the video id anymore and no analysis is scheduled.
     """
     if not file.filename or not file.filename.lower().endswith(('.mp4', '.avi', '.mov', '.mkv')):
         raise HTTPException(status_code=400, detail="Unsupported file format. Please upload MP4, AVI, MOV, or MKV.")
@@ -51,6 +58,12 @@ async def analyze_video(
         
         logger.info(f"Video saved to temporary file: {temp_file_path}")
         
+        try:
+            deadline.check("scheduling the analysis")
+        except DeadlineExceeded:
+            os.unlink(temp_file_path)
+            raise
+        
         # Schedule the video processing in the background
         background_tasks.add_task(
             process_video_in_background,
@@ -67,6 +80,9 @@ async def analyze_video(
             status="processing"
         )
         
+    except DeadlineExceeded as e:
+        logger.warning(f"Abandoning video upload for user {user_id}: {e}")
+        raise
     except Exception as e:
         logger.error(f"Error processing video: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing video: {str(e)}")
@@ -88,14 +104,15 @@ async def process_video_in_background(
         
         # Send results to sentiment service
         async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{SENTIMENT_SERVICE_URL}/sentiment/video",
-                json={
-                    "user_id": user_id,
-                    "video_id": video_id,
-                    "emotions": emotion_results
-                }
-            )
+            with track_dependency("sentiment", "store_video"):
+                response = await client.post(
+                    f"{SENTIMENT_SERVICE_URL}/sentiment/video",
+                    json={
+                        "user_id": user_id,
+                        "video_id": video_id,
+                        "emotions": emotion_results
+                    }
+                )
             
             # Check if the request was successful
             if response.status_code != 200:
@@ -6,6 +6,8 @@ from deepface import DeepFace
 import tempfile
 import os
 
+from .metrics import track_dependency
+
 logger = logging.getLogger(__name__)
 
 def process_video_frames(video_path: str, sample_rate: int = 10) -> List[np.ndarray]:
@@ -79,12 +81,13 @@ def analyze_emotions(frames: List[np.ndarray]) -> Dict[str, int]:
                 cv2.imwrite(temp_file_path, frame)
             
             # Analyze with DeepFace
-            results = DeepFace.analyze(
-                img_path=temp_file_path,
-                actions=['emotion'],
-                enforce_detection=False,
-                detector_backend='opencv'
-            )
+            with track_dependency("deepface", "analyze"):
+                results = DeepFace.analyze(
+                    img_path=temp_file_path,
+                    actions=['emotion'],
+                    enforce_detection=False,
+                    detector_backend='opencv'
+                )
             
             # DeepFace may return a list or a single result
             if isinstance(results, list):
@@ -37,4 +37,19 @@ def test_analyze_video(mock_background_tasks, mock_named_temp_file):
     assert "video_id" in response.json()
     
     # Verify background task was added
-    assert mock_background_tasks.add_task.called
\ No newline at end of file
+    assert mock_background_tasks.add_task.called
+
+
+@patch("core.main.process_video_in_background")
+def test_analyze_video_past_deadline(mock_process_video):
+    dummy_video = io.BytesIO(b"dummy video content")
+    
+    response = client.post(
+        "/video/analyze?user_id=1",
+        files={"file": ("test.mp4", dummy_video, "video/mp4")},
+        headers={"X-Request-Timeout": "0"}
+    )
+    
+    # The upload outlived the client, so no analysis is started
+    assert response.status_code == 504
+    mock_process_video.assert_not_called()
@@ -1,17 +1,23 @@
 import os
 import tempfile
 from typing import Optional
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Depends
 from pydantic import BaseModel
 import httpx
 from faster_whisper import WhisperModel
 import soundfile as sf
 
+from .metrics import instrument_app, track_dependency
+from .deadline import Deadline, DeadlineExceeded, install_deadlines, request_deadline
+
 # Initialize FastAPI app
 app = FastAPI()
+instrument_app(app)
+install_deadlines(app)
 
 # Environment variables
 CHATBOT_SERVICE_URL = os.getenv("CHATBOT_SERVICE_URL", "http://chatbot-service:8001")
+CHATBOT_TIMEOUT = float(os.getenv("CHATBOT_TIMEOUT", "30.0"))
 
 # Initialize the Whisper model (small model for faster inference and less memory usage)
 # The model will be downloaded on first use
@@ -31,8 +37,11 @@ def read_root():
     return {"message": "Voice Service is running"}
 
 @app.post("/voice/transcribe", response_model=TranscriptionResponse)
-async def transcribe_audio(file: UploadFile = File(...)):
-    """Transcribe uploaded audio file to text using Whisper"""
+async def transcribe_audio(file: UploadFile = File(...), deadline: Deadline = Depends(request_deadline)):
+    """
+    Transcribe uploaded audio file to text using Whisper.
+    Transcription stops with a 504 once the request's deadline has passed.
+    """
     if model is None:
         raise HTTPException(status_code=500, detail="Whisper model not initialized")
     
@@ -49,43 +58,62 @@ async def transcribe_audio(file: UploadFile = File(...)):
         
         # Transcribe the audio
         print("Starting transcription...")
-        segments, info = model.transcribe(temp_file_path, beam_size=5)
-        
-        # Get the transcribed text
-        transcription = " ".join([segment.text for segment in segments])
+        try:
+            deadline.check("transcription")
+            # Segments are decoded lazily, so the join is part of the model time
+            # and the deadline can be checked between segments
+            with track_dependency("whisper", "transcribe"):
+                segments, info = model.transcribe(temp_file_path, beam_size=5)
+                
+                # Get the transcribed text
+                texts = []
+                for segment in segments:
+                    deadline.check("the rest of the transcription")
+                    texts.append(segment.text)
+                transcription = " ".join(texts)
+        finally:
+            # Clean up the temporary file
+            os.unlink(temp_file_path)
         language = info.language
         
         print(f"Transcription complete: '{transcription}' (Language: {language})")
         
-        # Clean up the temporary file
-        os.unlink(temp_file_path)
-        
         return TranscriptionResponse(text=transcription, language=language)
     
+    except DeadlineExceeded as e:
+        print(f"Abandoning transcription: {e}")
+        raise
     except Exception as e:
         print(f"Error during transcription: {e}")
         raise HTTPException(status_code=500, detail=f"Transcription error: {str(e)}")
 
 @app.post("/voice/chat/{user_id}")
-async def process_voice_message(user_id: int, file: UploadFile = File(...)):
-    """Process voice message - transcribe and send to chatbot service"""
+async def process_voice_message(user_id: int, file: UploadFile = File(...), deadline: Deadline = Depends(request_deadline)):
+    """
+    Process voice message - transcribe and send to chatbot service.
+    The chatbot gets whatever is left of the request's deadline.
+    """
     try:
         # Step 1: Transcribe the audio
-        transcription_response = await transcribe_audio(file)
+        transcription_response = await transcribe_audio(file, deadline)
         transcribed_text = transcription_response.text
         
         print(f"Transcribed text: {transcribed_text}")
         
         # Step 2: Send the transcribed text to chatbot service
+        deadline.check("sending the transcription to the chatbot")
         async with httpx.AsyncClient() as client:
-            chatbot_response = await client.post(
-                f"{CHATBOT_SERVICE_URL}/chat/message",
-                json={
-                    "user_id": user_id,
-                    "message": transcribed_text,
-                    "language": transcription_response.language or "en"
-                }
-            )
+            with track_dependency("chatbot", "message"):
+                chatbot_response = await client.post(
+                    f"{CHATBOT_SERVICE_URL}/chat/message",
+                    json={
+                        "user_id": user_id,
+                        "message": transcribed_text,
+                        "language": transcription_response.language or "en"
+                    },
+                    headers=deadline.headers(),
+                    timeout=deadline.timeout(CHATBOT_TIMEOUT)
+                )
             
             # Check if the request was successful
             if chatbot_response.status_code != 200:
@@ -100,6 +128,12 @@ async def process_voice_message(user_id: int, file: UploadFile = File(...)):
             
             return chatbot_data
     
+    except DeadlineExceeded as e:
+        print(f"Abandoning voice message for user {user_id}: {e}")
+        raise
+    except httpx.TimeoutException as e:
+        print(f"Chatbot did not answer before the deadline: {e}")
+        raise HTTPException(status_code=504, detail="Chatbot service timed out")
     except Exception as e:
         print(f"Error processing voice message: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing voice message: {str(e)}")
\ No newline at end of file
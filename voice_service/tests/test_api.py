@@ -67,4 +67,21 @@ def test_process_voice_message(mock_model, mock_httpx, tmp_path):
     # Verify response
     assert response.status_code == 200
     assert response.json()["bot_message"] == "Hi there!"
-    assert response.json()["transcribed_text"] == "Hello world"
\ No newline at end of file
+    assert response.json()["transcribed_text"] == "Hello world"
+
+
+@patch("core.main.httpx.AsyncClient")
+@patch("core.main.model")
+def test_process_voice_message_past_deadline(mock_model, mock_httpx):
+    dummy_audio = io.BytesIO(b"dummy audio content")
+    
+    response = client.post(
+        "/voice/chat/1",
+        files={"file": ("test.wav", dummy_audio, "audio/wav")},
+        headers={"X-Request-Timeout": "0"}
+    )
+    
+    # Neither the model nor the chatbot is bothered once the deadline has passed
+    assert response.status_code == 504
+    mock_model.transcribe.assert_not_called()
+    mock_httpx.assert_not_called()